@@ -0,0 +1,228 @@
+# ----------------------------------------------------------------------------#
+# Show analytics.
+#
+# Show counts by area, genre (of the artist), venue and artist are kept per month in rollup tables. `flask
+# analytics-refresh`, run from cron, adds the shows created since the watermark to them in small transactions, so
+# the rollups are refreshed without locking anything the site reads. /analytics only reads the rollups: reporting
+# never scans Show, Venue or Artist. Renames and deletes reach the venue and artist rollups through a background
+# thread, after the response to the edit.
+# ----------------------------------------------------------------------------#
+
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from flask import current_app, render_template, request
+from sqlalchemy.dialects import postgresql
+
+from models import db, Venue, Artist, Show, ShowArchive, ShowsByArea, ShowsByGenre, ShowsByVenue, ShowsByArtist, \
+    AnalyticsWatermark
+from signals import entity_changed
+
+WATERMARK = 'shows'
+ENTITY_ROLLUPS = {'venue': (Venue, ShowsByVenue, 'venue_id'), 'artist': (Artist, ShowsByArtist, 'artist_id')}
+sync_lock = threading.Lock()
+
+
+def month_of(value):
+    return date(value.year, value.month, 1)
+
+
+def get_watermark():
+    watermark = AnalyticsWatermark.query.get(WATERMARK)
+    if watermark is None:
+        db.session.add(AnalyticsWatermark(name=WATERMARK))
+        db.session.commit()
+        watermark = AnalyticsWatermark.query.get(WATERMARK)
+    return watermark
+
+
+def max_show_id():
+    return max(db.session.query(db.func.max(Show.id)).scalar() or 0,
+               db.session.query(db.func.max(ShowArchive.id)).scalar() or 0)
+
+
+# Shows with an id in (after_id, up_to_id], from Show and from the archive since the archive job may already have
+# moved them. A show whose venue or artist was deleted is returned without them and not counted
+def new_shows(after_id, up_to_id, limit):
+    columns = ('id', 'venue_id', 'artist_id', 'start_time')
+    shows = db.session.query(*(getattr(Show, c).label(c) for c in columns))\
+        .filter(Show.id > after_id).filter(Show.id <= up_to_id)\
+        .union_all(db.session.query(*(getattr(ShowArchive, c).label(c) for c in columns))
+                   .filter(ShowArchive.id > after_id).filter(ShowArchive.id <= up_to_id)).subquery()
+    return db.session.query(shows.c.id, shows.c.start_time, shows.c.venue_id, Venue.name.label('venue_name'),
+                            Venue.city, Venue.state, shows.c.artist_id, Artist.name.label('artist_name'),
+                            Artist.genres)\
+        .outerjoin(Venue, db.and_(Venue.id == shows.c.venue_id, Venue.deleted_at.is_(None)))\
+        .outerjoin(Artist, db.and_(Artist.id == shows.c.artist_id, Artist.deleted_at.is_(None)))\
+        .order_by(shows.c.id).limit(limit).all()
+
+
+def aggregate(shows):
+    areas, genres, venues, artists, names = Counter(), Counter(), Counter(), Counter(), {}
+    for show in shows:
+        if show.venue_name is None or show.artist_name is None:
+            continue
+        month = month_of(show.start_time)
+        areas[(month, show.city, show.state)] += 1
+        for genre in {genre for genre in show.genres.split(',') if genre}:
+            genres[(month, genre)] += 1
+        venues[(month, show.venue_id)] += 1
+        artists[(month, show.artist_id)] += 1
+        names[('venue', show.venue_id)] = show.venue_name
+        names[('artist', show.artist_id)] = show.artist_name
+    return [
+        (ShowsByArea, ('month', 'city', 'state'), areas, lambda key: {}),
+        (ShowsByGenre, ('month', 'genre'), genres, lambda key: {}),
+        (ShowsByVenue, ('month', 'venue_id'), venues, lambda key: {'name': names[('venue', key[1])]}),
+        (ShowsByArtist, ('month', 'artist_id'), artists, lambda key: {'name': names[('artist', key[1])]}),
+    ]
+
+
+# Adds the counts to the rollup rows, one INSERT ... ON CONFLICT per table on Postgres and an UPDATE, then an INSERT
+# when no row was updated, elsewhere. Only one refresh writes at a time, see refresh()
+def increment(model, key_columns, counts, extra):
+    if not counts:
+        return
+    table = model.__table__
+    rows = [dict(zip(key_columns, key), shows=count, **extra(key)) for key, count in counts.items()]
+    if db.engine.dialect.name == 'postgresql':
+        statement = postgresql.insert(table).values(rows)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_=dict({column: statement.excluded[column] for column in rows[0] if column not in key_columns},
+                      shows=table.c.shows + statement.excluded.shows)
+        ))
+        return
+    for row in rows:
+        condition = db.and_(*(table.c[column] == row[column] for column in key_columns))
+        values = {column: value for column, value in row.items() if column not in key_columns}
+        updated = db.session.execute(table.update().where(condition)
+                                     .values(values, shows=table.c.shows + row['shows'])).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(row))
+
+
+# Counts the shows between the watermark and the safe id, batch_size shows per transaction. Every transaction
+# moves the watermark with a compare-and-swap UPDATE first, so when two refreshes run at once the second one waits
+# for the first, finds the watermark moved and stops instead of counting the same shows twice
+def refresh(batch_size=None):
+    batch_size = batch_size or current_app.config['ANALYTICS_BATCH_SIZE']
+    settle = timedelta(seconds=current_app.config['ANALYTICS_SETTLE_SECONDS'])
+    counted = 0
+    watermark = get_watermark()
+    now = datetime.utcnow()
+    progress = {}
+    if watermark.horizon_seen_at is None or now - watermark.horizon_seen_at >= settle:
+        progress = dict(safe_show_id=max(watermark.horizon_show_id, watermark.safe_show_id),
+                        horizon_show_id=max_show_id(), horizon_seen_at=now)
+    last_show_id = watermark.last_show_id
+    safe_show_id = progress.get('safe_show_id', watermark.safe_show_id)
+    db.session.rollback()
+    while True:
+        shows = new_shows(last_show_id, safe_show_id, batch_size)
+        next_show_id = shows[-1].id if len(shows) == batch_size else safe_show_id
+        if next_show_id <= last_show_id and not progress:
+            break
+        claimed = AnalyticsWatermark.query.filter_by(name=WATERMARK, last_show_id=last_show_id)\
+            .update(dict(progress, last_show_id=max(next_show_id, last_show_id), refreshed_at=datetime.utcnow()),
+                    synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            break
+        for model, key_columns, counts, extra in aggregate(shows):
+            increment(model, key_columns, counts, extra)
+        db.session.commit()
+        counted += len(shows)
+        last_show_id, progress = max(next_show_id, last_show_id), {}
+        if last_show_id >= safe_show_id:
+            break
+    db.session.close()
+    return counted
+
+
+# Keeps the copied names in step with renames and drops deleted venues and artists from the top lists. Their shows
+# stay counted in the area and genre rollups
+def sync_entity(kind, entity_id):
+    model, rollup, fk_name = ENTITY_ROLLUPS[kind]
+    entity = model.query.with_entities(model.name).filter_by(id=entity_id, deleted_at=None).first()
+    rows = rollup.query.filter(getattr(rollup, fk_name) == entity_id)
+    if entity is None:
+        rows.delete(synchronize_session=False)
+    else:
+        rows.update({'name': entity.name}, synchronize_session=False)
+    db.session.commit()
+
+
+# Adds the monthly counts of `from_id` to the rows of `to_id` and deletes them, in the caller's transaction: the
+# shows of a merged duplicate stay counted, under the entity they were moved to
+def move_counts(kind, from_id, to_id, to_name):
+    model, rollup, fk_name = ENTITY_ROLLUPS[kind]
+    fk = getattr(rollup, fk_name)
+    moved = dict(db.session.query(rollup.month, rollup.shows).filter(fk == from_id).all())
+    existing = {row.month for row in db.session.query(rollup.month).filter(fk == to_id)
+                .filter(rollup.month.in_(list(moved))).all()} if moved else set()
+    for month, shows in moved.items():
+        if month in existing:
+            rollup.query.filter(fk == to_id, rollup.month == month)\
+                .update({'shows': rollup.shows + shows}, synchronize_session=False)
+        else:
+            db.session.add(rollup(month=month, name=to_name, shows=shows, **{fk_name: to_id}))
+    rollup.query.filter(fk == from_id).delete(synchronize_session=False)
+
+
+def run_sync(app, kind, entity_id):
+    with app.app_context(), sync_lock:
+        try:
+            sync_entity(kind, int(entity_id))
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Could not update the analytics of %s %s', kind, entity_id)
+        finally:
+            db.session.close()
+
+
+# Syncs in a daemon thread with its own session, so that the request keeps its session and doesn't wait for it
+def on_entity_changed(app, kind, entity_id, fields):
+    if fields is None or 'name' in fields:
+        threading.Thread(target=run_sync, args=(app, kind, entity_id), daemon=True).start()
+
+
+def totals(model, group_by, since, limit=None):
+    query = db.session.query(*group_by, db.func.sum(model.shows).label('shows'))\
+        .filter(model.month >= since).group_by(*group_by)
+    if limit:
+        query = query.order_by(db.func.sum(model.shows).desc()).limit(limit)
+    return query.all()
+
+
+def dashboard():
+    months = min(max(request.args.get('months', 12, type=int), 1), 120)
+    today = date.today()
+    first_month = today.year * 12 + today.month - months
+    since = date(first_month // 12, first_month % 12 + 1, 1)
+    limit = current_app.config['ANALYTICS_TOP_N']
+    data = {
+        'months': months,
+        'since': since,
+        'refreshed_at': get_watermark().refreshed_at,
+        'by_month': totals(ShowsByArea, (ShowsByArea.month,), since),
+        'by_area': totals(ShowsByArea, (ShowsByArea.city, ShowsByArea.state), since, limit),
+        'by_genre': totals(ShowsByGenre, (ShowsByGenre.genre,), since, limit),
+        'top_venues': totals(ShowsByVenue, (ShowsByVenue.venue_id, ShowsByVenue.name), since, limit),
+        'top_artists': totals(ShowsByArtist, (ShowsByArtist.artist_id, ShowsByArtist.name), since, limit),
+    }
+    data['by_month'].sort()
+    return render_template('pages/analytics.html', analytics=data)
+
+
+def init_app(app):
+    app.config.setdefault('ANALYTICS_BATCH_SIZE', 5000)
+    app.config.setdefault('ANALYTICS_SETTLE_SECONDS', 60)
+    app.config.setdefault('ANALYTICS_TOP_N', 10)
+    entity_changed.connect(on_entity_changed, app)
+    app.add_url_rule('/analytics', 'analytics', dashboard)
+
+    @app.cli.command('analytics-refresh')
+    def analytics_refresh_command():
+        print(f'Counted {refresh()} new shows')
@@ -0,0 +1,162 @@
+# ----------------------------------------------------------------------------#
+# Static asset bundles.
+#
+# `flask assets-build` concatenates and minifies the files of each bundle, names the result after a hash of its
+# content and precompresses it, e.g. static/dist/main.3f2a9c1d0b7e.css (+ .gz and .br). Templates link bundles with
+# {{ asset_url('main.css') }} and the fingerprinted files are served with far-future immutable caching.
+# ----------------------------------------------------------------------------#
+
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # Deferred, runs after jQuery which is still loaded from the CDN
+    'site.js': [
+        'js/script.js',
+        'js/btns.js',
+        'js/autocomplete.js',
+        'js/events.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+DIST_FOLDER = 'dist'
+MANIFEST = 'manifest.json'
+MIMETYPES = {'.css': 'text/css', '.js': 'application/javascript'}
+
+manifest = {}
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+# Only whole line comments and indentation are stripped, which is safe without parsing the script
+def minify_js(source):
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def build_bundle(static_folder, files):
+    parts = []
+    for filename in files:
+        with open(os.path.join(static_folder, filename), encoding='utf-8') as f:
+            source = f.read()
+        if '.min.' not in filename:
+            source = minify_css(source) if filename.endswith('.css') else minify_js(source)
+        parts.append(source)
+    return '\n;\n'.join(parts) if files[0].endswith('.js') else '\n'.join(parts)
+
+
+def build(static_folder):
+    dist = os.path.join(static_folder, DIST_FOLDER)
+    os.makedirs(dist, exist_ok=True)
+    built = {}
+    for bundle, files in BUNDLES.items():
+        content = build_bundle(static_folder, files).encode('utf-8')
+        name, ext = os.path.splitext(bundle)
+        filename = f'{name}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+        path = os.path.join(dist, filename)
+        with open(path, 'wb') as f:
+            f.write(content)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+        built[bundle] = filename
+    # Files of previous builds are kept so that pages cached by clients can still load them
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(built, f, indent=2, sort_keys=True)
+    return built
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_FOLDER, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def sources_changed(static_folder):
+    dist = os.path.join(static_folder, DIST_FOLDER)
+    for bundle, files in BUNDLES.items():
+        built = os.path.join(dist, manifest.get(bundle, ''))
+        if not os.path.isfile(built):
+            return True
+        built_at = os.path.getmtime(built)
+        if any(os.path.getmtime(os.path.join(static_folder, filename)) > built_at for filename in files):
+            return True
+    return False
+
+
+def asset_url(bundle):
+    if current_app.debug and sources_changed(current_app.static_folder):
+        manifest.update(build(current_app.static_folder))
+    return url_for('static', filename=f'{DIST_FOLDER}/{manifest[bundle]}')
+
+
+# Serves a fingerprinted bundle, precompressed when the client accepts it. The name changes with the content,
+# so the file can be cached forever
+def send_asset(filename):
+    directory = os.path.join(current_app.static_folder, DIST_FOLDER)
+    accepted = request.accept_encodings
+    mimetype = MIMETYPES.get(os.path.splitext(filename)[1])
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] and os.path.isfile(os.path.join(directory, filename + suffix)):
+            encoding = candidate
+            filename += suffix
+            break
+    response = send_from_directory(directory, filename, mimetype=mimetype,
+                                   cache_timeout=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['ASSETS_MAX_AGE']}, immutable"
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+    manifest.update(load_manifest(app.static_folder))
+    if not manifest:
+        manifest.update(build(app.static_folder))
+    app.add_url_rule(f'{app.static_url_path}/{DIST_FOLDER}/<path:filename>', 'asset', send_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.cli.command('assets-build')
+    def assets_build_command():
+        for bundle, filename in build(app.static_folder).items():
+            print(f'{bundle} -> {DIST_FOLDER}/{filename}')
@@ -0,0 +1,314 @@
+# ----------------------------------------------------------------------------#
+# Typeahead autocomplete.
+#
+# Each worker keeps a sorted index of the words of every venue and artist name in memory and answers
+# /api/autocomplete?kind=&q= from it with bisect, ranking every match by number of shows. Prefixes matching more than
+# AUTOCOMPLETE_CACHE_MIN_KEYS keys keep their ranking, which edits update in place. The database is only read when
+# the index is built and when an entity changes: an updater thread of the worker that commits the change updates its
+# own index after the response and, on Postgres, publishes a NOTIFY that the listener thread of every other worker
+# picks up. Elsewhere the other workers rebuild their index every AUTOCOMPLETE_REBUILD_SECONDS if the tables changed.
+# ----------------------------------------------------------------------------#
+
+import bisect
+import heapq
+import json
+import os
+import queue
+import re
+import select
+import threading
+import time
+
+from flask import abort, current_app, jsonify, request
+
+from models import db, Venue, Artist, Show, ShowArchive
+from signals import entity_changed
+
+CHANNEL = 'autocomplete'
+KINDS = ('venue', 'artist')
+# Fields shown or used for ranking in the suggestions
+INDEXED_FIELDS = {'name', 'city', 'state', 'shows'}
+MAX_LIMIT = 50
+# Length of the cached rankings: the slack lets them lose entities to edits before they must be computed again
+RANKED = 2 * MAX_LIMIT
+
+MODELS = {'venue': Venue, 'artist': Artist}
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', text.strip().lower())
+
+
+# Order of the suggestions: names starting with the query first, then names with a later word starting with it, then
+# by popularity
+def rank(prefix, entity):
+    return not normalize(entity['name']).startswith(prefix), -entity['shows'], entity['name'], entity['id']
+
+
+# Best `size` entities among the keys[start:end] that start with `prefix`, as (rank, id) pairs
+def ranking(keys, entities, prefix, start, end, size):
+    ids = {entity_id for key, entity_id in keys[start:end]}
+    return heapq.nsmallest(size, ((rank(prefix, entities[entity_id]), entity_id) for entity_id in ids))
+
+
+def key_range(keys, prefix):
+    return bisect.bisect_left(keys, (prefix,)), bisect.bisect_left(keys, (prefix + '\U0010ffff',))
+
+
+class PrefixIndex:
+    def __init__(self, cache_min_keys):
+        self.keys = []
+        self.entities = {}
+        # Best RANKED entities of the prefixes matching more than cache_min_keys keys, e.g. single letters. A ranking
+        # may get shorter with edits, but always holds the best entities of its prefix
+        self.top = {}
+        self.cache_min_keys = cache_min_keys
+        self.lock = threading.Lock()
+
+    # Every word of the name is a key, so 'note' finds 'The Blue Note'
+    @staticmethod
+    def entity_keys(entity_id, name):
+        words = normalize(name).split(' ')
+        return [(' '.join(words[i:]), entity_id) for i in range(len(words))]
+
+    # The rankings of the one and two letter prefixes are computed with the keys, before searches use them
+    def load(self, entities):
+        keys = []
+        for entity in entities.values():
+            keys.extend(self.entity_keys(entity['id'], entity['name']))
+        keys.sort()
+        top = {}
+        for prefix in {key[:end] for key, entity_id in keys for end in (1, 2)}:
+            start, end = key_range(keys, prefix)
+            if end - start > self.cache_min_keys:
+                ranked = ranking(keys, entities, prefix, start, end, RANKED)
+                if len(ranked) == RANKED:
+                    top[prefix] = ranked
+        with self.lock:
+            self.keys, self.entities, self.top = keys, entities, top
+
+    def upsert(self, entity):
+        with self.lock:
+            old_keys = self.remove_keys(entity['id'])
+            new_keys = self.entity_keys(entity['id'], entity['name'])
+            for key in new_keys:
+                bisect.insort(self.keys, key)
+            self.entities[entity['id']] = entity
+            self.rerank(entity['id'], old_keys + new_keys, new_keys)
+
+    def remove(self, entity_id):
+        with self.lock:
+            self.rerank(entity_id, self.remove_keys(entity_id), [])
+            self.entities.pop(entity_id, None)
+
+    def remove_keys(self, entity_id):
+        entity = self.entities.get(entity_id)
+        if entity is None:
+            return []
+        keys = self.entity_keys(entity_id, entity['name'])
+        for key in keys:
+            position = bisect.bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position] == key:
+                del self.keys[position]
+        return keys
+
+    # Moves an entity in the cached rankings of the prefixes of `keys`, its keys before and after the change, given
+    # its `current` keys (none once removed). It is only put back in a ranking it now beats the end of: past the end,
+    # entities the ranking doesn't hold may come before it. A ranking left shorter than MAX_LIMIT is computed again by
+    # the next search
+    def rerank(self, changed_id, keys, current):
+        for prefix in {key[:end] for key, entity_id in keys for end in range(1, len(key) + 1)}:
+            ranked = self.top.get(prefix)
+            if ranked is None:
+                continue
+            ranked = [match for match in ranked if match[1] != changed_id]
+            if ranked and any(key.startswith(prefix) for key, entity_id in current):
+                match = (rank(prefix, self.entities[changed_id]), changed_id)
+                if match < ranked[-1]:
+                    bisect.insort(ranked, match)
+            if len(ranked) < MAX_LIMIT:
+                del self.top[prefix]
+            else:
+                self.top[prefix] = ranked[:RANKED]
+
+    # Prefixes matching few keys are ranked on every search, the others once until their ranking changes
+    def search(self, query, limit):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self.lock:
+            ranked = self.top.get(prefix)
+            if ranked is None:
+                start, end = key_range(self.keys, prefix)
+                ranked = ranking(self.keys, self.entities, prefix, start, end, RANKED)
+                if end - start > self.cache_min_keys and len(ranked) == RANKED:
+                    self.top[prefix] = ranked
+            return [self.entities[entity_id] for _, entity_id in ranked[:limit]]
+
+
+indexes = {}
+indexes_lock = threading.Lock()
+built_from = None
+pending = queue.Queue()
+updater_pid = None
+updater_lock = threading.Lock()
+
+
+def show_counts(fk_name, entity_id=None):
+    counts = {}
+    for show_model in (Show, ShowArchive):
+        fk = getattr(show_model, fk_name)
+        query = db.session.query(fk, db.func.count()).group_by(fk)
+        if entity_id is not None:
+            query = query.filter(fk == entity_id)
+        for key, count in query.all():
+            counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+def load_entities(kind, entity_id=None):
+    model = MODELS[kind]
+    query = model.query.with_entities(model.id, model.name, model.city, model.state)\
+        .filter(model.deleted_at.is_(None))
+    if entity_id is not None:
+        query = query.filter(model.id == entity_id)
+    counts = show_counts(f'{kind}_id', entity_id)
+    return {row.id: dict(id=row.id, name=row.name, city=row.city, state=row.state, shows=counts.get(row.id, 0))
+            for row in query.all()}
+
+
+# Changes when a venue or an artist is added, edited or deleted, or a show is added. Reading it costs a scan of the
+# Venue and Artist rows, far less than building the indexes again
+def fingerprint():
+    values = [db.session.query(db.func.max(Show.id)).scalar()]
+    for model in MODELS.values():
+        values.extend(model.query.filter(model.deleted_at.is_(None))
+                      .with_entities(db.func.count(), db.func.max(model.id), db.func.sum(model.version)).one())
+    return values
+
+
+def build_indexes():
+    global built_from
+    # Read first: a change committed while the indexes load is caught by the next rebuild
+    built_from = fingerprint()
+    for kind in KINDS:
+        index = PrefixIndex(current_app.config['AUTOCOMPLETE_CACHE_MIN_KEYS'])
+        index.load(load_entities(kind))
+        indexes[kind] = index
+    db.session.close()
+
+
+def get_index(kind):
+    if not indexes:
+        with indexes_lock:
+            if not indexes:
+                build_indexes()
+                start_listener(current_app._get_current_object())
+    return indexes[kind]
+
+
+def apply_change(kind, entity_id):
+    if kind not in indexes:
+        return
+    entities = load_entities(kind, entity_id)
+    if entity_id in entities:
+        indexes[kind].upsert(entities[entity_id])
+    else:
+        indexes[kind].remove(entity_id)
+
+
+def changed(kind, entity_id):
+    entity_id = int(entity_id)
+    try:
+        apply_change(kind, entity_id)
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute('SELECT pg_notify(:channel, :payload)',
+                               {'channel': CHANNEL, 'payload': json.dumps([kind, entity_id])})
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Could not update the autocomplete index for %s %s', kind, entity_id)
+    finally:
+        db.session.close()
+
+
+# Changes are applied by one thread per worker, in the order they were committed, after the response is sent
+def update(app):
+    while True:
+        kind, entity_id = pending.get()
+        with app.app_context():
+            changed(kind, entity_id)
+
+
+def on_entity_changed(app, kind, entity_id, fields):
+    global updater_pid
+    if fields is None or fields & INDEXED_FIELDS:
+        if updater_pid != os.getpid():
+            with updater_lock:
+                if updater_pid != os.getpid():
+                    updater_pid = os.getpid()
+                    threading.Thread(target=update, args=(app,), daemon=True).start()
+        pending.put((kind, entity_id))
+
+
+def listen(app):
+    while True:
+        connection = None
+        try:
+            # The connection is detached from the pool, it stays open as long as the worker
+            connection = db.engine.raw_connection()
+            connection.detach()
+            raw = connection.connection
+            raw.autocommit = True
+            raw.cursor().execute(f'LISTEN {CHANNEL}')
+            while True:
+                if select.select([raw], [], [], 60) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    kind, entity_id = json.loads(raw.notifies.pop(0).payload)
+                    with app.app_context():
+                        apply_change(kind, entity_id)
+                        db.session.close()
+        except Exception:
+            app.logger.exception('Autocomplete listener failed, reconnecting')
+        finally:
+            # Detached, so this closes it rather than returning it to the pool
+            if connection is not None:
+                connection.close()
+        time.sleep(5)
+
+
+# Without NOTIFY, on SQLite, the changes committed by the other workers show up when the indexes are rebuilt, which
+# is skipped while nothing changed
+def rebuild(app):
+    while True:
+        time.sleep(app.config['AUTOCOMPLETE_REBUILD_SECONDS'])
+        try:
+            with app.app_context():
+                if fingerprint() != built_from:
+                    build_indexes()
+                db.session.close()
+        except Exception:
+            app.logger.exception('Could not rebuild the autocomplete indexes')
+
+
+def start_listener(app):
+    target = listen if db.engine.dialect.name == 'postgresql' else rebuild
+    threading.Thread(target=target, args=(app,), daemon=True).start()
+
+
+def autocomplete():
+    kind = request.args.get('kind', '')
+    if kind not in KINDS:
+        abort(400)
+    limit = min(request.args.get('limit', 10, type=int), MAX_LIMIT)
+    matches = get_index(kind).search(request.args.get('q', ''), limit)
+    return jsonify({'data': matches})
+
+
+def init_app(app):
+    app.config.setdefault('AUTOCOMPLETE_CACHE_MIN_KEYS', 500)
+    app.config.setdefault('AUTOCOMPLETE_REBUILD_SECONDS', 30)
+    entity_changed.connect(on_entity_changed, app)
+    app.add_url_rule('/api/autocomplete', 'autocomplete', autocomplete)
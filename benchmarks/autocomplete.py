@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------------#
+# Benchmark of /api/autocomplete.
+#
+# Seeds the database configured in config.py with --entities venues and as many artists, with made up names and
+# --shows shows, then times --requests autocomplete requests for random one to four letter prefixes, through the test
+# client so that the time includes Flask. Reports the median, p99 and worst time per prefix length, once on the index
+# as built and once while names and show counts change between requests.
+#
+# The tables are dropped and recreated, only run this against a scratch database:
+#     python benchmarks/autocomplete.py --entities 100000
+# ----------------------------------------------------------------------------#
+
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import autocomplete  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+
+SYLLABLES = ['ba', 'lu', 'no', 'te', 'ri', 'ka', 'mo', 'si', 'de', 'the', 'blue', 'red', 'jo', 'an', 'el']
+
+
+def made_up_name(rng):
+    return ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))).title()
+                    for _ in range(rng.randint(1, 3)))
+
+
+def seed(entities, shows, rng):
+    db.drop_all()
+    db.create_all()
+    for model, extra in ((Venue, dict(address='1 Main St')), (Artist, {})):
+        db.session.bulk_insert_mappings(model, [
+            dict(id=i, name=made_up_name(rng), city='San Francisco', state='CA', phone='555-0100', genres='Jazz',
+                 **extra) for i in range(1, entities + 1)
+        ])
+    now = datetime.utcnow()
+    # Skewed, so that a few names are much more popular than the others
+    db.session.bulk_insert_mappings(Show, [
+        dict(venue_id=int(entities ** rng.random()), artist_id=int(entities ** rng.random()),
+             start_time=now - timedelta(days=rng.randint(0, 3650))) for _ in range(shows)
+    ])
+    db.session.commit()
+
+
+def time_requests(client, requests, rng, edits=None):
+    timings = {length: [] for length in range(1, 5)}
+    for _ in range(requests):
+        if edits is not None:
+            edits()
+        length = rng.randint(1, 4)
+        query = ''.join(rng.choice(string.ascii_lowercase[:20]) for _ in range(length))
+        start = time.perf_counter()
+        response = client.get(f'/api/autocomplete?kind=venue&q={query}&limit=10')
+        timings[length].append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return timings
+
+
+def report(title, timings):
+    print(f'{title:<22}{"median ms":>12}{"p99 ms":>12}{"max ms":>12}')
+    for length, values in timings.items():
+        values.sort()
+        print(f'{f"{length} letters":<22}{statistics.median(values):>12.2f}'
+              f'{values[int(len(values) * 0.99) - 1]:>12.2f}{values[-1]:>12.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entities', type=int, default=100000)
+    parser.add_argument('--shows', type=int, default=500000)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    app = create_app({'RATELIMIT_ENABLED': False, 'COMPRESS_ENABLED': False})
+    client = app.test_client()
+    with app.app_context():
+        print(f'Seeding {args.entities} venues and artists, {args.shows} shows...')
+        seed(args.entities, args.shows, rng)
+        db.session.remove()
+        start = time.perf_counter()
+        index = autocomplete.get_index('venue')
+        print(f'Built the indexes in {time.perf_counter() - start:.1f}s')
+
+    client.get('/api/autocomplete?kind=venue&q=a')
+    report('index as built', time_requests(client, args.requests, rng))
+
+    # What the updater thread does after a show is added or a venue renamed, every tenth request
+    def edits():
+        if rng.random() < 0.1:
+            entity = dict(rng.choice(list(index.entities.values())))
+            entity['shows'] += 1
+            if rng.random() < 0.2:
+                entity['name'] = made_up_name(rng)
+            index.upsert(entity)
+    report('with edits', time_requests(client, args.requests, rng, edits))
+
+
+if __name__ == '__main__':
+    main()
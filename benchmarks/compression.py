@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------#
+# Benchmark of the response compression levels.
+#
+# Renders the largest pages once: the listings and the venue and artist with the most shows. Then compresses each
+# with every encoding and level of --levels and reports the bytes sent and the CPU time per response, both for the
+# whole body (buffered responses) and for the body cut in --chunk-size chunks, each flushed (streamed responses).
+#
+# Uses the database configured in config.py, which must have been migrated and filled:
+#     python benchmarks/compression.py --repeats 20
+# ----------------------------------------------------------------------------#
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEVELS = 'gzip:1,3,6,9;br:0,2,4,6,9,11;zstd:1,3,6,9,15,19'
+
+
+def largest_pages(app):
+    from models import db, Show
+    with app.app_context():
+        pages = ['/shows', '/venues', '/artists']
+        for fk_name, prefix in (('venue_id', '/venues'), ('artist_id', '/artists')):
+            column = getattr(Show, fk_name)
+            busiest = db.session.query(column).group_by(column).order_by(db.func.count().desc()).first()
+            if busiest:
+                pages.append(f'{prefix}/{busiest[0]}')
+        db.session.remove()
+    client = app.test_client()
+    bodies = {}
+    for page in pages:
+        response = client.get(page, headers={'Accept-Encoding': 'identity'})
+        assert response.status_code == 200, (page, response.status_code)
+        bodies[page] = response.get_data()
+    return bodies
+
+
+def cpu_time(function, repeats):
+    start = time.process_time()
+    for _ in range(repeats):
+        result = function()
+    return (time.process_time() - start) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--levels', default=LEVELS, help='encoding:level,... separated by ;')
+    parser.add_argument('--chunk-size', type=int, default=4096)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    import compress
+    app = create_app({'RATELIMIT_ENABLED': False, 'COMPRESS_ENABLED': False})
+    bodies = largest_pages(app)
+    encodings = compress.available_encodings(['gzip', 'br', 'zstd'])
+
+    for page, body in bodies.items():
+        chunks = [body[i:i + args.chunk_size] for i in range(0, len(body), args.chunk_size)]
+        print(f'\n{page}: {len(body) / 1024:.1f} KiB, {len(chunks)} chunks of {args.chunk_size} bytes')
+        print(f'{"":<10}{"KiB":>10}{"ratio":>8}{"CPU ms":>10}{"MB/s":>10}{"stream KiB":>12}{"stream ms":>11}')
+        for spec in args.levels.split(';'):
+            encoding, levels = spec.split(':')
+            if encoding not in encodings:
+                print(f'{encoding:<10}not installed')
+                continue
+            for level in map(int, levels.split(',')):
+                seconds, compressed = cpu_time(lambda: compress.compress(body, encoding, level), args.repeats)
+                stream_seconds, streamed = cpu_time(
+                    lambda: b''.join(compress.compress_stream(chunks, None, encoding, level)), args.repeats)
+                print(f'{f"{encoding} {level}":<10}{len(compressed) / 1024:>10.1f}'
+                      f'{len(body) / len(compressed):>8.1f}{seconds * 1000:>10.2f}'
+                      f'{len(body) / seconds / 1e6 if seconds else float("inf"):>10.0f}'
+                      f'{len(streamed) / 1024:>12.1f}{stream_seconds * 1000:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
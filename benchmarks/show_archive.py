@@ -0,0 +1,122 @@
+# ----------------------------------------------------------------------------#
+# Benchmark of the venue page with and without the show archive.
+#
+# Seeds the database configured in config.py with --shows shows (most of them in the past, spread over ten years),
+# times GET /venues/<id> while all of them are in the Show table, then moves the history to ShowArchive with
+# archive_shows() and times the page again, then page 20 of the past shows reached through the "Older shows" links.
+#
+# The tables are dropped and recreated, only run this against a scratch database:
+#     python benchmarks/show_archive.py --shows 10000000
+# ----------------------------------------------------------------------------#
+
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from jobs import archive_shows  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+
+HISTORY_DAYS = 3650
+UPCOMING_DAYS = 50
+
+
+def seed(shows, venues, artists):
+    db.drop_all()
+    db.create_all()
+    db.session.bulk_insert_mappings(Venue, [
+        dict(id=i, name=f'Venue {i}', city='San Francisco', state='CA', address=f'{i} Main St', phone='555-0100',
+             genres='Jazz,Rock') for i in range(1, venues + 1)
+    ])
+    db.session.bulk_insert_mappings(Artist, [
+        dict(id=i, name=f'Artist {i}', city='San Francisco', state='CA', phone='555-0100', genres='Jazz')
+        for i in range(1, artists + 1)
+    ])
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(
+            'INSERT INTO "Show" (venue_id, artist_id, start_time) '
+            'SELECT 1 + g % :venues, 1 + g % :artists, '
+            "now() + ((g % :span) - :history) * interval '1 day' + (g % 24) * interval '1 hour' "
+            'FROM generate_series(1, :shows) g',
+            dict(venues=venues, artists=artists, span=HISTORY_DAYS + UPCOMING_DAYS, history=HISTORY_DAYS,
+                 shows=shows)
+        )
+        db.session.commit()
+    else:
+        now = datetime.utcnow()
+        chunk = 50000
+        for start in range(1, shows + 1, chunk):
+            db.session.bulk_insert_mappings(Show, [
+                dict(id=g, venue_id=1 + g % venues, artist_id=1 + g % artists,
+                     start_time=now + timedelta(days=g % (HISTORY_DAYS + UPCOMING_DAYS) - HISTORY_DAYS, hours=g % 24))
+                for g in range(start, min(start + chunk, shows + 1))
+            ])
+            db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+
+def time_page(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+# URL of the past shows page `pages` clicks on "Older shows" away from `url`
+def older_page_url(client, url, pages):
+    for _ in range(pages):
+        html = client.get(url).get_data(as_text=True)
+        url = re.search(r'href="([^"]*past_before=[^"]*)"', html).group(1).replace('&amp;', '&')
+    return url
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shows', type=int, default=10000000)
+    parser.add_argument('--venues', type=int, default=500)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app({'WTF_CSRF_ENABLED': False, 'RATELIMIT_ENABLED': False})
+    client = app.test_client()
+    with app.app_context():
+        print(f'Seeding {args.shows} shows...')
+        seed(args.shows, args.venues, args.artists)
+        urls = [f'/venues/{venue_id}' for venue_id in (1, args.venues // 2, args.venues)]
+
+        print(f'{"":<22}{"median ms":>12}{"p95 ms":>12}')
+        for url in urls:
+            median, p95 = time_page(client, url, args.repeat)
+            print(f'{"hot " + url:<22}{median:>12.2f}{p95:>12.2f}')
+
+        start = time.perf_counter()
+        archived = archive_shows()
+        print(f'Archived {archived} shows in {time.perf_counter() - start:.1f}s')
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute('ANALYZE')
+            db.session.commit()
+
+        for url in urls:
+            median, p95 = time_page(client, url, args.repeat)
+            print(f'{"archived " + url:<22}{median:>12.2f}{p95:>12.2f}')
+        for url in urls:
+            median, p95 = time_page(client, older_page_url(client, url, 19), args.repeat)
+            print(f'{"page 20 " + url:<22}{median:>12.2f}{p95:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------------#
+# Benchmark of the SQLite backend under concurrent workers.
+#
+# --workers processes, each with --threads threads, send requests through the test client of their own app for
+# --seconds against one SQLite file: a share --write-ratio of them creates a show, the others read a venue page, the
+# shows list or a search. Runs three setups:
+#   rollback   SQLite defaults: rollback journal, synchronous=FULL, no write queue
+#   wal        SQLITE_PRAGMAS of config.py, no write queue
+#   wal+queue  SQLITE_PRAGMAS and the write queue of sqlite.py
+# Failed writes (database is locked) are the shows posted but not found in the table afterwards.
+#
+#     python benchmarks/sqlite_throughput.py --workers 4 --threads 8 --seconds 10
+# ----------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SETUPS = ('rollback', 'wal', 'wal+queue')
+
+
+def make_app(path, setup):
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    import config
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SQLITE_PRAGMAS': {} if setup == 'rollback' else config.SQLITE_PRAGMAS,
+        'SQLITE_WRITE_QUEUE': setup == 'wal+queue',
+        'WTF_CSRF_ENABLED': False,
+        'RATELIMIT_ENABLED': False,
+        'LOG_FILE': os.path.join(os.path.dirname(path), 'logs', 'benchmark.log'),
+        'LOG_LEVEL': 'ERROR',
+    })
+
+
+# The journal mode is stored in the file, so it's seeded with the pragmas of the setup
+def seed(path, setup, venues):
+    app = make_app(path, setup)
+    from models import db, Venue, Artist, Show
+    with app.app_context():
+        db.create_all()
+        now = datetime.utcnow()
+        for i in range(venues):
+            db.session.add(Venue(name=f'Venue {i}', city='San Francisco', state='CA', address=f'{i} Main St',
+                                 phone='555-0100', genres='Jazz,Rock'))
+            db.session.add(Artist(name=f'Artist {i}', city='San Francisco', state='CA', phone='555-0100',
+                                  genres='Jazz'))
+        db.session.flush()
+        for i in range(venues * 10):
+            db.session.add(Show(venue_id=i % venues + 1, artist_id=random.randint(1, venues),
+                                start_time=now + timedelta(days=random.randint(-30, 60))))
+        db.session.commit()
+
+
+def child(args):
+    app = make_app(args.database, args.setup)
+    deadline = time.perf_counter() + args.seconds
+    results = {'read': [], 'write': []}
+    lock = threading.Lock()
+
+    def run():
+        client = app.test_client()
+        latencies = {'read': [], 'write': []}
+        while time.perf_counter() < deadline:
+            venue_id = random.randint(1, args.venues)
+            start = time.perf_counter()
+            if random.random() < args.write_ratio:
+                kind = 'write'
+                client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': random.randint(1, args.venues),
+                                                   'start_time': '2030-01-01 20:00:00'})
+            else:
+                kind = 'read'
+                page = random.choice((f'/venues/{venue_id}', '/shows', None))
+                if page:
+                    client.get(page)
+                else:
+                    client.post('/venues/search', data={'search_term': str(venue_id)})
+            latencies[kind].append(time.perf_counter() - start)
+        with lock:
+            for kind in results:
+                results[kind].extend(latencies[kind])
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps(results))
+
+
+def run_setup(args, directory, setup):
+    path = os.path.join(directory, f'{setup.replace("+", "-")}.db')
+    seed(path, setup, args.venues)
+    command = [sys.executable, __file__, '--child', '--database', path, '--setup', setup,
+               '--threads', str(args.threads), '--seconds', str(args.seconds), '--venues', str(args.venues),
+               '--write-ratio', str(args.write_ratio)]
+    workers = [subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE) for _ in range(args.workers)]
+    results = {'read': [], 'write': []}
+    for worker in workers:
+        output = json.loads(worker.communicate()[0].decode('utf-8').strip().splitlines()[-1])
+        for kind in results:
+            results[kind].extend(output[kind])
+
+    import sqlite3
+    connection = sqlite3.connect(path)
+    committed = connection.execute('SELECT count(*) FROM "Show"').fetchone()[0] - args.venues * 10
+    connection.close()
+    return results, committed
+
+
+def percentile(values, fraction):
+    return sorted(values)[int(len(values) * fraction)] * 1000 if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--child', action='store_true')
+    parser.add_argument('--database')
+    parser.add_argument('--setup', choices=SETUPS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    directory = tempfile.mkdtemp(prefix='fyyur-sqlite-')
+    try:
+        print(f'{args.workers} workers x {args.threads} threads, {args.seconds:g}s, '
+              f'{args.write_ratio:.0%} writes; latencies in ms')
+        print(f'{"":<10}{"reads/s":>10}{"read p50":>10}{"read p99":>10}'
+              f'{"writes/s":>10}{"write p50":>10}{"write p99":>10}{"failed":>8}')
+        for setup in SETUPS:
+            results, committed = run_setup(args, directory, setup)
+            reads, writes = results['read'], results['write']
+            print(f'{setup:<10}{len(reads) / args.seconds:>10.0f}'
+                  f'{statistics.median(reads) * 1000 if reads else 0:>10.1f}{percentile(reads, 0.99):>10.1f}'
+                  f'{committed / args.seconds:>10.0f}'
+                  f'{statistics.median(writes) * 1000 if writes else 0:>10.1f}{percentile(writes, 0.99):>10.1f}'
+                  f'{len(writes) - committed:>8}')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# ----------------------------------------------------------------------------#
+# Benchmark of the cold start of a worker.
+#
+# Every run is a fresh interpreter that imports app.py, calls create_app() and requests each page of --pages once,
+# like a worker that was just started by the autoscaler. Runs are repeated for three setups:
+#   no cache   templates compiled from source on their first hit (JINJA_CACHE_DIR = None)
+#   cache      templates loaded from the Jinja bytecode cache filled by a previous run
+#   warm-up    bytecode cache plus WARM_UP, which compiles the templates and opens the pool in create_app()
+#
+# Uses the database configured in config.py, which must have been migrated:
+#     python benchmarks/startup.py --runs 20
+# ----------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = '/,/venues,/artists,/shows,/venues/create,/artists/create,/shows/create'
+
+
+def child(pages, cache_dir, warm_up):
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app({'JINJA_CACHE_DIR': cache_dir, 'WARM_UP': warm_up})
+    created = time.perf_counter()
+    client = app.test_client()
+    first_requests = []
+    for page in pages:
+        request_start = time.perf_counter()
+        response = client.get(page)
+        first_requests.append(time.perf_counter() - request_start)
+        assert response.status_code == 200, (page, response.status_code)
+    done = time.perf_counter()
+    print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                      'first_requests': sum(first_requests), 'slowest_request': max(first_requests),
+                      'total': done - start}))
+
+
+def run(args, cache_dir, warm_up):
+    command = [sys.executable, __file__, '--child', '--pages', args.pages, '--cache-dir', cache_dir or '']
+    if warm_up:
+        command.append('--warm-up')
+    output = subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def report(label, results):
+    columns = ('import', 'create_app', 'first_requests', 'slowest_request', 'total')
+    print(f'{label:<10}' + ''.join(f'{statistics.median(r[c] for r in results) * 1000:>16.1f}' for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--pages', default=PAGES)
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--warm-up', action='store_true')
+    parser.add_argument('--child', action='store_true')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.pages.split(','), args.cache_dir or None, args.warm_up)
+        return
+
+    cache_dir = tempfile.mkdtemp(prefix='fyyur-jinja-')
+    try:
+        print(f'Median over {args.runs} runs, in ms')
+        print(f'{"":<10}{"import":>16}{"create_app":>16}{"first requests":>16}{"slowest":>16}{"total":>16}')
+        report('no cache', [run(args, None, False) for _ in range(args.runs)])
+        run(args, cache_dir, False)
+        report('cache', [run(args, cache_dir, False) for _ in range(args.runs)])
+        report('warm-up', [run(args, cache_dir, True) for _ in range(args.runs)])
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# ----------------------------------------------------------------------------#
+# Response compression.
+#
+# Dynamic responses (rendered pages, JSON) are compressed with the best encoding the client accepts among
+# COMPRESS_ENCODINGS: zstd and brotli when their modules are installed, gzip always. Responses smaller than
+# COMPRESS_MIN_SIZE aren't worth it and are sent as is, as are responses of other types (images are compressed
+# already), responses that carry a Content-Encoding already (the precompressed bundles of assets.py) and files sent
+# from disk. Streamed responses are compressed chunk by chunk, each chunk flushed so the client gets it right away;
+# the Server-Sent Events of /events are never compressed, proxies would hold them back.
+# ----------------------------------------------------------------------------#
+
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def available_encodings(encodings):
+    installed = {'zstd': zstandard is not None, 'br': brotli is not None, 'gzip': True}
+    return [encoding for encoding in encodings if installed.get(encoding)]
+
+
+# Returns compress(chunk), flush() and finish() for a new stream; flush() ends the output of the chunks so far
+# without ending the stream
+def compressor(encoding, level):
+    if encoding == 'zstd':
+        stream = zstandard.ZstdCompressor(level=level).compressobj()
+        return stream.compress, lambda: stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), stream.flush
+    if encoding == 'br':
+        stream = brotli.Compressor(quality=level)
+        return stream.process, stream.flush, stream.finish
+    stream = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return stream.compress, lambda: stream.flush(zlib.Z_SYNC_FLUSH), stream.flush
+
+
+def compress(data, encoding, level):
+    compress_chunk, flush, finish = compressor(encoding, level)
+    return compress_chunk(data) + finish()
+
+
+def compress_stream(chunks, close, encoding, level):
+    compress_chunk, flush, finish = compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            data = compress_chunk(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if close is not None:
+            close()
+
+
+def compressible(response, config):
+    if response.status_code < 200 or response.status_code in (204, 206, 304) or request.method == 'HEAD':
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype in config['COMPRESS_MIMETYPES']
+
+
+def compress_response(response):
+    config = current_app.config
+    if not compressible(response, config):
+        return response
+    # The representation depends on Accept-Encoding even when it is sent uncompressed
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(current_app.extensions['compress_encodings'])
+    if encoding is None:
+        return response
+    level = config['COMPRESS_LEVELS'][encoding]
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), getattr(response.response, 'close', None),
+                                            encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        compressed = compress(data, encoding, level)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different byte sequence, a strong validator would now be wrong
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_ENCODINGS', ['zstd', 'br', 'gzip'])
+    app.config.setdefault('COMPRESS_LEVELS', {'zstd': 3, 'br': 4, 'gzip': 6})
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_MIMETYPES', {'text/html', 'application/json', 'text/plain', 'text/css',
+                                                 'application/javascript', 'image/svg+xml'})
+    if not app.config['COMPRESS_ENABLED']:
+        return
+    app.extensions['compress_encodings'] = available_encodings(app.config['COMPRESS_ENCODINGS'])
+    app.after_request(compress_response)
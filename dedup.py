@@ -0,0 +1,252 @@
+# ----------------------------------------------------------------------------#
+# Duplicate venues and artists.
+#
+# Names, cities, addresses and phone numbers are normalized, then every entity gets blocking keys: its phone digits
+# and the character trigrams of its name within its city and state. Only entities sharing a key are compared, so a
+# scan costs about one comparison per entity and key rather than one per pair; keys shared by more than
+# DEDUP_MAX_BLOCK_SIZE entities carry no signal and are skipped. Pairs are scored with a weighted string similarity
+# of their fields and the ones above DEDUP_THRESHOLD are kept in DuplicateCandidate for review.
+#
+# Creating a venue or an artist checks it against the entities of the same city or with the same phone digits, both
+# read through an index, and records the likely duplicates for review; the new entity is created either way.
+# `flask dedup-scan` checks everything, `flask dedup-merge` moves the shows of a duplicate to the entity kept and
+# deletes the duplicate.
+# ----------------------------------------------------------------------------#
+
+import itertools
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from difflib import SequenceMatcher
+
+import click
+from flask import current_app
+
+import analytics
+import outbox
+from models import db, Venue, Artist, Show, ShowArchive, DuplicateCandidate, phone_digits
+from signals import entity_changed
+
+MODELS = {'venue': (Venue, 'venue_id'), 'artist': (Artist, 'artist_id')}
+COLUMNS = {'venue': ('id', 'name', 'city', 'state', 'phone', 'address'),
+           'artist': ('id', 'name', 'city', 'state', 'phone')}
+# Share of each field in the score. A field empty on either side doesn't count for or against the pair
+WEIGHTS = {
+    'venue': {'name': 0.55, 'phone': 0.2, 'address': 0.15, 'area': 0.1},
+    'artist': {'name': 0.65, 'phone': 0.25, 'area': 0.1},
+}
+STOPWORDS = {'the', 'a', 'an', 'and', 'of', 'at'}
+ABBREVIATIONS = {'street': 'st', 'avenue': 'ave', 'boulevard': 'blvd', 'road': 'rd', 'drive': 'dr', 'suite': 'ste',
+                 'north': 'n', 'south': 's', 'east': 'e', 'west': 'w'}
+
+Record = namedtuple('Record', 'id name area phone address')
+
+
+def words(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.findall(r'[a-z0-9]+', text)
+
+
+def normalize_name(name):
+    return ' '.join(word for word in words(name) if word not in STOPWORDS)
+
+
+def normalize_address(address):
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words(address))
+
+
+def ngrams(text, n=3):
+    compact = text.replace(' ', '')
+    if len(compact) <= n:
+        return {compact} if compact else set()
+    return {compact[i:i + n] for i in range(len(compact) - n + 1)}
+
+
+def prepare(row):
+    return Record(row.id, normalize_name(row.name), (' '.join(words(row.city)), row.state), phone_digits(row.phone),
+                  normalize_address(getattr(row, 'address', '')))
+
+
+def blocking_keys(record):
+    keys = {('name', record.area, gram) for gram in ngrams(record.name)}
+    if len(record.phone) >= 7:
+        keys.add(('phone', record.phone))
+    return keys
+
+
+def similarity(left, right):
+    return SequenceMatcher(None, left, right).ratio()
+
+
+def score(kind, left, right):
+    weights = WEIGHTS[kind]
+    parts = {'name': similarity(left.name, right.name), 'area': float(left.area == right.area)}
+    if left.phone and right.phone:
+        parts['phone'] = float(left.phone == right.phone)
+    if 'address' in weights and left.address and right.address:
+        parts['address'] = similarity(left.address, right.address)
+    return sum(weights[field] * value for field, value in parts.items()) / sum(weights[field] for field in parts)
+
+
+def candidate_pairs(records, max_block_size):
+    blocks = defaultdict(list)
+    for record in records:
+        for key in blocking_keys(record):
+            blocks[key].append(record)
+    pairs = set()
+    for members in blocks.values():
+        if 1 < len(members) <= max_block_size:
+            pairs.update((a, b) if a.id < b.id else (b, a) for a, b in itertools.combinations(members, 2))
+    return pairs
+
+
+def live_rows(kind):
+    model, fk_name = MODELS[kind]
+    return model.query.with_entities(*(getattr(model, column) for column in COLUMNS[kind]))\
+        .filter(model.deleted_at.is_(None))
+
+
+# The entities sharing a blocking key with `entity` can only be in its city or have its phone digits. The city is
+# looked up as entered and capitalized as most are, the phone by its digits, so that each query reads an index
+# rather than the state
+def neighbours(kind, entity):
+    model, fk_name = MODELS[kind]
+    city = (entity.city or '').strip()
+    queries = [live_rows(kind).filter(model.city.in_({city, city.title()})).filter(model.state == entity.state)]
+    digits = phone_digits(entity.phone)
+    # Same length as the phone blocking key
+    if len(digits) >= 7:
+        queries.append(live_rows(kind).filter(model.phone_digits == digits))
+    rows = {}
+    for query in queries:
+        for row in query.all():
+            if row.id != entity.id:
+                rows[row.id] = row
+    return rows.values()
+
+
+# Existing entities that `entity`, created or not yet, is likely a duplicate of, as (id, score) best first
+def find_duplicates(kind, entity):
+    record = prepare(entity)
+    keys = blocking_keys(record)
+    duplicates = []
+    for row in neighbours(kind, entity):
+        other = prepare(row)
+        if keys & blocking_keys(other):
+            pair_score = score(kind, record, other)
+            if pair_score >= current_app.config['DEDUP_THRESHOLD']:
+                duplicates.append((other.id, pair_score))
+    return sorted(duplicates, key=lambda duplicate: -duplicate[1])
+
+
+# Pairs among `pairs` already in DuplicateCandidate, read through its unique index 500 pairs at a time
+def known_pairs(kind, pairs):
+    known = set()
+    for start in range(0, len(pairs), 500):
+        chunk = pairs[start:start + 500]
+        known.update(db.session.query(DuplicateCandidate.entity_id, DuplicateCandidate.duplicate_id)
+                     .filter(DuplicateCandidate.kind == kind)
+                     .filter(DuplicateCandidate.entity_id.in_({pair[0] for pair in chunk}))
+                     .filter(DuplicateCandidate.duplicate_id.in_({pair[1] for pair in chunk})).all())
+    return known
+
+
+# Adds the (entity_id, duplicate_id, score) pairs not known yet, including the ones dismissed before
+def record(kind, pairs):
+    known = known_pairs(kind, pairs)
+    now = datetime.utcnow()
+    new = [dict(kind=kind, entity_id=entity_id, duplicate_id=duplicate_id, score=pair_score, dismissed=False,
+                created_at=now)
+           for entity_id, duplicate_id, pair_score in pairs if (entity_id, duplicate_id) not in known]
+    if new:
+        db.session.bulk_insert_mappings(DuplicateCandidate, new)
+    db.session.commit()
+    return len(new)
+
+
+# Records the duplicates found when creating an entity. The entity is committed already, so a failure here is only
+# logged
+def record_new(kind, entity_id, duplicates):
+    if not duplicates:
+        return
+    try:
+        record(kind, [(other_id, entity_id, pair_score) for other_id, pair_score in duplicates])
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Could not record the duplicates of %s %s', kind, entity_id)
+
+
+def scan(kind):
+    config = current_app.config
+    records = [prepare(row) for row in live_rows(kind).all()]
+    db.session.rollback()
+    pairs = []
+    for left, right in candidate_pairs(records, config['DEDUP_MAX_BLOCK_SIZE']):
+        pair_score = score(kind, left, right)
+        if pair_score >= config['DEDUP_THRESHOLD']:
+            pairs.append((left.id, right.id, pair_score))
+    return record(kind, pairs)
+
+
+# Moves the shows of `duplicate_id` to `keep_id`, one UPDATE per show table, and their analytics counts, and deletes
+# the duplicate in the same transaction. Returns the number of shows moved
+def merge(kind, keep_id, duplicate_id):
+    model, fk_name = MODELS[kind]
+    keep = model.query.filter_by(id=keep_id, deleted_at=None).first()
+    duplicate = model.query.filter_by(id=duplicate_id, deleted_at=None).first()
+    if keep is None or duplicate is None or keep_id == duplicate_id:
+        raise ValueError(f'Cannot merge {kind} {duplicate_id} into {kind} {keep_id}')
+    moved = 0
+    for show_model in (Show, ShowArchive):
+        moved += show_model.query.filter(getattr(show_model, fk_name) == duplicate_id)\
+            .update({fk_name: keep_id}, synchronize_session=False)
+    analytics.move_counts(kind, duplicate_id, keep_id, keep.name)
+    duplicate.deleted_at = datetime.utcnow()
+    DuplicateCandidate.query.filter(DuplicateCandidate.kind == kind)\
+        .filter(db.or_(DuplicateCandidate.entity_id == duplicate_id, DuplicateCandidate.duplicate_id == duplicate_id))\
+        .delete(synchronize_session=False)
+    outbox.add(f'{kind}.deleted', **{fk_name: duplicate_id})
+    db.session.commit()
+    app = current_app._get_current_object()
+    entity_changed.send(app, kind=kind, entity_id=keep_id, fields={'shows'})
+    entity_changed.send(app, kind=kind, entity_id=duplicate_id, fields=None)
+    return moved
+
+
+def dismiss(kind, entity_id, duplicate_id):
+    dismissed = DuplicateCandidate.query.filter_by(kind=kind, entity_id=min(entity_id, duplicate_id),
+                                                   duplicate_id=max(entity_id, duplicate_id))\
+        .update({'dismissed': True}, synchronize_session=False)
+    db.session.commit()
+    return dismissed
+
+
+def init_app(app):
+    app.config.setdefault('DEDUP_THRESHOLD', 0.85)
+    app.config.setdefault('DEDUP_MAX_BLOCK_SIZE', 100)
+    kinds = click.Choice(list(MODELS))
+
+    @app.cli.command('dedup-scan')
+    def dedup_scan_command():
+        for kind in MODELS:
+            print(f'Found {scan(kind)} new {kind} duplicates')
+        open_pairs = DuplicateCandidate.query.filter_by(dismissed=False)\
+            .order_by(DuplicateCandidate.kind, DuplicateCandidate.score.desc()).all()
+        for pair in open_pairs:
+            print(f'{pair.kind} {pair.entity_id} ~ {pair.duplicate_id} ({pair.score:.2f})')
+
+    @app.cli.command('dedup-merge')
+    @click.argument('kind', type=kinds)
+    @click.argument('keep_id', type=int)
+    @click.argument('duplicate_id', type=int)
+    def dedup_merge_command(kind, keep_id, duplicate_id):
+        print(f'Moved {merge(kind, keep_id, duplicate_id)} shows to {kind} {keep_id}')
+
+    @app.cli.command('dedup-dismiss')
+    @click.argument('kind', type=kinds)
+    @click.argument('entity_id', type=int)
+    @click.argument('duplicate_id', type=int)
+    def dedup_dismiss_command(kind, entity_id, duplicate_id):
+        print(f'Dismissed {dismiss(kind, entity_id, duplicate_id)} pairs')
@@ -1,10 +1,17 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField, HiddenField
 from wtforms.validators import DataRequired, AnyOf, URL, Length
 
 
 class ShowForm(Form):
+    # Only used by the typeahead, which resolves the names to the ids below
+    artist_name = StringField(
+        'artist_name'
+    )
+    venue_name = StringField(
+        'venue_name'
+    )
     artist_id = StringField(
         'artist_id'
     )
@@ -127,6 +134,13 @@ class VenueForm(Form):
     seeking_description = TextAreaField(
         'seeking_description'
     )
+    # Set by the edit forms only, see compare_and_swap in views/helpers.py
+    version = HiddenField(
+        'version'
+    )
+    original = HiddenField(
+        'original'
+    )
 
 
 class ArtistForm(Form):
@@ -237,4 +251,11 @@ class ArtistForm(Form):
     seeking_description = TextAreaField(
         'seeking_description'
     )
+    # Set by the edit forms only, see compare_and_swap in views/helpers.py
+    version = HiddenField(
+        'version'
+    )
+    original = HiddenField(
+        'original'
+    )
 
@@ -0,0 +1,325 @@
+# ----------------------------------------------------------------------------#
+# Image proxy.
+#
+# /img/<kind>/<id>/<size> fetches the image_link of a venue or an artist once, keeps the original on local disk and
+# serves resized WebP/AVIF/JPEG variants of it, so pages no longer hotlink full size images from third party hosts.
+# The cache directory is kept under IMAGE_CACHE_MAX_BYTES by evicting the least recently used files. Links that
+# can't be fetched are not tried again for IMAGE_FAILURE_TTL seconds. Pages link to the images through image_url,
+# whose v= hash of image_link changes with the link: only those URLs are cached by browsers and CDNs for IMAGE_MAX_AGE.
+# image_link is set by whoever edits the venue or artist, so it is only fetched from public addresses, on every
+# redirect too, and only kept when the response is a raster image.
+# ----------------------------------------------------------------------------#
+
+import hashlib
+import http.client
+import io
+import ipaddress
+import mimetypes
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+from flask import abort, current_app, request, send_file, url_for
+
+from models import Venue, Artist
+
+# Preferred output formats, in order, used when both the client and the Pillow build support them
+FORMATS = [
+    ('image/avif', 'AVIF', 'avif'),
+    ('image/webp', 'WEBP', 'webp'),
+]
+
+MODELS = {'venue': Venue, 'artist': Artist}
+# Every worker writes to the cache directory: its size is counted again from the directory at least this often
+RESCAN_SECONDS = 30
+
+# Pillow is imported by the first request that needs it rather than when the app starts, see load_pillow
+Image = None
+formats = []
+pillow_loaded = False
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.rescan()
+
+    # (path, stat) of the cached files; other workers may delete some while they are listed
+    def entries(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                try:
+                    found.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    continue
+        return found
+
+    def rescan(self):
+        self.total_bytes = sum(stat.st_size for path, stat in self.entries())
+        self.scanned_at = time.monotonic()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    # Returns the path of a cached file and marks it as recently used
+    def get(self, name):
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        path = self.path(name)
+        with self.lock:
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+            self.total_bytes += len(data) - replaced
+            if time.monotonic() - self.scanned_at > RESCAN_SECONDS:
+                self.rescan()
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+        return path
+
+    # True when fetching `name` failed less than `ttl` seconds ago
+    def failed(self, name, ttl):
+        try:
+            return time.time() - os.stat(self.path(f'{name}.failed')).st_mtime < ttl
+        except FileNotFoundError:
+            return False
+
+    # Deletes least recently used files until the cache, as counted on disk, is back to 90% of its budget
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda entry: entry[1].st_mtime)
+        self.total_bytes = sum(stat.st_size for path, stat in entries)
+        self.scanned_at = time.monotonic()
+        for path, stat in entries:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= stat.st_size
+
+
+class BlockedAddress(OSError):
+    pass
+
+
+class FetchError(Exception):
+    pass
+
+
+# image_link is user input: only public addresses may be fetched, never the loopback, private networks, link-local
+# (cloud metadata) or reserved ranges
+def check_address(address):
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    if not ip.is_global or ip.is_multicast:
+        raise BlockedAddress(f'{address} is not a public address')
+
+
+# Replaces socket.create_connection: the host is resolved once and every address is checked before connecting to
+# it, so a redirect or a DNS answer changing between a check and the connection can't reach an internal address
+def connect_public(address, timeout, source_address=None):
+    host, port = address
+    error = OSError(f'{host} has no address')
+    for family, type_, proto, _, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        check_address(sockaddr[0])
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+# Every hop of a redirect goes through the public handlers. No proxy, file or FTP handler: other schemes fail
+opener = urllib.request.OpenerDirector()
+for handler in (urllib.request.UnknownHandler(), PublicHTTPHandler(), PublicHTTPSHandler(),
+                urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPRedirectHandler(),
+                urllib.request.HTTPErrorProcessor()):
+    opener.add_handler(handler)
+
+
+# Only raster images: an SVG served from this origin could run scripts
+def is_image(content_type):
+    return content_type.startswith('image/') and content_type != 'image/svg+xml'
+
+
+def fetch(url):
+    if urlparse(url).scheme not in ('http', 'https'):
+        abort(404)
+    max_bytes = current_app.config['IMAGE_MAX_ORIGINAL_BYTES']
+    try:
+        req = urllib.request.Request(url, headers={'User-Agent': 'Fyyur image proxy'})
+        with opener.open(req, timeout=current_app.config['IMAGE_FETCH_TIMEOUT']) as response:
+            content_type = response.headers.get_content_type()
+            if not is_image(content_type):
+                raise ValueError(f'{content_type} is not an image')
+            data = response.read(max_bytes + 1)
+    except (OSError, ValueError) as e:
+        raise FetchError(str(e))
+    if len(data) > max_bytes:
+        raise FetchError(f'larger than {max_bytes} bytes')
+    return data
+
+
+# Path of the cached original of `url`, fetched if needed. A failed fetch is remembered, so that a dead link doesn't
+# cost a timeout on every request
+def load_original(cache, key, url):
+    path = cache.get(key)
+    if path is not None:
+        return path
+    if cache.failed(key, current_app.config['IMAGE_FAILURE_TTL']):
+        abort(502)
+    try:
+        data = fetch(url)
+    except FetchError as e:
+        current_app.logger.warning('Could not fetch image %s: %s', url, e)
+        cache.put(f'{key}.failed', b'')
+        abort(502)
+    return cache.put(key, data)
+
+
+# Modern formats are only served to clients that list them explicitly, matching */* is not enough
+def negotiate_format():
+    accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+    for mimetype, pil_format, extension in formats:
+        if mimetype in accepted:
+            return mimetype, pil_format, extension
+    return 'image/jpeg', 'JPEG', 'jpg'
+
+
+def load_pillow():
+    global Image, pillow_loaded
+    if pillow_loaded:
+        return Image
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    else:
+        Image.init()
+        formats[:] = [fmt for fmt in FORMATS if fmt[1] in Image.SAVE]
+    pillow_loaded = True
+    return Image
+
+
+def resize(original, width, pil_format):
+    image = Image.open(io.BytesIO(original))
+    image.thumbnail((width, width * 4))
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, pil_format, quality=current_app.config['IMAGE_QUALITY'])
+    return output.getvalue()
+
+
+# Name of the cached files of an image_link, and the first characters of it as the version in image_url
+def link_key(image_link):
+    return hashlib.sha256(image_link.encode('utf-8')).hexdigest()
+
+
+def image_url(kind, entity_id, size, image_link):
+    return url_for('image', kind=kind, entity_id=entity_id, size=size, v=link_key(image_link)[:12])
+
+
+# A URL without the version of the current image_link, e.g. an old one, must be revalidated. The ETag is the name of
+# the file, which changes with the link: the mtime, refreshed by every read of the cache, can't be used
+def send_image(path, mimetype, versioned):
+    max_age = current_app.config['IMAGE_MAX_AGE'] if versioned else 0
+    response = send_file(path, mimetype=mimetype, add_etags=False, cache_timeout=max_age)
+    response.set_etag(os.path.basename(path))
+    response.last_modified = None
+    response.cache_control.public = True
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+
+def image(kind, entity_id, size):
+    sizes = current_app.config['IMAGE_SIZES']
+    if kind not in MODELS or size not in sizes:
+        abort(404)
+    model = MODELS[kind]
+    entity = model.query.with_entities(model.image_link).filter_by(id=entity_id, deleted_at=None).first()
+    if entity is None or not entity.image_link:
+        abort(404)
+
+    cache = current_app.extensions['image_cache']
+    key = link_key(entity.image_link)
+    versioned = request.args.get('v') == key[:12]
+    if load_pillow() is None:
+        mimetype = mimetypes.guess_type(urlparse(entity.image_link).path)[0]
+        return send_image(load_original(cache, key, entity.image_link),
+                          mimetype if mimetype and is_image(mimetype) else 'image/jpeg', versioned)
+
+    mimetype, pil_format, extension = negotiate_format()
+    variant_name = f'{key}.{size}.{extension}'
+    variant = cache.get(variant_name)
+    # The original is only read, and fetched again if it was evicted, when the variant isn't cached
+    if variant is None:
+        with open(load_original(cache, key, entity.image_link), 'rb') as f:
+            data = f.read()
+        try:
+            variant = cache.put(variant_name, resize(data, sizes[size], pil_format))
+        # Pillow refuses images of more than twice Image.MAX_IMAGE_PIXELS, a decompression bomb or not
+        except (OSError, ValueError, Image.DecompressionBombError):
+            current_app.logger.warning('Could not resize image %s', entity.image_link)
+            abort(502)
+    return send_image(variant, mimetype, versioned)
+
+
+def init_app(app):
+    app.config.setdefault('IMAGE_CACHE_DIR', os.path.join(app.instance_path, 'image-cache'))
+    app.config.setdefault('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    app.config.setdefault('IMAGE_MAX_ORIGINAL_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('IMAGE_FETCH_TIMEOUT', 5)
+    app.config.setdefault('IMAGE_FAILURE_TTL', 60)
+    app.config.setdefault('IMAGE_QUALITY', 80)
+    app.config.setdefault('IMAGE_MAX_AGE', 7 * 24 * 3600)
+    app.config.setdefault('IMAGE_SIZES', {'thumb': 320, 'card': 640, 'full': 1280})
+    app.extensions['image_cache'] = ImageCache(app.config['IMAGE_CACHE_DIR'], app.config['IMAGE_CACHE_MAX_BYTES'])
+    app.add_url_rule('/img/<kind>/<int:entity_id>/<size>', 'image', image)
+    app.add_template_global(image_url)
@@ -0,0 +1,85 @@
+# ----------------------------------------------------------------------------#
+# Background jobs.
+# ----------------------------------------------------------------------------#
+
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, Venue, Artist, Show, ShowArchive
+
+purge_lock = threading.Lock()
+
+
+# Removes the shows of soft deleted venues and artists in small batches, committing after each batch so that
+# no transaction holds row locks for long, and then removes the venue or artist row itself
+def purge_deleted(batch_size=None):
+    batch_size = batch_size or current_app.config['PURGE_BATCH_SIZE']
+    purged = 0
+    for model, fk_name in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        deleted_ids = [row.id for row in model.query.with_entities(model.id).filter(model.deleted_at.isnot(None)).all()]
+        for entity_id in deleted_ids:
+            for show_model in (Show, ShowArchive):
+                show_fk = getattr(show_model, fk_name)
+                while True:
+                    batch = db.session.query(show_model.id).filter(show_fk == entity_id).limit(batch_size).subquery()
+                    removed = show_model.query.filter(show_model.id.in_(batch)).delete(synchronize_session=False)
+                    db.session.commit()
+                    purged += removed
+                    if removed < batch_size:
+                        break
+            model.query.filter_by(id=entity_id).delete(synchronize_session=False)
+            db.session.commit()
+    db.session.close()
+    return purged
+
+
+def run_purge(app):
+    if not purge_lock.acquire(blocking=False):
+        return
+    try:
+        with app.app_context():
+            purge_deleted()
+    finally:
+        purge_lock.release()
+
+
+# Starts the purge in a daemon thread so that the delete request returns right away
+def start_purge():
+    app = current_app._get_current_object()
+    threading.Thread(target=run_purge, args=(app,), daemon=True).start()
+
+
+# Moves shows older than SHOW_ARCHIVE_AFTER_DAYS from Show to ShowArchive, one batch per transaction. Batches walk the
+# primary key from where the previous one stopped: start_time has no index, so ordering by it would read the whole
+# table for every batch
+def archive_shows(batch_size=None):
+    batch_size = batch_size or current_app.config['SHOW_ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['SHOW_ARCHIVE_AFTER_DAYS'])
+    archived = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time)\
+            .filter(Show.id > last_id).filter(Show.start_time < cutoff).order_by(Show.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        db.session.bulk_insert_mappings(ShowArchive, [show._asdict() for show in batch])
+        Show.query.filter(Show.id.in_([show.id for show in batch])).delete(synchronize_session=False)
+        db.session.commit()
+        archived += len(batch)
+        if len(batch) < batch_size:
+            break
+    db.session.close()
+    return archived
+
+
+def init_app(app):
+    @app.cli.command('purge-deleted')
+    def purge_deleted_command():
+        print(f'Purged {purge_deleted()} shows of deleted venues and artists')
+
+    @app.cli.command('archive-shows')
+    def archive_shows_command():
+        print(f'Moved {archive_shows()} past shows to the archive')
@@ -0,0 +1,202 @@
+# ----------------------------------------------------------------------------#
+# Structured logging.
+#
+# Records of the app logger are put on a bounded in-memory queue by the request thread and written as one JSON
+# object per line by a background QueueListener, so a log call never waits for the disk. Each record carries the id,
+# route and method of the request it was logged from. Every request ends with an access record holding its status,
+# latency and time spent in the database; those and other high-volume info records are sampled with
+# LOG_SAMPLE_RATES, warnings and errors always go through. When the queue is full records are dropped and counted
+# rather than blocking the request.
+# Workers must not rotate a file they share: each would rename it under the others and records would be lost. With
+# LOG_ROTATION 'size' or 'time' each process writes and rotates a file of its own, LOG_FILE with its pid before the
+# extension; with 'external' they all append to LOG_FILE, rotated by logrotate or the like.
+# ----------------------------------------------------------------------------#
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler, \
+    WatchedFileHandler
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Attributes every LogRecord has, anything else was passed with extra= and is written as is
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+formatter = JsonFormatter()
+
+
+# Adds the request context to the records, in the thread that logs them since the listener thread has none
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(g, 'request_id', None)
+            record.route = request.endpoint
+            record.method = request.method
+        return True
+
+
+# Keeps a fraction of the info and debug records of the loggers listed in `rates`
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.name, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class AsyncHandler(QueueHandler):
+    def __init__(self, config, max_size):
+        super().__init__(queue.Queue(max_size))
+        self.config = config
+        self.handler = None
+        self.dropped = 0
+        self.listener = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    # The file handler and the listener are created by the process that logs, so a worker forked from a preloading
+    # master gets its own, and its own file when it rotates it
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.handler = file_handler(self.config)
+            self.listener = QueueListener(self.queue, self.handler, respect_handler_level=True)
+            self.listener.start()
+            self.pid = os.getpid()
+
+    def stop(self):
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.handler.close()
+            self.pid = None
+
+    # Only the message and the traceback are rendered here, the JSON is built by the listener thread
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# File this process writes to
+def log_path(config):
+    if config['LOG_ROTATION'] == 'external':
+        return config['LOG_FILE']
+    root, extension = os.path.splitext(config['LOG_FILE'])
+    return f'{root}.{os.getpid()}{extension}'
+
+
+def file_handler(config):
+    path = log_path(config)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if config['LOG_ROTATION'] == 'external':
+        # Opens the file again once it was moved away
+        handler = WatchedFileHandler(path)
+    elif config['LOG_ROTATION'] == 'time':
+        handler = TimedRotatingFileHandler(path, when=config['LOG_ROTATE_WHEN'], backupCount=config['LOG_BACKUP_COUNT'],
+                                           utc=True)
+    else:
+        handler = RotatingFileHandler(path, maxBytes=config['LOG_MAX_BYTES'], backupCount=config['LOG_BACKUP_COUNT'])
+    handler.setFormatter(formatter)
+    return handler
+
+
+# Time spent in the database by the current request, summed over its queries
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    if has_request_context() and 'db_time' in g:
+        g.db_time += time.perf_counter() - started
+
+
+def start_request():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+    g.db_time = 0.0
+
+
+def access_logger(app):
+    return logging.getLogger(f'{app.logger.name}.access')
+
+
+def init_app(app):
+    app.config.setdefault('LOG_FILE', os.path.join(app.instance_path, 'logs', 'fyyur.log'))
+    app.config.setdefault('LOG_LEVEL', 'INFO')
+    app.config.setdefault('LOG_ROTATION', 'size')
+    app.config.setdefault('LOG_MAX_BYTES', 50 * 1024 * 1024)
+    app.config.setdefault('LOG_ROTATE_WHEN', 'midnight')
+    app.config.setdefault('LOG_BACKUP_COUNT', 10)
+    app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+    app.config.setdefault('LOG_SAMPLE_RATES', {})
+
+    handler = AsyncHandler(app.config, app.config['LOG_QUEUE_SIZE'])
+    handler.addFilter(SamplingFilter({f'{app.logger.name}.{name}': rate
+                                      for name, rate in app.config['LOG_SAMPLE_RATES'].items()}))
+    handler.addFilter(RequestContextFilter())
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.logger.addHandler(handler)
+    app.extensions['log_handler'] = handler
+    atexit.register(handler.stop)
+    access = access_logger(app)
+
+    app.before_request(start_request)
+
+    @app.after_request
+    def log_request(response):
+        if 'request_start' in g:
+            response.headers['X-Request-ID'] = g.request_id
+            access.info('%s %s %s', request.method, request.path, response.status_code, extra={
+                'status': response.status_code,
+                'latency_ms': round((time.perf_counter() - g.request_start) * 1000, 2),
+                'db_ms': round(g.db_time * 1000, 2),
+            })
+        return response
@@ -0,0 +1,122 @@
+# ----------------------------------------------------------------------------#
+# Matrix scoring of the recommendations, kept apart from recommendations.py so that NumPy is only imported by the
+# workers and commands that actually compute matches.
+# ----------------------------------------------------------------------------#
+
+import numpy as np
+from flask import current_app
+
+BLOCK_SIZE = 1024
+
+
+class Features:
+    def __init__(self, rows, genre_index, city_index, state_index):
+        self.genre_index, self.city_index, self.state_index = genre_index, city_index, state_index
+        self.ids = np.array([row.id for row in rows], dtype=np.int64)
+        self.genres = np.zeros((len(rows), len(genre_index)), dtype=np.float32)
+        for i, row in enumerate(rows):
+            for genre in row.genres.split(','):
+                if genre in genre_index:
+                    self.genres[i, genre_index[genre]] = 1
+        norms = np.linalg.norm(self.genres, axis=1, keepdims=True)
+        self.genres /= np.maximum(norms, 1)
+        self.cities = np.array([city_index[city_key(row)] for row in rows], dtype=np.int64)
+        self.states = np.array([state_index[row.state] for row in rows], dtype=np.int64)
+
+    # Replaces the row of `entity_id` with `row`, adds it, or removes it when `row` is None. Returns False when `row`
+    # has a genre, city or state the matrices have no column or code for: they must then be built again
+    def set_row(self, entity_id, row):
+        position = np.flatnonzero(self.ids == entity_id)
+        if row is None:
+            self.ids, self.genres = np.delete(self.ids, position), np.delete(self.genres, position, axis=0)
+            self.cities, self.states = np.delete(self.cities, position), np.delete(self.states, position)
+            return True
+        genres = row.genres.split(',')
+        if city_key(row) not in self.city_index or row.state not in self.state_index or \
+                any(genre not in self.genre_index for genre in genres):
+            return False
+        vector = np.zeros(len(self.genre_index), dtype=np.float32)
+        vector[[self.genre_index[genre] for genre in genres]] = 1
+        vector /= max(np.linalg.norm(vector), 1)
+        city, state = self.city_index[city_key(row)], self.state_index[row.state]
+        if len(position):
+            self.genres[position[0]], self.cities[position[0]], self.states[position[0]] = vector, city, state
+        else:
+            # Kept in id order, like the rows of build_features
+            i = np.searchsorted(self.ids, entity_id)
+            self.ids, self.genres = np.insert(self.ids, i, entity_id), np.insert(self.genres, i, vector, axis=0)
+            self.cities, self.states = np.insert(self.cities, i, city), np.insert(self.states, i, state)
+        return True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, positions):
+        subset = object.__new__(Features)
+        subset.ids, subset.genres = self.ids[positions], self.genres[positions]
+        subset.cities, subset.states = self.cities[positions], self.states[positions]
+        return subset
+
+
+def city_key(row):
+    return row.city.strip().lower(), row.state
+
+
+def build_features(venue_rows, artist_rows):
+    rows = venue_rows + artist_rows
+    genre_index = {genre: i for i, genre in enumerate(sorted({g for row in rows for g in row.genres.split(',')}))}
+    city_index = {key: i for i, key in enumerate({city_key(row) for row in rows})}
+    state_index = {state: i for i, state in enumerate({row.state for row in rows})}
+    return (Features(venue_rows, genre_index, city_index, state_index),
+            Features(artist_rows, genre_index, city_index, state_index))
+
+
+# Scores of every row of `left` against every row of `right`, as a len(left) x len(right) matrix
+def score(left, right):
+    config = current_app.config
+    scores = config['RECOMMENDATION_GENRE_WEIGHT'] * (left.genres @ right.genres.T)
+    scores += config['RECOMMENDATION_CITY_WEIGHT'] * (left.cities[:, None] == right.cities[None, :])
+    scores += config['RECOMMENDATION_STATE_WEIGHT'] * (left.states[:, None] == right.states[None, :])
+    return scores
+
+
+# Best `k` columns of each row of `scores`, as (row position, column position, score) with zero scores left out.
+# Ties go to the first column, i.e. the lowest id, so that a refresh and refresh_all pick the same matches: scores are
+# rounded, the same pair can score a few ulps apart in blocks of different shapes, then lowered by less than the
+# rounding step the further right their column is
+def top_k(scores, k):
+    scores = np.round(scores.astype(np.float64), 6)
+    keys = scores - np.arange(scores.shape[1]) / (scores.shape[1] * 1e7)
+    if scores.shape[1] > k:
+        columns = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(keys, columns, axis=1), axis=1)
+    columns = np.take_along_axis(columns, order, axis=1)
+    picked = np.take_along_axis(scores, columns, axis=1)
+    rows = np.repeat(np.arange(scores.shape[0]), columns.shape[1]).reshape(columns.shape)
+    keep = picked > 0
+    return rows[keep], columns[keep], picked[keep]
+
+
+def matches(source_kind, sources, targets):
+    k = current_app.config['RECOMMENDATIONS_PER_ENTITY']
+    mappings = []
+    if not len(targets):
+        return mappings
+    for start in range(0, len(sources), BLOCK_SIZE):
+        block = sources.take(slice(start, start + BLOCK_SIZE))
+        rows, columns, scores = top_k(score(block, targets), k)
+        # rows is sorted, so the rank of a match is its distance to the first match of the same row
+        ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        mappings.extend(
+            dict(source=source_kind, source_id=int(block.ids[row]), target_id=int(targets.ids[column]),
+                 score=float(value), rank=int(rank))
+            for row, column, value, rank in zip(rows, columns, scores, ranks)
+        )
+    return mappings
+
+
+# Positions of the rows of `features` whose id is in `ids`
+def positions(features, ids):
+    return np.flatnonzero(np.isin(features.ids, list(ids)))
@@ -72,6 +72,10 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # SQLite keeps the last AUTOINCREMENT ids in sqlite_sequence, which isn't a table of the models
+    def include_object(object, name, type_, reflected, compare_to):
+        return not (type_ == 'table' and name == 'sqlite_sequence')
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix='sqlalchemy.',
@@ -83,6 +87,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
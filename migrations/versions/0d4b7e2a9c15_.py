@@ -0,0 +1,68 @@
+"""empty message
+
+Revision ID: 0d4b7e2a9c15
+Revises: 5b8e03c6d9a4
+Create Date: 2026-10-19 15:02:11.384920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d4b7e2a9c15'
+down_revision = '5b8e03c6d9a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowsByArea',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'city', 'state')
+    )
+    op.create_table('ShowsByGenre',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('genre', sa.String(length=120), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'genre')
+    )
+    op.create_table('ShowsByVenue',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'venue_id')
+    )
+    op.create_index(op.f('ix_ShowsByVenue_venue_id'), 'ShowsByVenue', ['venue_id'], unique=False)
+    op.create_table('ShowsByArtist',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'artist_id')
+    )
+    op.create_index(op.f('ix_ShowsByArtist_artist_id'), 'ShowsByArtist', ['artist_id'], unique=False)
+    watermark = op.create_table('AnalyticsWatermark',
+    sa.Column('name', sa.String(length=40), nullable=False),
+    sa.Column('last_show_id', sa.Integer(), nullable=False),
+    sa.Column('safe_show_id', sa.Integer(), nullable=False),
+    sa.Column('horizon_show_id', sa.Integer(), nullable=False),
+    sa.Column('horizon_seen_at', sa.DateTime(), nullable=True),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(watermark, [dict(name='shows', last_show_id=0, safe_show_id=0, horizon_show_id=0)])
+
+
+def downgrade():
+    op.drop_table('AnalyticsWatermark')
+    op.drop_index(op.f('ix_ShowsByArtist_artist_id'), table_name='ShowsByArtist')
+    op.drop_table('ShowsByArtist')
+    op.drop_index(op.f('ix_ShowsByVenue_venue_id'), table_name='ShowsByVenue')
+    op.drop_table('ShowsByVenue')
+    op.drop_table('ShowsByGenre')
+    op.drop_table('ShowsByArea')
@@ -0,0 +1,48 @@
+"""empty message
+
+Revision ID: 3f6c2a9d1b47
+Revises: 906b36eb9e49
+Create Date: 2026-10-19 10:12:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2a9d1b47'
+down_revision = '906b36eb9e49'
+branch_labels = None
+depends_on = None
+
+# Partial indexes, supported by Postgres and SQLite
+LIVE = sa.text('deleted_at IS NULL')
+DELETED = sa.text('deleted_at IS NOT NULL')
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('Artist', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_Venue_live_city_state', 'Venue', ['city', 'state'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_Venue_deleted_at', 'Venue', ['deleted_at'], unique=False,
+                    postgresql_where=DELETED, sqlite_where=DELETED)
+    op.create_index('ix_Artist_live_id', 'Artist', ['id'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_Artist_deleted_at', 'Artist', ['deleted_at'], unique=False,
+                    postgresql_where=DELETED, sqlite_where=DELETED)
+    op.create_index(op.f('ix_Show_venue_id'), 'Show', ['venue_id'], unique=False)
+    op.create_index(op.f('ix_Show_artist_id'), 'Show', ['artist_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Show_artist_id'), table_name='Show')
+    op.drop_index(op.f('ix_Show_venue_id'), table_name='Show')
+    op.drop_index('ix_Artist_deleted_at', table_name='Artist')
+    op.drop_index('ix_Artist_live_id', table_name='Artist')
+    op.drop_index('ix_Venue_deleted_at', table_name='Venue')
+    op.drop_index('ix_Venue_live_city_state', table_name='Venue')
+    with op.batch_alter_table('Artist') as batch_op:
+        batch_op.drop_column('deleted_at')
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,47 @@
+"""empty message
+
+Revision ID: 4e7b2d9a6f03
+Revises: a6d3f09e2c71
+Create Date: 2026-10-19 20:14:52.604118
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e7b2d9a6f03'
+down_revision = 'a6d3f09e2c71'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+# Same as models.phone_digits when this revision was written
+def phone_digits(phone):
+    return re.sub(r'\D', '', phone or '')[-10:]
+
+
+def upgrade():
+    connection = op.get_bind()
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('phone_digits', sa.String(length=10), nullable=True))
+        rows = connection.execute(sa.text(f'SELECT id, phone FROM "{table}"')).fetchall()
+        if rows:
+            connection.execute(sa.text(f'UPDATE "{table}" SET phone_digits = :digits WHERE id = :id'),
+                               [{'id': row.id, 'digits': phone_digits(row.phone)} for row in rows])
+        op.drop_index(f'ix_{table}_live_phone', table_name=table)
+        op.create_index(f'ix_{table}_live_phone_digits', table, ['phone_digits'], unique=False,
+                        postgresql_where=LIVE, sqlite_where=LIVE)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(f'ix_{table}_live_phone_digits', table_name=table)
+        op.create_index(f'ix_{table}_live_phone', table, ['phone'], unique=False,
+                        postgresql_where=LIVE, sqlite_where=LIVE)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('phone_digits')
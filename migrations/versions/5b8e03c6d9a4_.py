@@ -0,0 +1,28 @@
+"""empty message
+
+Revision ID: 5b8e03c6d9a4
+Revises: e5d1f7a38c62
+Create Date: 2026-10-19 14:37:28.661035
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e03c6d9a4'
+down_revision = 'e5d1f7a38c62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('Artist') as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('version')
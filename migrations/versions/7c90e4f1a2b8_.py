@@ -0,0 +1,41 @@
+"""empty message
+
+Revision ID: 7c90e4f1a2b8
+Revises: 0d4b7e2a9c15
+Create Date: 2026-10-19 15:48:52.107731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c90e4f1a2b8'
+down_revision = '0d4b7e2a9c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('OutboxEvent',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('topic', sa.String(length=40), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_OutboxEvent_created_at'), 'OutboxEvent', ['created_at'], unique=False)
+    op.create_index(op.f('ix_OutboxEvent_venue_id'), 'OutboxEvent', ['venue_id'], unique=False)
+    op.create_table('OutboxCursor',
+    sa.Column('name', sa.String(length=40), nullable=False),
+    sa.Column('last_event_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('OutboxCursor')
+    op.drop_index(op.f('ix_OutboxEvent_venue_id'), table_name='OutboxEvent')
+    op.drop_index(op.f('ix_OutboxEvent_created_at'), table_name='OutboxEvent')
+    op.drop_table('OutboxEvent')
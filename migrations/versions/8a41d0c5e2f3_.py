@@ -0,0 +1,47 @@
+"""empty message
+
+Revision ID: 8a41d0c5e2f3
+Revises: 3f6c2a9d1b47
+Create Date: 2026-10-19 11:03:17.552904
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41d0c5e2f3'
+down_revision = '3f6c2a9d1b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowArchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Split the existing data with the same cutoff as `flask archive-shows`
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['SHOW_ARCHIVE_AFTER_DAYS'])
+    op.get_bind().execute(sa.text('INSERT INTO "ShowArchive" (id, venue_id, artist_id, start_time) '
+                                  'SELECT id, venue_id, artist_id, start_time FROM "Show" WHERE start_time < :cutoff'),
+                          cutoff=cutoff)
+    op.get_bind().execute(sa.text('DELETE FROM "Show" WHERE start_time < :cutoff'), cutoff=cutoff)
+    op.create_index('ix_ShowArchive_venue_id_start_time', 'ShowArchive', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_ShowArchive_artist_id_start_time', 'ShowArchive', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.execute('INSERT INTO "Show" (id, venue_id, artist_id, start_time) '
+               'SELECT id, venue_id, artist_id, start_time FROM "ShowArchive"')
+    op.drop_index('ix_ShowArchive_artist_id_start_time', table_name='ShowArchive')
+    op.drop_index('ix_ShowArchive_venue_id_start_time', table_name='ShowArchive')
+    op.drop_table('ShowArchive')
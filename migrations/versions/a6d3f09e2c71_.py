@@ -0,0 +1,33 @@
+"""empty message
+
+Revision ID: a6d3f09e2c71
+Revises: f2a8c4d6b913
+Create Date: 2026-10-19 18:05:47.316208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3f09e2c71'
+down_revision = 'f2a8c4d6b913'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def upgrade():
+    op.create_index('ix_Venue_live_phone', 'Venue', ['phone'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_Artist_live_city_state', 'Artist', ['city', 'state'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_Artist_live_phone', 'Artist', ['phone'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_live_phone', table_name='Artist')
+    op.drop_index('ix_Artist_live_city_state', table_name='Artist')
+    op.drop_index('ix_Venue_live_phone', table_name='Venue')
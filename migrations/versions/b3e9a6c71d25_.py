@@ -0,0 +1,70 @@
+"""empty message
+
+Revision ID: b3e9a6c71d25
+Revises: 7c90e4f1a2b8
+Create Date: 2026-10-19 16:40:18.532904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e9a6c71d25'
+down_revision = '7c90e4f1a2b8'
+branch_labels = None
+depends_on = None
+
+
+def show_table(*primary_key, **kwargs):
+    return sa.Table('Show', sa.MetaData(),
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('venue_id', sa.Integer(), nullable=False),
+                    sa.Column('artist_id', sa.Integer(), nullable=False),
+                    sa.Column('start_time', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint(*primary_key, name='pk_Show'),
+                    sa.Index('ix_Show_venue_id', 'venue_id'),
+                    sa.Index('ix_Show_artist_id', 'artist_id'),
+                    **kwargs)
+
+
+def outbox_event_table(**kwargs):
+    return sa.Table('OutboxEvent', sa.MetaData(),
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('topic', sa.String(length=40), nullable=False),
+                    sa.Column('venue_id', sa.Integer(), nullable=True),
+                    sa.Column('payload', sa.Text(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.Index('ix_OutboxEvent_created_at', 'created_at'),
+                    sa.Index('ix_OutboxEvent_venue_id', 'venue_id'),
+                    **kwargs)
+
+
+# Show's primary key becomes the id alone. SQLite only generates ids for a single integer primary key, and can't
+# change the key of a table in place: the table is copied into the new shape instead. On SQLite the ids of Show and
+# OutboxEvent also become AUTOINCREMENT, otherwise the largest id is reused once its row is deleted, which breaks the
+# archive, the analytics watermark and the outbox cursors
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('Show', recreate='always', copy_from=show_table('id', sqlite_autoincrement=True)):
+            pass
+        with op.batch_alter_table('OutboxEvent', recreate='always',
+                                  copy_from=outbox_event_table(sqlite_autoincrement=True)):
+            pass
+    else:
+        op.drop_constraint('Show_pkey', 'Show', type_='primary')
+        op.create_primary_key('Show_pkey', 'Show', ['id'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('OutboxEvent', recreate='always', copy_from=outbox_event_table()):
+            pass
+        with op.batch_alter_table('Show', recreate='always', copy_from=show_table('id', 'venue_id', 'artist_id')):
+            pass
+    else:
+        op.drop_constraint('Show_pkey', 'Show', type_='primary')
+        op.create_primary_key('Show_pkey', 'Show', ['id', 'venue_id', 'artist_id'])
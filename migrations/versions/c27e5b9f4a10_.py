@@ -0,0 +1,37 @@
+"""empty message
+
+Revision ID: c27e5b9f4a10
+Revises: 8a41d0c5e2f3
+Create Date: 2026-10-19 12:26:05.317642
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27e5b9f4a10'
+down_revision = '8a41d0c5e2f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Recommendation',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('source', sa.String(length=10), nullable=False),
+    sa.Column('source_id', sa.Integer(), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_Recommendation_source_source_id_rank', 'Recommendation', ['source', 'source_id', 'rank'],
+                    unique=False)
+    op.create_index('ix_Recommendation_source_target_id', 'Recommendation', ['source', 'target_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Recommendation_source_target_id', table_name='Recommendation')
+    op.drop_index('ix_Recommendation_source_source_id_rank', table_name='Recommendation')
+    op.drop_table('Recommendation')
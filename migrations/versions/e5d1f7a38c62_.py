@@ -0,0 +1,31 @@
+"""empty message
+
+Revision ID: e5d1f7a38c62
+Revises: c27e5b9f4a10
+Create Date: 2026-10-19 13:41:52.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d1f7a38c62'
+down_revision = 'c27e5b9f4a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ServerSession',
+    sa.Column('id', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ServerSession_expires_at'), 'ServerSession', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_ServerSession_expires_at'), table_name='ServerSession')
+    op.drop_table('ServerSession')
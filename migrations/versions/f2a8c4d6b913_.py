@@ -0,0 +1,37 @@
+"""empty message
+
+Revision ID: f2a8c4d6b913
+Revises: b3e9a6c71d25
+Create Date: 2026-10-19 17:25:03.914271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8c4d6b913'
+down_revision = 'b3e9a6c71d25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('DuplicateCandidate',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('duplicate_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('dismissed', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'entity_id', 'duplicate_id', name='uq_DuplicateCandidate_pair')
+    )
+    op.create_index('ix_DuplicateCandidate_kind_duplicate_id', 'DuplicateCandidate', ['kind', 'duplicate_id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_DuplicateCandidate_kind_duplicate_id', table_name='DuplicateCandidate')
+    op.drop_table('DuplicateCandidate')
@@ -0,0 +1,222 @@
+# ----------------------------------------------------------------------------#
+# Models.
+#
+# The SQLAlchemy extension is bound to the application in create_app(), so the models can be imported without
+# creating an app.
+# ----------------------------------------------------------------------------#
+
+import re
+
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+
+# The last ten digits of a phone number, which drops the country code of numbers entered with one. Stored next to the
+# phone of venues and artists, so that dedup finds a number written differently through an index
+def phone_digits(phone):
+    return re.sub(r'\D', '', phone or '')[-10:]
+
+
+def phone_digits_default(context):
+    return phone_digits(context.get_current_parameters().get('phone'))
+
+
+# The primary key is the id alone: SQLite only generates ids for a single integer primary key column
+class Show(db.Model):
+    __tablename__ = 'Show'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False, index=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False, index=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+    # Without AUTOINCREMENT SQLite reuses the largest id once its row is gone, e.g. archived
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+# Shows that took place before the archive cutoff are moved here by the archive job, which keeps the Show table
+# small: upcoming shows are read from Show only and past shows are paged through both tables
+class ShowArchive(db.Model):
+    __tablename__ = 'ShowArchive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_ShowArchive_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_ShowArchive_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+
+# Precomputed matches between venues seeking talent and artists seeking venues, see recommendations.py
+class Recommendation(db.Model):
+    __tablename__ = 'Recommendation'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    source = db.Column(db.String(10), nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_Recommendation_source_source_id_rank', 'source', 'source_id', 'rank'),
+        db.Index('ix_Recommendation_source_target_id', 'source', 'target_id'),
+    )
+
+
+# Server side session data, used when SESSION_BACKEND = 'database'
+class ServerSession(db.Model):
+    __tablename__ = 'ServerSession'
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    address = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120), nullable=False)
+    # Set on insert, edits of phone set it in compare_and_swap
+    phone_digits = db.Column(db.String(10), default=phone_digits_default)
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    genres = db.Column(db.String(120), nullable=False)
+    seeking_talent = db.Column(db.Boolean, default=True)
+    seeking_description = db.Column(db.String(500))
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Bumped by every edit, see compare_and_swap
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    artists = db.relationship('Show', passive_deletes=True, backref='venues', lazy=True)
+
+    # Live rows are read through the first index, soft deleted rows waiting for the purge through the second one.
+    # The city and phone digits indexes also find the possible duplicates of a new venue, see dedup.find_duplicates
+    __table_args__ = (
+        db.Index('ix_Venue_live_city_state', 'city', 'state',
+                 postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        db.Index('ix_Venue_live_phone_digits', 'phone_digits',
+                 postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        db.Index('ix_Venue_deleted_at', 'deleted_at',
+                 postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
+
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120), nullable=False)
+    phone_digits = db.Column(db.String(10), default=phone_digits_default)
+    genres = db.Column(db.String(120), nullable=False)
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, default=True)
+    seeking_description = db.Column(db.String(500))
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Bumped by every edit, see compare_and_swap
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    venues = db.relationship('Show', backref='artists', passive_deletes=True, lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_Artist_live_id', 'id',
+                 postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        db.Index('ix_Artist_live_city_state', 'city', 'state',
+                 postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        db.Index('ix_Artist_live_phone_digits', 'phone_digits',
+                 postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        db.Index('ix_Artist_deleted_at', 'deleted_at',
+                 postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
+
+
+# Rollups read by the analytics dashboard, filled by analytics.refresh() from the shows added since the watermark.
+# Counts are per month of the show's start time. Venue and artist names are copied so that the dashboard never reads
+# the Venue and Artist tables
+class ShowsByArea(db.Model):
+    __tablename__ = 'ShowsByArea'
+    month = db.Column(db.Date, primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ShowsByGenre(db.Model):
+    __tablename__ = 'ShowsByGenre'
+    month = db.Column(db.Date, primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ShowsByVenue(db.Model):
+    __tablename__ = 'ShowsByVenue'
+    month = db.Column(db.Date, primary_key=True)
+    venue_id = db.Column(db.Integer, primary_key=True, index=True)
+    name = db.Column(db.String, nullable=False)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ShowsByArtist(db.Model):
+    __tablename__ = 'ShowsByArtist'
+    month = db.Column(db.Date, primary_key=True)
+    artist_id = db.Column(db.Integer, primary_key=True, index=True)
+    name = db.Column(db.String, nullable=False)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Progress of the rollups: shows up to last_show_id are counted. The ids of shows committed by transactions still in
+# flight can be lower than ids already visible, so only ids up to safe_show_id (the highest id seen by an earlier
+# refresh at least ANALYTICS_SETTLE_SECONDS ago) are counted
+class AnalyticsWatermark(db.Model):
+    __tablename__ = 'AnalyticsWatermark'
+    name = db.Column(db.String(40), primary_key=True)
+    last_show_id = db.Column(db.Integer, nullable=False, default=0)
+    safe_show_id = db.Column(db.Integer, nullable=False, default=0)
+    horizon_show_id = db.Column(db.Integer, nullable=False, default=0)
+    horizon_seen_at = db.Column(db.DateTime, nullable=True)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+
+
+# Transactional outbox: events are added in the same transaction as the change they describe, then streamed to the
+# pages by the dispatcher and exported to downstream consumers, see outbox.py
+class OutboxEvent(db.Model):
+    __tablename__ = 'OutboxEvent'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    topic = db.Column(db.String(40), nullable=False)
+    venue_id = db.Column(db.Integer, nullable=True, index=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    # Consumers resume after the last id they saw, ids must never be reused
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+# Last event delivered to each export consumer
+class OutboxCursor(db.Model):
+    __tablename__ = 'OutboxCursor'
+    name = db.Column(db.String(40), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Pairs of venues or artists that look like the same one, see dedup.py. entity_id is the older of the two
+class DuplicateCandidate(db.Model):
+    __tablename__ = 'DuplicateCandidate'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    duplicate_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    dismissed = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'entity_id', 'duplicate_id', name='uq_DuplicateCandidate_pair'),
+        db.Index('ix_DuplicateCandidate_kind_duplicate_id', 'kind', 'duplicate_id'),
+    )
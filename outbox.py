@@ -0,0 +1,350 @@
+# ----------------------------------------------------------------------------#
+# Transactional outbox.
+#
+# Handlers that change shows, venues or artists add an OutboxEvent to the same transaction as the change, so an
+# event exists if and only if the change was committed. Two readers consume the events:
+#   - the dispatcher thread of each worker polls new events and fans them out to the Server-Sent Events streams of
+#     /events?venue_id=, which the venue and show pages use to patch themselves instead of reloading. Each stream
+#     buffers at most OUTBOX_SUBSCRIBER_MAX_EVENTS events; a client too slow to keep up is told to reload. A stream
+#     holds a worker thread, so a worker serves at most OUTBOX_MAX_SUBSCRIBERS, fewer than its threads.
+#   - `flask outbox-export` hands the events in order to the registered exporters and only moves the consumer's
+#     cursor once a batch was accepted, so every event is delivered at least once, possibly more than once.
+# Events are kept OUTBOX_RETENTION_DAYS for clients reconnecting to /events, and until every exporter delivered them.
+# The dispatcher of each worker prunes older ones every OUTBOX_PRUNE_INTERVAL seconds, exporter or not: the exporters
+# are known by their OutboxCursor rows, so a worker doesn't need to run one to keep its events.
+# ----------------------------------------------------------------------------#
+
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from datetime import datetime, timedelta
+
+import click
+from flask import Response, current_app, make_response, request
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.orm import Session
+
+from models import db, OutboxEvent, OutboxCursor
+
+RESET = 'reset'
+
+# Set after a commit that added events, so the dispatcher of this worker doesn't wait for its next poll
+wakeup = threading.Event()
+exporters = {}
+
+
+def add(topic, venue_id=None, **payload):
+    # The dispatcher also prunes, so it runs wherever events are written even if no page listens
+    current_app.extensions['outbox_dispatcher'].start()
+    db.session.add(OutboxEvent(topic=topic, venue_id=venue_id, payload=json.dumps(payload, default=str),
+                               created_at=datetime.utcnow()))
+
+
+@sqlalchemy_event.listens_for(Session, 'after_flush')
+def after_flush(session, flush_context):
+    if any(isinstance(instance, OutboxEvent) for instance in session.new):
+        session.info['outbox_events'] = True
+
+
+@sqlalchemy_event.listens_for(Session, 'after_commit')
+def after_commit(session):
+    if session.info.pop('outbox_events', False):
+        wakeup.set()
+
+
+@sqlalchemy_event.listens_for(Session, 'after_rollback')
+def after_rollback(session):
+    session.info.pop('outbox_events', None)
+
+
+def as_dict(event):
+    return dict(json.loads(event.payload), id=event.id, topic=event.topic, venue_id=event.venue_id,
+                created_at=event.created_at.isoformat())
+
+
+class Subscriber:
+    def __init__(self, venue_id, max_events):
+        self.venue_id = venue_id
+        self.events = deque()
+        self.max_events = max_events
+        self.overflowed = False
+        self.condition = threading.Condition()
+
+    def wants(self, event):
+        return self.venue_id is None or event['venue_id'] == self.venue_id
+
+    # Instead of growing without bound, the buffer of a subscriber that falls behind is dropped and the client is
+    # told to reload the page
+    def put(self, event):
+        with self.condition:
+            if len(self.events) >= self.max_events:
+                self.events.clear()
+                self.overflowed = True
+            elif not self.overflowed:
+                self.events.append(event)
+            self.condition.notify()
+
+    # Returns the buffered events, RESET after an overflow, or an empty list when nothing came in within timeout
+    def get(self, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.events or self.overflowed, timeout)
+            if self.overflowed:
+                return RESET
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+
+class Dispatcher:
+    def __init__(self, app):
+        self.app = app
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.last_id = None
+        self.recent = {}
+        self.pid = None
+        self.pruned_at = time.monotonic()
+
+    def subscribe(self, venue_id):
+        config = self.app.config
+        with self.lock:
+            if len(self.subscribers) >= config['OUTBOX_MAX_SUBSCRIBERS']:
+                return None
+            subscriber = Subscriber(venue_id, config['OUTBOX_SUBSCRIBER_MAX_EVENTS'])
+            self.subscribers.add(subscriber)
+        self.start()
+        return subscriber
+
+    # Starts the thread of this worker once
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                threading.Thread(target=self.run, daemon=True).start()
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    # Events committed by slow transactions can have a lower id than events already dispatched, so every poll also
+    # reads the events of the last OUTBOX_SETTLE_SECONDS and skips the ones dispatched before
+    def poll(self):
+        settle = timedelta(seconds=self.app.config['OUTBOX_SETTLE_SECONDS'])
+        cutoff = datetime.utcnow() - settle
+        starting = self.last_id is None
+        if starting:
+            self.last_id = db.session.query(db.func.max(OutboxEvent.id)).scalar() or 0
+        events = OutboxEvent.query.filter(db.or_(OutboxEvent.id > self.last_id, OutboxEvent.created_at >= cutoff))\
+            .order_by(OutboxEvent.id).limit(self.app.config['OUTBOX_POLL_LIMIT']).all()
+        fresh = [as_dict(event) for event in events
+                 if not (starting and event.id <= self.last_id) and event.id not in self.recent]
+        for event in events:
+            self.recent.setdefault(event.id, event.created_at)
+            self.last_id = max(self.last_id, event.id)
+        self.recent = {event_id: created_at for event_id, created_at in self.recent.items()
+                       if created_at >= cutoff - settle}
+        return fresh
+
+    def prune(self):
+        self.pruned_at = time.monotonic()
+        try:
+            with self.app.app_context():
+                prune()
+                db.session.close()
+        except Exception:
+            self.app.logger.exception('Could not prune the outbox')
+
+    def run(self):
+        interval = self.app.config['OUTBOX_POLL_INTERVAL']
+        while True:
+            wakeup.wait(interval)
+            wakeup.clear()
+            if time.monotonic() - self.pruned_at >= self.app.config['OUTBOX_PRUNE_INTERVAL']:
+                self.prune()
+            with self.lock:
+                subscribers = list(self.subscribers)
+            if not subscribers:
+                # Nothing to poll for; the next subscriber starts from the events committed after it connected
+                self.last_id = None
+                continue
+            try:
+                with self.app.app_context():
+                    events = self.poll()
+                    db.session.close()
+            except Exception:
+                self.app.logger.exception('Could not poll the outbox')
+                time.sleep(interval)
+                continue
+            for event in events:
+                for subscriber in subscribers:
+                    if subscriber.wants(event):
+                        subscriber.put(event)
+
+
+def server_sent_event(event):
+    return f"id: {event['id']}\nevent: {event['topic']}\ndata: {json.dumps(event)}\n\n"
+
+
+# Streams the events of one venue, or of every venue without venue_id. A client reconnecting with Last-Event-ID
+# first gets the events it missed, or a reset if there are too many of them
+def events():
+    config = current_app.config
+    venue_id = request.args.get('venue_id', type=int)
+    subscriber = current_app.extensions['outbox_dispatcher'].subscribe(venue_id)
+    # Every open stream holds a thread of the worker; past OUTBOX_MAX_SUBSCRIBERS the page goes without live updates
+    # rather than leave no thread for the other requests. The browser tries again later
+    if subscriber is None:
+        response = make_response('Too many open streams.', 503)
+        response.headers['Retry-After'] = '60'
+        return response
+    backlog = []
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is not None:
+        query = OutboxEvent.query.filter(OutboxEvent.id > last_event_id)
+        if venue_id is not None:
+            query = query.filter(OutboxEvent.venue_id == venue_id)
+        backlog = [as_dict(event) for event in
+                   query.order_by(OutboxEvent.id).limit(config['OUTBOX_SUBSCRIBER_MAX_EVENTS'] + 1).all()]
+        db.session.close()
+    dispatcher = current_app.extensions['outbox_dispatcher']
+    keepalive = config['OUTBOX_KEEPALIVE_SECONDS']
+
+    def stream():
+        try:
+            yield f"retry: {config['OUTBOX_RETRY_MS']}\n\n"
+            if len(backlog) > config['OUTBOX_SUBSCRIBER_MAX_EVENTS']:
+                yield f'event: {RESET}\ndata: {{}}\n\n'
+                return
+            sent = set()
+            for event in backlog:
+                sent.add(event['id'])
+                yield server_sent_event(event)
+            while True:
+                events = subscriber.get(keepalive)
+                if events == RESET:
+                    yield f'event: {RESET}\ndata: {{}}\n\n'
+                    return
+                if not events:
+                    yield ': keepalive\n\n'
+                for event in events:
+                    if event['id'] not in sent:
+                        yield server_sent_event(event)
+        finally:
+            dispatcher.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Registers `function(events)` as the exporter `name`. It gets batches of events in id order and must raise when a
+# batch could not be delivered, which is then retried by the next run
+def exporter(name):
+    def register(function):
+        exporters[name] = function
+        return function
+    return register
+
+
+def webhook(events):
+    config = current_app.config
+    body = json.dumps({'events': events}).encode('utf-8')
+    req = urllib.request.Request(config['OUTBOX_EXPORT_URL'], data=body,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=config['OUTBOX_EXPORT_TIMEOUT']):
+        pass
+
+
+def get_cursor(name):
+    cursor = OutboxCursor.query.get(name)
+    if cursor is None:
+        db.session.add(OutboxCursor(name=name, last_event_id=0))
+        db.session.commit()
+        cursor = OutboxCursor.query.get(name)
+    return cursor
+
+
+# Delivers the events after the cursor of `name`, batch by batch. Only events older than OUTBOX_SETTLE_SECONDS are
+# exported, so that an event committed late with a lower id isn't skipped
+def export(name, batch_size=None):
+    batch_size = batch_size or current_app.config['OUTBOX_EXPORT_BATCH_SIZE']
+    exported = 0
+    while True:
+        last_event_id = get_cursor(name).last_event_id
+        cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['OUTBOX_SETTLE_SECONDS'])
+        batch = [as_dict(event) for event in OutboxEvent.query.filter(OutboxEvent.id > last_event_id)
+                 .filter(OutboxEvent.created_at < cutoff).order_by(OutboxEvent.id).limit(batch_size).all()]
+        db.session.rollback()
+        if not batch:
+            break
+        exporters[name](batch)
+        moved = OutboxCursor.query.filter_by(name=name, last_event_id=last_event_id)\
+            .update({'last_event_id': batch[-1]['id']}, synchronize_session=False)
+        db.session.commit()
+        if not moved:
+            break
+        exported += len(batch)
+    db.session.close()
+    return exported
+
+
+# Deletes the events older than OUTBOX_RETENTION_DAYS that every exporter has delivered: the exporters registered in
+# this process and those with a cursor, which may run elsewhere, e.g. `flask outbox-export` on another box. The cursor
+# of an exporter that is retired must be deleted, or its events are kept
+def prune():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['OUTBOX_RETENTION_DAYS'])
+    query = OutboxEvent.query.filter(OutboxEvent.created_at < cutoff)
+    cursors = dict(db.session.query(OutboxCursor.name, OutboxCursor.last_event_id).all())
+    if exporters or cursors:
+        delivered = min([cursors.get(name, 0) for name in exporters] + list(cursors.values()))
+        query = query.filter(OutboxEvent.id <= delivered)
+    pruned = query.delete(synchronize_session=False)
+    db.session.commit()
+    return pruned
+
+
+def init_app(app):
+    app.config.setdefault('OUTBOX_POLL_INTERVAL', 1.0)
+    app.config.setdefault('OUTBOX_POLL_LIMIT', 500)
+    app.config.setdefault('OUTBOX_SETTLE_SECONDS', 5)
+    app.config.setdefault('OUTBOX_MAX_SUBSCRIBERS', 10)
+    app.config.setdefault('OUTBOX_SUBSCRIBER_MAX_EVENTS', 100)
+    app.config.setdefault('OUTBOX_KEEPALIVE_SECONDS', 15)
+    app.config.setdefault('OUTBOX_RETRY_MS', 3000)
+    app.config.setdefault('OUTBOX_EXPORT_URL', None)
+    app.config.setdefault('OUTBOX_EXPORT_TIMEOUT', 10)
+    app.config.setdefault('OUTBOX_EXPORT_BATCH_SIZE', 500)
+    app.config.setdefault('OUTBOX_RETENTION_DAYS', 7)
+    app.config.setdefault('OUTBOX_PRUNE_INTERVAL', 3600)
+    if app.config['OUTBOX_EXPORT_URL']:
+        exporter('webhook')(webhook)
+    app.extensions['outbox_dispatcher'] = Dispatcher(app)
+    app.add_url_rule('/events', 'events', events)
+
+    @app.cli.command('outbox-export')
+    @click.option('--follow', is_flag=True, help='Keep exporting new events until interrupted.')
+    def outbox_export_command(follow):
+        while True:
+            for name in exporters:
+                try:
+                    exported = export(name)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Could not export the outbox to %s, retrying from the same event', name)
+                    continue
+                if exported:
+                    print(f'Exported {exported} events to {name}')
+            pruned = prune()
+            if pruned:
+                print(f'Pruned {pruned} events')
+            if not follow:
+                break
+            time.sleep(app.config['OUTBOX_POLL_INTERVAL'])
+
+    @app.cli.command('outbox-prune')
+    def outbox_prune_command():
+        print(f'Pruned {prune()} events')
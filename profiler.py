@@ -0,0 +1,323 @@
+# ----------------------------------------------------------------------------#
+# On-demand sampling profiler.
+#
+# An admin (Authorization: Bearer ADMIN_TOKEN) starts a profile for N seconds with POST /admin/profiler, for every
+# request or for a share of the requests to one endpoint. The call writes PROFILER_DIR/active.json, which every worker
+# of the node checks at most once a second while serving requests, so each of them runs the profile: a thread samples
+# the stacks of its threads serving profiled requests every PROFILER_INTERVAL seconds. Samples are counted per route
+# and per activity: SQL (a query is running), Jinja (a template is rendering) or Python. When the profile ends each
+# worker writes its part to PROFILER_DIR/<id>-<pid> as collapsed stacks, one file per route, which flamegraph.pl and
+# speedscope read, and a summary that GET /admin/profiler lists.
+#
+# When no profile runs the cost per request is a clock read in before_request, a stat of active.json once a second,
+# and a global lookup in teardown_request: no thread, no SQL event listener.
+# ----------------------------------------------------------------------------#
+
+import functools
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from flask import abort, current_app, g, jsonify, request, send_from_directory
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTROL_FILE = 'active.json'
+
+active = None
+start_lock = threading.Lock()
+# When this worker last looked at the control file, and the last profile it saw there
+checked_at = 0
+seen = None
+
+
+class Profile:
+    def __init__(self, app, control):
+        self.app = app
+        self.started = datetime.utcnow()
+        self.id = f"{control['id']}-{os.getpid()}"
+        self.control_id = control['id']
+        self.seconds = control['seconds']
+        self.deadline = time.monotonic() + control['ends_at'] - time.time()
+        self.endpoint = control['endpoint']
+        self.rate = control['rate']
+        self.interval = app.config['PROFILER_INTERVAL']
+        self.threads = {}
+        self.in_sql = set()
+        self.requests = Counter()
+        self.stacks = defaultdict(Counter)
+        self.activities = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def wants(self, endpoint):
+        if self.endpoint is not None and endpoint != self.endpoint:
+            return False
+        return self.rate >= 1 or random.random() < self.rate
+
+    def track(self, endpoint):
+        with self.lock:
+            self.threads[threading.get_ident()] = endpoint
+            self.requests[endpoint] += 1
+
+    def untrack(self):
+        with self.lock:
+            self.threads.pop(threading.get_ident(), None)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.in_sql.add(threading.get_ident())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.in_sql.discard(threading.get_ident())
+
+    def handle_error(self, exception_context):
+        self.in_sql.discard(threading.get_ident())
+
+    def listeners(self):
+        return (('before_cursor_execute', self.before_cursor_execute),
+                ('after_cursor_execute', self.after_cursor_execute),
+                ('handle_error', self.handle_error))
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self.lock:
+            threads = list(self.threads.items())
+        for ident, endpoint in threads:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack, rendering = collapse(frame)
+            activity = 'sql' if ident in self.in_sql else 'jinja' if rendering else 'python'
+            if activity == 'sql':
+                stack.append('[sql]')
+            self.stacks[endpoint][';'.join(stack)] += 1
+            self.activities[endpoint][activity] += 1
+
+    def run(self):
+        global active
+        for name, listener in self.listeners():
+            event.listen(Engine, name, listener)
+        try:
+            while time.monotonic() < self.deadline:
+                time.sleep(self.interval)
+                self.sample()
+        except Exception:
+            self.app.logger.exception('Profile %s failed', self.id)
+        finally:
+            active = None
+            for name, listener in self.listeners():
+                event.remove(Engine, name, listener)
+        try:
+            self.save()
+        except Exception:
+            self.app.logger.exception('Could not save profile %s', self.id)
+
+    def summary(self):
+        routes = {}
+        # Copies, the sampler may be adding routes
+        for endpoint, activities in list(self.activities.items()):
+            activities = activities.copy()
+            samples = sum(activities.values())
+            routes[endpoint] = dict({activity: round(activities[activity] / samples, 3)
+                                     for activity in ('python', 'sql', 'jinja')},
+                                    requests=self.requests[endpoint], samples=samples,
+                                    sampled_ms=round(samples * self.interval * 1000))
+        return {'id': self.id, 'pid': os.getpid(), 'started': self.started.isoformat(), 'seconds': self.seconds,
+                'endpoint': self.endpoint, 'rate': self.rate, 'interval': self.interval, 'routes': routes}
+
+    def save(self):
+        directory = os.path.join(self.app.config['PROFILER_DIR'], self.id)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'all.collapsed'), 'w') as all_routes:
+            for endpoint, stacks in self.stacks.items():
+                with open(os.path.join(directory, f'{endpoint}.collapsed'), 'w') as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f'{stack} {count}\n')
+                        all_routes.write(f'{endpoint};{stack} {count}\n')
+        with open(os.path.join(directory, 'summary.json'), 'w') as f:
+            json.dump(self.summary(), f)
+
+
+def frame_name(code):
+    parts = code.co_filename.replace('\\', '/').split('/')
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+# The stack of `frame` from the Flask dispatch down, as frame names, and whether a template is rendering. Compiled
+# templates keep the template path as file name
+def collapse(frame):
+    stack = []
+    rendering = False
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.endswith('.html') or '/jinja2/' in code.co_filename:
+            rendering = True
+        stack.append(frame_name(code))
+        if code.co_name == 'full_dispatch_request':
+            break
+        frame = frame.f_back
+    stack.reverse()
+    return stack, rendering
+
+
+def read_control(directory):
+    try:
+        with open(os.path.join(directory, CONTROL_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_control(directory, control):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, CONTROL_FILE)
+    with open(f'{path}.{os.getpid()}.tmp', 'w') as f:
+        json.dump(control, f)
+    os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+
+# Starts the profile of the control file in this worker if it hasn't run it yet, and stops it early when the file says
+# so. `control` is None when the file doesn't exist
+def follow(app, control):
+    global active, seen
+    if control is None:
+        return
+    with start_lock:
+        profile = active
+        if profile is not None and profile.control_id == control['id']:
+            if control['ends_at'] <= time.time():
+                profile.deadline = 0
+            return
+        if control['id'] == seen or control['ends_at'] <= time.time() or profile is not None:
+            return
+        seen = control['id']
+        profile = Profile(app, control)
+        active = profile
+    threading.Thread(target=profile.run, daemon=True).start()
+
+
+def check_control():
+    global checked_at
+    now = time.monotonic()
+    if now - checked_at < 1:
+        return
+    checked_at = now
+    directory = current_app.config['PROFILER_DIR']
+    if os.path.exists(os.path.join(directory, CONTROL_FILE)):
+        follow(current_app._get_current_object(), read_control(directory))
+
+
+def start_request():
+    check_control()
+    profile = active
+    # Requests matching no route (404) have no endpoint to file their samples under
+    if profile is not None and request.endpoint is not None and profile.wants(request.endpoint):
+        profile.track(request.endpoint)
+        g.profile = profile
+
+
+def end_request(error=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.untrack()
+
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config['ADMIN_TOKEN']
+        if not token:
+            abort(404)
+        scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8')):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def saved_profiles(directory, limit):
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True)[:limit]:
+        path = os.path.join(directory, name, 'summary.json')
+        if os.path.isfile(path):
+            with open(path) as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+# `running` is the profile of the control file while it runs, `worker` the part of it this worker samples so far
+@admin_required
+def status():
+    control = read_control(current_app.config['PROFILER_DIR'])
+    profile = active
+    return jsonify({
+        'running': control if control is not None and control['ends_at'] > time.time() else None,
+        'worker': profile.summary() if profile is not None else None,
+        'profiles': saved_profiles(current_app.config['PROFILER_DIR'], 20),
+    })
+
+
+# seconds (required), endpoint (e.g. venues.show_venue, all endpoints without it) and percent of its requests
+@admin_required
+def start():
+    config = current_app.config
+    seconds = request.values.get('seconds', type=float)
+    percent = request.values.get('percent', 100, type=float)
+    endpoint = request.values.get('endpoint') or None
+    if not seconds or not 0 < seconds <= config['PROFILER_MAX_SECONDS'] or not 0 < percent <= 100:
+        abort(400)
+    if endpoint is not None and endpoint not in current_app.view_functions:
+        abort(400)
+    directory = current_app.config['PROFILER_DIR']
+    with start_lock:
+        control = read_control(directory)
+        if active is not None or control is not None and control['ends_at'] > time.time():
+            abort(409)
+        control = {'id': f'{datetime.utcnow():%Y%m%d-%H%M%S}', 'started': datetime.utcnow().isoformat(),
+                   'seconds': seconds, 'ends_at': time.time() + seconds, 'endpoint': endpoint, 'rate': percent / 100}
+        write_control(directory, control)
+    follow(current_app._get_current_object(), control)
+    return jsonify(control), 202
+
+
+# The other workers stop within a second, when they next read the control file
+@admin_required
+def stop():
+    directory = current_app.config['PROFILER_DIR']
+    with start_lock:
+        control = read_control(directory)
+        if control is None or control['ends_at'] <= time.time():
+            abort(404)
+        control['ends_at'] = time.time()
+        write_control(directory, control)
+    follow(current_app._get_current_object(), control)
+    return jsonify({'id': control['id']})
+
+
+@admin_required
+def download(profile_id, filename):
+    if not re.fullmatch(r'[\w-]+', profile_id) or not filename.endswith('.collapsed'):
+        abort(404)
+    return send_from_directory(os.path.join(current_app.config['PROFILER_DIR'], profile_id), filename,
+                               mimetype='text/plain', as_attachment=True)
+
+
+def init_app(app):
+    app.config.setdefault('ADMIN_TOKEN', None)
+    app.config.setdefault('PROFILER_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('PROFILER_INTERVAL', 0.005)
+    app.config.setdefault('PROFILER_MAX_SECONDS', 300)
+    app.before_request(start_request)
+    app.teardown_request(end_request)
+    app.add_url_rule('/admin/profiler', 'profiler_status', status, methods=['GET'])
+    app.add_url_rule('/admin/profiler', 'profiler_start', start, methods=['POST'])
+    app.add_url_rule('/admin/profiler', 'profiler_stop', stop, methods=['DELETE'])
+    app.add_url_rule('/admin/profiler/<profile_id>/<filename>', 'profiler_download', download)
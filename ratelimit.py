@@ -0,0 +1,244 @@
+# ----------------------------------------------------------------------------#
+# Rate and concurrency limits.
+#
+# Every request takes tokens from two token buckets: one per client (its address) and one shared by all clients.
+# An endpoint costs RATELIMIT_COSTS[endpoint] tokens, 1 by default, so the searches and listings that scan whole
+# tables drain a bucket faster than cheap pages. An empty bucket answers 429 with Retry-After. Buckets live in the
+# worker's memory, or in Redis with RATELIMIT_BACKEND = 'redis' so that the limits hold across workers and nodes.
+#
+# Requests costing at least RATELIMIT_CONCURRENCY_MIN_COST also need one of RATELIMIT_MAX_CONCURRENT slots of the
+# worker, sized to its database pool. When they are all busy a request waits in a queue of at most
+# RATELIMIT_MAX_QUEUE; a request that finds the queue full, or that waits longer than RATELIMIT_QUEUE_TIMEOUT, is
+# shed with 503 instead of piling up behind the pool. The counts of allowed, throttled and shed requests are served
+# to admins at /admin/ratelimit.
+# ----------------------------------------------------------------------------#
+
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import current_app, g, jsonify, make_response, request
+
+from profiler import admin_required
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Listings embed one /img request per venue or artist: counting them would throttle the thumbnails of a single page
+EXEMPT_ENDPOINTS = {'static', 'asset', 'image'}
+
+
+class LocalBackend:
+    def __init__(self, max_keys):
+        self.buckets = OrderedDict()
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    # Takes `cost` tokens from the bucket `key` if it has them. Returns 0, or how many seconds until it would
+    def take(self, key, rate, burst, cost):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            # The least recently seen clients are forgotten first, which is the same as giving them a full bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+    # Puts back tokens taken for a request that another bucket rejected. Above the burst, the next take caps them
+    def refund(self, key, rate, burst, cost):
+        self.take(key, rate, burst, -cost)
+
+
+class RedisBackend:
+    # Same computation as LocalBackend.take, run atomically by Redis
+    SCRIPT = '''
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+'''
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+        self.script = self.redis.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, cost):
+        return float(self.script(keys=[f'ratelimit:{key}'], args=[rate, burst, time.time(), cost]))
+
+    def refund(self, key, rate, burst, cost):
+        self.take(key, rate, burst, -cost)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    # Returns None once a slot is taken, or why the request is shed: 'queue_full' or 'timeout'
+    def acquire(self, timeout):
+        with self.condition:
+            if self.active < self.limit:
+                self.active += 1
+                return None
+            if self.waiting >= self.max_queue:
+                return 'queue_full'
+            self.waiting += 1
+            try:
+                acquired = self.condition.wait_for(lambda: self.active < self.limit, timeout)
+            finally:
+                self.waiting -= 1
+            if not acquired:
+                return 'timeout'
+            self.active += 1
+            return None
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+
+class Metrics:
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, *key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+        totals, by_endpoint = Counter(), {}
+        for (outcome, reason, endpoint), count in counts.items():
+            totals[f'{outcome}.{reason}'] += count
+            by_endpoint.setdefault(endpoint, Counter())[f'{outcome}.{reason}'] += count
+        return {'totals': totals, 'endpoints': by_endpoint}
+
+
+# Behind RATELIMIT_TRUST_PROXY proxies, each appending the address it got the request from to X-Forwarded-For, the
+# client is the entry that many hops from the right: the entries left of it are whatever the client sent. As with
+# ProxyFix, a header with fewer entries than proxies didn't come through them and is ignored
+def client_key():
+    hops = int(current_app.config['RATELIMIT_TRUST_PROXY'])
+    if hops and 'X-Forwarded-For' in request.headers:
+        route = request.access_route
+        if len(route) >= hops:
+            return route[-hops]
+    return request.remote_addr or 'unknown'
+
+
+def rejected(status, retry_after, message):
+    response = make_response(message, status)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def check_request():
+    endpoint = request.endpoint
+    config = current_app.config
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+    state = current_app.extensions['ratelimit']
+    cost = config['RATELIMIT_COSTS'].get(endpoint, 1)
+    buckets = (
+        ('client', f'client:{client_key()}', config['RATELIMIT_CLIENT_RATE'], config['RATELIMIT_CLIENT_BURST']),
+        ('global', 'global', config['RATELIMIT_GLOBAL_RATE'], config['RATELIMIT_GLOBAL_BURST']),
+    )
+    taken = []
+    for scope, key, rate, burst in buckets:
+        try:
+            wait = state['backend'].take(key, rate, burst, min(cost, burst))
+            # Rejected by the site-wide bucket: the request doesn't count against the client
+            if wait:
+                for taken_key, taken_rate, taken_burst in taken:
+                    state['backend'].refund(taken_key, taken_rate, taken_burst, min(cost, taken_burst))
+        except Exception:
+            # A rate limiter that is down must not take the site down with it
+            current_app.logger.exception('Rate limit backend failed, letting the request through')
+            break
+        if wait:
+            state['metrics'].add('throttled', scope, endpoint)
+            return rejected(429, wait, 'Too many requests, please retry later.')
+        taken.append((key, rate, burst))
+
+    if cost >= config['RATELIMIT_CONCURRENCY_MIN_COST']:
+        shed = state['limiter'].acquire(config['RATELIMIT_QUEUE_TIMEOUT'])
+        if shed:
+            state['metrics'].add('shed', shed, endpoint)
+            return rejected(503, config['RATELIMIT_SHED_RETRY_AFTER'], 'The server is busy, please retry later.')
+        g.concurrency_slot = True
+    state['metrics'].add('allowed', 'ok', endpoint)
+    return None
+
+
+def release_slot(error=None):
+    if g.pop('concurrency_slot', False):
+        current_app.extensions['ratelimit']['limiter'].release()
+
+
+# Admins only, and rate limited like any other page: the counts would tell a client how close it is to the limits
+@admin_required
+def ratelimit_metrics():
+    state = current_app.extensions['ratelimit']
+    limiter = state['limiter']
+    return jsonify(dict(state['metrics'].snapshot(), backend=current_app.config['RATELIMIT_BACKEND'],
+                        active=limiter.active, waiting=limiter.waiting))
+
+
+def init_app(app):
+    app.config.setdefault('RATELIMIT_ENABLED', True)
+    app.config.setdefault('RATELIMIT_BACKEND', 'local')
+    app.config.setdefault('RATELIMIT_REDIS_URL', 'redis://localhost:6379/1')
+    app.config.setdefault('RATELIMIT_TRUST_PROXY', 0)
+    app.config.setdefault('RATELIMIT_MAX_CLIENTS', 100000)
+    app.config.setdefault('RATELIMIT_CLIENT_RATE', 10.0)
+    app.config.setdefault('RATELIMIT_CLIENT_BURST', 50)
+    app.config.setdefault('RATELIMIT_GLOBAL_RATE', 200.0)
+    app.config.setdefault('RATELIMIT_GLOBAL_BURST', 500)
+    app.config.setdefault('RATELIMIT_COSTS', {})
+    app.config.setdefault('RATELIMIT_CONCURRENCY_MIN_COST', 2)
+    app.config.setdefault('RATELIMIT_MAX_CONCURRENT', 15)
+    app.config.setdefault('RATELIMIT_MAX_QUEUE', 30)
+    app.config.setdefault('RATELIMIT_QUEUE_TIMEOUT', 2.0)
+    app.config.setdefault('RATELIMIT_SHED_RETRY_AFTER', 1)
+    if not app.config['RATELIMIT_ENABLED']:
+        return
+    if app.config['RATELIMIT_BACKEND'] == 'redis':
+        if redis is None:
+            raise RuntimeError("RATELIMIT_BACKEND = 'redis' needs the redis package")
+        backend = RedisBackend(app.config['RATELIMIT_REDIS_URL'])
+    else:
+        backend = LocalBackend(app.config['RATELIMIT_MAX_CLIENTS'])
+    app.extensions['ratelimit'] = {
+        'backend': backend,
+        'limiter': ConcurrencyLimiter(app.config['RATELIMIT_MAX_CONCURRENT'], app.config['RATELIMIT_MAX_QUEUE']),
+        'metrics': Metrics(),
+    }
+    app.before_request(check_request)
+    app.teardown_request(release_slot)
+    app.add_url_rule('/admin/ratelimit', 'ratelimit_metrics', ratelimit_metrics)
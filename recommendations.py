@@ -0,0 +1,185 @@
+# ----------------------------------------------------------------------------#
+# Artist - venue matchmaking.
+#
+# Venues seeking talent and artists seeking venues are turned into feature matrices (L2 normalised genre vectors
+# plus city and state codes). Scores of every pair are computed block by block with matrix products and the top
+# RECOMMENDATIONS_PER_ENTITY matches of each side are stored in the Recommendation table, so the detail pages only
+# run one indexed lookup. Editing an entity refreshes its own matches and the lists of the other side it can enter
+# or leave, instead of recomputing every pair: each worker keeps the matrices and only reads the edited row again,
+# the whole matrices are reloaded every RECOMMENDATION_RELOAD_SECONDS to pick up the edits of the other workers.
+# A worker finding the table empty, on a new deploy, fills it in the background. The NumPy side lives in matching.py
+# and is imported on first use.
+# ----------------------------------------------------------------------------#
+
+import threading
+import time
+
+from flask import current_app
+
+from models import db, Venue, Artist, Recommendation
+from signals import entity_changed
+
+VENUE = 'venue'
+ARTIST = 'artist'
+OTHER = {VENUE: ARTIST, ARTIST: VENUE}
+# Columns the matches depend on, edits of other columns don't trigger a refresh
+MATCHED_FIELDS = {'genres', 'city', 'state', 'seeking_talent', 'seeking_venue'}
+
+MODELS = {VENUE: Venue, ARTIST: Artist}
+refresh_lock = threading.Lock()
+
+
+def seeking_rows(kind, entity_id=None):
+    model = MODELS[kind]
+    seeking = model.seeking_talent if kind == VENUE else model.seeking_venue
+    query = model.query.with_entities(model.id, model.genres, model.city, model.state)\
+        .filter(seeking.is_(True)).filter(model.deleted_at.is_(None))
+    if entity_id is not None:
+        query = query.filter(model.id == entity_id)
+    return query.order_by(model.id).all()
+
+
+def load():
+    import matching
+    venues, artists = matching.build_features(seeking_rows(VENUE), seeking_rows(ARTIST))
+    db.session.close()
+    features = {VENUE: venues, ARTIST: artists}
+    current_app.extensions['recommendations'].update(features=features, loaded_at=time.monotonic())
+    return features
+
+
+# The matrices of this worker with the row of the entity that changed read again
+def cached_features(kind, entity_id):
+    state = current_app.extensions['recommendations']
+    features = state['features']
+    if features is None or time.monotonic() - state['loaded_at'] > current_app.config['RECOMMENDATION_RELOAD_SECONDS']:
+        return load()
+    rows = seeking_rows(kind, entity_id)
+    if not features[kind].set_row(entity_id, rows[0] if rows else None):
+        return load()
+    return features
+
+
+# Score of the last of the k matches of each of `source_ids`, through the (source, source_id, rank) index. Lists
+# with fewer matches aren't returned: any positive score enters them
+def weakest_scores(kind, source_ids, k):
+    weakest = {}
+    for start in range(0, len(source_ids), 500):
+        weakest.update(db.session.query(Recommendation.source_id, Recommendation.score)
+                       .filter(Recommendation.source == kind).filter(Recommendation.rank == k - 1)
+                       .filter(Recommendation.source_id.in_(source_ids[start:start + 500])).all())
+    return weakest
+
+
+def refresh_all():
+    import matching
+    features = load()
+    mappings = matching.matches(VENUE, features[VENUE], features[ARTIST]) + \
+        matching.matches(ARTIST, features[ARTIST], features[VENUE])
+    if db.engine.dialect.name == 'postgresql':
+        # Two workers seeding at the same time would otherwise both insert; SQLite already has a single writer
+        db.session.execute('LOCK TABLE "Recommendation" IN SHARE ROW EXCLUSIVE MODE')
+    Recommendation.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(Recommendation, mappings)
+    db.session.commit()
+    return len(mappings)
+
+
+# Refreshes the matches of one venue or artist after it was created, edited or deleted. Besides its own list, only
+# the lists of the other side that contain it or whose weakest match it now beats are recomputed
+def refresh(kind, entity_id):
+    import matching
+    k = current_app.config['RECOMMENDATIONS_PER_ENTITY']
+    entity_id = int(entity_id)
+    features = cached_features(kind, entity_id)
+    sources, targets = features[kind], features[OTHER[kind]]
+
+    Recommendation.query.filter_by(source=kind, source_id=entity_id).delete(synchronize_session=False)
+    position = matching.positions(sources, [entity_id])
+    affected = {row.source_id for row in Recommendation.query.with_entities(Recommendation.source_id)
+                .filter_by(source=OTHER[kind], target_id=entity_id)}
+    if len(position):
+        entity = sources.take(position)
+        db.session.bulk_insert_mappings(Recommendation, matching.matches(kind, entity, targets))
+        entity_scores = {int(target_id): round(float(value), 6)
+                         for target_id, value in zip(targets.ids, matching.score(targets, entity)[:, 0]) if value > 0}
+        weakest = weakest_scores(OTHER[kind], list(entity_scores), k)
+        # A tie with the weakest match may win it, on the lower id
+        affected.update(target_id for target_id, value in entity_scores.items() if value >= weakest.get(target_id, 0))
+
+    if affected:
+        Recommendation.query.filter(Recommendation.source == OTHER[kind])\
+            .filter(Recommendation.source_id.in_(affected)).delete(synchronize_session=False)
+        positions = matching.positions(targets, affected)
+        db.session.bulk_insert_mappings(Recommendation, matching.matches(OTHER[kind], targets.take(positions), sources))
+    db.session.commit()
+
+
+def run_refresh(app, kind, entity_id):
+    with app.app_context(), refresh_lock:
+        try:
+            refresh(kind, entity_id)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Could not refresh recommendations of %s %s', kind, entity_id)
+        finally:
+            db.session.close()
+
+
+# Refreshes in a daemon thread so that create and edit requests don't wait for it
+def start_refresh(kind, entity_id):
+    app = current_app._get_current_object()
+    threading.Thread(target=run_refresh, args=(app, kind, entity_id), daemon=True).start()
+
+
+def run_refresh_all(app):
+    with app.app_context(), refresh_lock:
+        try:
+            refresh_all()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Could not compute the recommendations')
+        finally:
+            db.session.close()
+
+
+# The table is empty after a deploy until someone runs `flask recommendations-refresh`. The first read of each worker
+# checks, and fills it in the background if needed
+def seed():
+    state = current_app.extensions['recommendations']
+    if state['seed_checked']:
+        return
+    state['seed_checked'] = True
+    if Recommendation.query.with_entities(Recommendation.id).first() is None:
+        app = current_app._get_current_object()
+        threading.Thread(target=run_refresh_all, args=(app,), daemon=True).start()
+
+
+def on_entity_changed(app, kind, entity_id, fields):
+    if fields is None or fields & MATCHED_FIELDS:
+        start_refresh(kind, entity_id)
+
+
+# Targets deleted since the list was computed are left out, the background refresh may not have removed them yet
+def suggestions(kind, entity_id):
+    seed()
+    target = MODELS[OTHER[kind]]
+    return Recommendation.query.with_entities(target.id, target.name, target.city, target.state,
+                                              Recommendation.score)\
+        .join(target, target.id == Recommendation.target_id).filter(target.deleted_at.is_(None))\
+        .filter(Recommendation.source == kind).filter(Recommendation.source_id == entity_id)\
+        .order_by(Recommendation.rank).all()
+
+
+def init_app(app):
+    app.config.setdefault('RECOMMENDATIONS_PER_ENTITY', 6)
+    app.config.setdefault('RECOMMENDATION_GENRE_WEIGHT', 1.0)
+    app.config.setdefault('RECOMMENDATION_CITY_WEIGHT', 0.6)
+    app.config.setdefault('RECOMMENDATION_STATE_WEIGHT', 0.3)
+    app.config.setdefault('RECOMMENDATION_RELOAD_SECONDS', 300)
+    app.extensions['recommendations'] = {'features': None, 'loaded_at': 0, 'seed_checked': False}
+    entity_changed.connect(on_entity_changed, app)
+
+    @app.cli.command('recommendations-refresh')
+    def recommendations_refresh_command():
+        print(f'Stored {refresh_all()} recommendations')
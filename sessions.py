@@ -0,0 +1,221 @@
+# ----------------------------------------------------------------------------#
+# Sessions shared by every worker.
+#
+# Sessions are signed with SECRET_KEY and still verified with the keys listed in SECRET_KEY_FALLBACKS, so a key can
+# be rotated without logging everybody out. With SESSION_BACKEND = 'database' or 'redis' the cookie only carries a
+# signed session id and the (JSON) session data is kept server side until it expires.
+# ----------------------------------------------------------------------------#
+
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, SessionInterface
+from itsdangerous import BadSignature, Signer, URLSafeTimedSerializer
+
+from models import db, ServerSession
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def verification_keys(app):
+    return [app.secret_key] + list(app.config['SECRET_KEY_FALLBACKS'])
+
+
+# Reads the shared key from a file created by the first worker that starts, used when SECRET_KEY isn't set in the
+# environment. All the workers of a node then sign with the same key; set SECRET_KEY when running several nodes.
+# The key is written to a temporary file first and linked into place, so no worker ever reads a partial key
+def load_or_create_key(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(tmp)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class RotatingCookieSessionInterface(SecureCookieSessionInterface):
+    def serializer_for_key(self, key):
+        return URLSafeTimedSerializer(key, salt=self.salt, serializer=self.serializer, signer_kwargs=dict(
+            key_derivation=self.key_derivation, digest_method=self.digest_method
+        ))
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        value = request.cookies.get(app.session_cookie_name)
+        if not value:
+            return self.session_class()
+        max_age = int(app.permanent_session_lifetime.total_seconds())
+        for key in verification_keys(app):
+            try:
+                return self.session_class(self.serializer_for_key(key).loads(value, max_age=max_age))
+            except BadSignature:
+                continue
+        return self.session_class()
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+
+
+class DatabaseStore:
+    def __init__(self, db, model):
+        self.db = db
+        self.table = model.__table__
+
+    # Session writes use their own connection, so they never commit work pending in the request's ORM session
+    def load(self, sid):
+        with self.db.engine.connect() as connection:
+            return connection.execute(
+                self.db.select([self.table.c.data])
+                .where(self.table.c.id == sid).where(self.table.c.expires_at > datetime.utcnow())
+            ).scalar()
+
+    def save(self, sid, data, expires_at):
+        with self.db.engine.begin() as connection:
+            updated = connection.execute(
+                self.table.update().where(self.table.c.id == sid).values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                connection.execute(self.table.insert().values(id=sid, data=data, expires_at=expires_at))
+
+    def touch(self, sid, expires_at):
+        with self.db.engine.begin() as connection:
+            connection.execute(self.table.update().where(self.table.c.id == sid).values(expires_at=expires_at))
+
+    def delete(self, sid):
+        with self.db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.id == sid))
+
+    # Deletes expired sessions in batches, returns how many were deleted
+    def sweep(self, batch_size=1000):
+        swept = 0
+        while True:
+            with self.db.engine.begin() as connection:
+                expired = self.db.select([self.table.c.id]).where(self.table.c.expires_at <= datetime.utcnow())\
+                    .limit(batch_size)
+                deleted = connection.execute(self.table.delete().where(self.table.c.id.in_(expired))).rowcount
+            swept += deleted
+            if deleted < batch_size:
+                return swept
+
+
+class RedisStore:
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    @staticmethod
+    def key(sid):
+        return f'session:{sid}'
+
+    def load(self, sid):
+        return self.redis.get(self.key(sid))
+
+    def save(self, sid, data, expires_at):
+        self.redis.set(self.key(sid), data, ex=max(int((expires_at - datetime.utcnow()).total_seconds()), 1))
+
+    def touch(self, sid, expires_at):
+        self.redis.expireat(self.key(sid), expires_at)
+
+    def delete(self, sid):
+        self.redis.delete(self.key(sid))
+
+    # Redis expires the keys by itself
+    def sweep(self, batch_size=1000):
+        return 0
+
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    salt = 'server-side-session'
+
+    def __init__(self, store):
+        self.store = store
+
+    def signer(self, key):
+        return Signer(key, salt=self.salt, key_derivation='hmac')
+
+    def unsign(self, app, value):
+        for key in verification_keys(app):
+            try:
+                return self.signer(key).unsign(value).decode('ascii')
+            except BadSignature:
+                continue
+        return None
+
+    def open_session(self, app, request):
+        value = request.cookies.get(app.session_cookie_name)
+        sid = self.unsign(app, value) if value else None
+        if sid:
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession(sid=os.urandom(24).hex(), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+        if session.accessed:
+            response.vary.add('Cookie')
+        expires_at = datetime.utcnow() + app.permanent_session_lifetime
+        if session.modified:
+            self.store.save(session.sid, self.serializer.dumps(dict(session)).encode('utf-8'), expires_at)
+        elif not self.should_set_cookie(app, session):
+            return
+        else:
+            self.store.touch(session.sid, expires_at)
+        if random.random() < app.config['SESSION_SWEEP_PROBABILITY']:
+            self.store.sweep()
+        response.set_cookie(
+            app.session_cookie_name,
+            self.signer(app.secret_key).sign(session.sid.encode('ascii')).decode('ascii'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_app(app):
+    app.config.setdefault('SECRET_KEY_FALLBACKS', [])
+    app.config.setdefault('SESSION_BACKEND', 'cookie')
+    app.config.setdefault('SESSION_SWEEP_PROBABILITY', 0.01)
+    app.config.setdefault('PERMANENT_SESSION_LIFETIME', timedelta(days=31))
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'database':
+        app.session_interface = ServerSideSessionInterface(DatabaseStore(db, ServerSession))
+    elif backend == 'redis':
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND = 'redis' needs the redis package")
+        app.session_interface = ServerSideSessionInterface(RedisStore(app.config['SESSION_REDIS_URL']))
+    else:
+        app.session_interface = RotatingCookieSessionInterface()
+
+    @app.cli.command('sessions-sweep')
+    def sessions_sweep_command():
+        interface = app.session_interface
+        swept = interface.store.sweep() if isinstance(interface, ServerSideSessionInterface) else 0
+        print(f'Deleted {swept} expired sessions')
@@ -0,0 +1,12 @@
+# ----------------------------------------------------------------------------#
+# Application signals.
+# ----------------------------------------------------------------------------#
+
+from flask.signals import Namespace
+
+fyyur_signals = Namespace()
+
+# Sent after a venue or an artist was committed, with kind ('venue' or 'artist'), entity_id and fields: the set of
+# columns that changed, or None when the entity was created or deleted. Creating a show sends {'shows'} for both its
+# venue and its artist. Derived data (recommendations, autocomplete index...) subscribes to refresh only what it needs
+entity_changed = fyyur_signals.signal('entity-changed')
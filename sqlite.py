@@ -0,0 +1,110 @@
+# ----------------------------------------------------------------------------#
+# SQLite backend.
+#
+# With a sqlite:/// SQLALCHEMY_DATABASE_URI the app runs on a single file, for small sites hosted on one box.
+# Connections are pooled and set up with SQLITE_PRAGMAS: WAL journal, so that readers never wait for the writer,
+# synchronous=NORMAL, a memory mapped file and a larger page cache. SQLite allows one writer at a time and makes the
+# others retry until busy_timeout, so the handlers that write wait for their turn in a FIFO queue of the worker
+# instead (see serialized_write); the busy timeout only arbitrates between workers.
+# ----------------------------------------------------------------------------#
+
+import functools
+import threading
+from collections import deque
+
+from flask import abort, current_app
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+
+class WriteQueue:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = deque()
+        self.busy = False
+
+    # Writers get the database in arrival order. Returns False if the turn didn't come within timeout
+    def acquire(self, timeout):
+        with self.lock:
+            if not self.busy:
+                self.busy = True
+                return True
+            waiter = threading.Event()
+            self.waiters.append(waiter)
+        if waiter.wait(timeout):
+            return True
+        with self.lock:
+            # The turn may have been handed over between the timeout and taking the lock
+            if waiter.is_set():
+                return True
+            self.waiters.remove(waiter)
+            return False
+
+    # Hands the turn to the next writer, if any, without letting a newcomer cut in
+    def release(self):
+        with self.lock:
+            if self.waiters:
+                self.waiters.popleft().set()
+            else:
+                self.busy = False
+
+
+def is_sqlite(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+
+
+# Runs the view once the other writes of this worker are done. Does nothing on other databases
+def serialized_write(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        queue = current_app.extensions.get('sqlite_write_queue')
+        if queue is None:
+            return view(*args, **kwargs)
+        if not queue.acquire(current_app.config['SQLITE_WRITE_TIMEOUT']):
+            current_app.logger.warning('Timed out waiting for the SQLite write queue')
+            abort(503)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            queue.release()
+    return wrapper
+
+
+def unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+# Sets the pragmas, and replaces SQLite's lower(), which only folds ASCII letters, with Python's so that the
+# searches (ilike becomes lower() LIKE lower() on SQLite) match accented names as they do on Postgres
+def setup_connection(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+        dbapi_connection.create_function('lower', 1, unicode_lower, deterministic=True)
+    return on_connect
+
+
+def init_app(app):
+    app.config.setdefault('SQLITE_PRAGMAS', {})
+    app.config.setdefault('SQLITE_POOL_SIZE', 10)
+    app.config.setdefault('SQLITE_WRITE_QUEUE', True)
+    app.config.setdefault('SQLITE_WRITE_TIMEOUT', 10)
+    if not is_sqlite(app):
+        return
+    # Without a pool every checkout would open the file again and lose the page cache and the memory map.
+    # check_same_thread is off because pooled connections move between the request threads. An in-memory
+    # database keeps Flask-SQLAlchemy's single connection
+    if app.config['SQLALCHEMY_DATABASE_URI'] not in ('sqlite://', 'sqlite:///:memory:'):
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        options.setdefault('poolclass', QueuePool)
+        options.setdefault('pool_size', app.config['SQLITE_POOL_SIZE'])
+        options.setdefault('connect_args', {}).setdefault('check_same_thread', False)
+    # Only the connections of the app get the pragmas, migrations run with foreign keys off as alembic's batch
+    # mode needs when it copies a table
+    event.listen(db.get_engine(app), 'connect', setup_connection(app.config['SQLITE_PRAGMAS']))
+    if app.config['SQLITE_WRITE_QUEUE']:
+        app.extensions['sqlite_write_queue'] = WriteQueue()
@@ -0,0 +1,42 @@
+const typeaheadInputs = document.querySelectorAll('input.typeahead');
+typeaheadInputs.forEach(function (input) {
+    const list = document.getElementById(input.getAttribute('list'));
+    const target = document.getElementById(input.dataset['target']);
+    let matches = {};
+    let timer = null;
+
+    function label(match) {
+        return match['name'] + ' (' + match['city'] + ', ' + match['state'] + ')';
+    }
+
+    function lookup() {
+        const query = input.value;
+        fetch('/api/autocomplete?kind=' + input.dataset['kind'] + '&q=' + encodeURIComponent(query))
+            .then(function (response) {
+                return response.json();
+            }).then(function (jsonResponse) {
+                if (input.value !== query) {
+                    return;
+                }
+                matches = {};
+                list.innerHTML = '';
+                jsonResponse['data'].forEach(function (match) {
+                    const option = document.createElement('option');
+                    option.value = label(match);
+                    matches[option.value] = match['id'];
+                    list.appendChild(option);
+                });
+            }).catch(function () {
+                console.log('Error');
+            });
+    }
+
+    input.addEventListener('input', function () {
+        if (matches[input.value] !== undefined) {
+            target.value = matches[input.value];
+            return;
+        }
+        clearTimeout(timer);
+        timer = setTimeout(lookup, 100);
+    });
+});
@@ -47,3 +47,23 @@ if (checkBx) {
 
 
 
+const deleteArtistBtn = document.getElementById('delete-artist');
+if(deleteArtistBtn) {
+    deleteArtistBtn.onclick = function(e) {
+        const artistId = e.target.dataset['id'];
+        fetch('/artists/' + artistId, {
+            method: 'DELETE'
+        }).then(function (response) {
+            return response.json();
+        }).then(function (jsonResponse) {
+            if(jsonResponse['success']) {
+                document.location.href="/artists";
+            } else {
+                document.location.href="/artists/"+artistId;
+            }
+        }).catch(function() {
+            console.log('Error');
+            document.location.href="/artists/"+artistId;
+        });
+    }
+}
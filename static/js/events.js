@@ -0,0 +1,100 @@
+// Pages with a [data-events] element listen to the outbox stream and add new shows without reloading
+const eventsTarget = document.querySelector('[data-events]');
+if (eventsTarget && window.EventSource) {
+    function link(href, text) {
+        const a = document.createElement('a');
+        a.href = href;
+        a.textContent = text;
+        return a;
+    }
+
+    function heading(tag, child) {
+        const h = document.createElement(tag);
+        h.appendChild(child);
+        return h;
+    }
+
+    // start_time is a naive UTC timestamp such as '2035-04-01 20:00:00', which some browsers don't parse and others
+    // read as local time
+    function startDate(show) {
+        return new Date(show['start_time'].replace(' ', 'T') + 'Z');
+    }
+
+    // Same markup as the tiles rendered by shows.html and show_venue.html
+    function showTile(show) {
+        const column = document.createElement('div');
+        column.className = 'col-sm-4';
+        const tile = document.createElement('div');
+        tile.className = 'tile tile-show';
+        const img = document.createElement('img');
+        img.alt = 'Artist Image';
+        if (show['artist_image_link']) {
+            img.src = '/img/artist/' + show['artist_id'] + '/thumb';
+        }
+        tile.appendChild(img);
+        const startTime = document.createTextNode(startDate(show).toLocaleString());
+        const artist = link('/artists/' + show['artist_id'], show['artist_name']);
+        if (eventsTarget.dataset['tile'] === 'show') {
+            tile.appendChild(heading('h4', startTime));
+            tile.appendChild(heading('h5', artist));
+            tile.appendChild(heading('p', document.createTextNode('playing at')));
+            tile.appendChild(heading('h5', link('/venues/' + show['venue_id'], show['venue_name'])));
+        } else {
+            tile.appendChild(heading('h5', artist));
+            tile.appendChild(heading('h6', startTime));
+        }
+        column.appendChild(tile);
+        return column;
+    }
+
+    function isUpcoming(show) {
+        return startDate(show) > new Date();
+    }
+
+    function listen(source) {
+        source.addEventListener('show.created', function (e) {
+            const show = JSON.parse(e.data);
+            // The venue page only lists upcoming shows
+            if (eventsTarget.dataset['tile'] === 'artist' && !isUpcoming(show)) {
+                return;
+            }
+            eventsTarget.insertBefore(showTile(show), eventsTarget.firstChild);
+            const count = document.querySelector('[data-count]');
+            if (count) {
+                count.textContent = parseInt(count.textContent, 10) + 1;
+            }
+        });
+        source.addEventListener('venue.updated', function (e) {
+            const fields = JSON.parse(e.data)['fields'];
+            Object.keys(fields).forEach(function (field) {
+                document.querySelectorAll('[data-field="' + field + '"]').forEach(function (element) {
+                    element.textContent = fields[field];
+                });
+            });
+        });
+        // Only the venue page subscribes to a single venue
+        source.addEventListener('venue.deleted', function () {
+            if (eventsTarget.dataset['tile'] === 'artist') {
+                source.close();
+                document.location.href = '/venues';
+            }
+        });
+        // The stream fell too far behind, reload to get a consistent page
+        source.addEventListener('reset', function () {
+            source.close();
+            document.location.reload();
+        });
+        // The browser gives up on a refused stream (503 when the worker has no stream to spare): try again later
+        source.addEventListener('error', function () {
+            if (source.readyState === EventSource.CLOSED) {
+                setTimeout(connect, 30000 + Math.random() * 30000);
+            }
+        });
+    }
+
+    function connect() {
+        listen(new EventSource(eventsTarget.dataset['events']));
+    }
+
+    connect();
+}
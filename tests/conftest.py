@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------#
+# Fixtures: an app on a SQLite file of its own per test, with the caches, logs and profiles in the test's tmp_path.
+# ----------------------------------------------------------------------------#
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import autocomplete  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, Venue, Artist  # noqa: E402
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "fyyur.db"}',
+        'SECRET_KEY': 'test',
+        'WTF_CSRF_ENABLED': False,
+        'RATELIMIT_ENABLED': False,
+        'JINJA_CACHE_DIR': None,
+        'IMAGE_CACHE_DIR': str(tmp_path / 'image-cache'),
+        'LOG_FILE': str(tmp_path / 'logs' / 'fyyur.log'),
+        'PROFILER_DIR': str(tmp_path / 'profiles'),
+        'OUTBOX_EXPORT_URL': None,
+        'ADMIN_TOKEN': None,
+    }
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    yield app
+    # The autocomplete indexes are kept by the module, for every app of the process
+    autocomplete.indexes.clear()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_venue(**fields):
+    venue = Venue(**dict(dict(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street',
+                              phone='123-123-1234', genres='Jazz,Reggae'), **fields))
+    db.session.add(venue)
+    db.session.commit()
+    return venue.id
+
+
+def add_artist(**fields):
+    artist = Artist(**dict(dict(name='Guns N Petals', city='San Francisco', state='CA', phone='326-123-5000',
+                                genres='Rock n Roll'), **fields))
+    db.session.add(artist)
+    db.session.commit()
+    return artist.id
+
+
+# For the work done by background threads after the response
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
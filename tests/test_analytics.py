@@ -0,0 +1,81 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+import analytics
+from conftest import add_venue, add_artist, wait_for
+from models import db, Show, ShowsByArea, ShowsByGenre, ShowsByVenue, ShowsByArtist
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, ANALYTICS_SETTLE_SECONDS=0)
+
+
+def add_shows(venue_id, artist_id, *start_times):
+    db.session.add_all(Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time)
+                       for start_time in start_times)
+    db.session.commit()
+
+
+def venue_rollup():
+    return [(row.month.month, row.name, row.shows) for row in ShowsByVenue.query.order_by(ShowsByVenue.month)]
+
+
+def test_counts_settled_shows_once(app):
+    with app.app_context():
+        venue_id, artist_id = add_venue(), add_artist(genres='Jazz,Folk')
+        add_shows(venue_id, artist_id, datetime(2030, 1, 5), datetime(2030, 1, 20), datetime(2030, 2, 1))
+        # The first refresh only sees where the ids stand, the shows are counted by the next one
+        assert analytics.refresh() == 0
+        assert analytics.refresh(batch_size=2) == 3
+        assert analytics.refresh() == 0
+
+        assert venue_rollup() == [(1, 'The Musical Hop', 2), (2, 'The Musical Hop', 1)]
+        assert sorted((row.month.month, row.genre, row.shows) for row in ShowsByGenre.query) == \
+            [(1, 'Folk', 2), (1, 'Jazz', 2), (2, 'Folk', 1), (2, 'Jazz', 1)]
+        assert [(row.city, row.shows) for row in ShowsByArea.query.order_by(ShowsByArea.month)] == \
+            [('San Francisco', 2), ('San Francisco', 1)]
+        assert sum(row.shows for row in ShowsByArtist.query) == 3
+
+
+def test_renames_and_deletes_reach_the_rollups_after_the_response(app, client):
+    with app.app_context():
+        venue_id, artist_id = add_venue(), add_artist()
+        add_shows(venue_id, artist_id, datetime(2030, 1, 5))
+        analytics.refresh()
+        analytics.refresh()
+
+    client.post(f'/venues/{venue_id}/edit', data=dict(
+        name='The Musical Hop Club', address='1015 Folsom Street', city='San Francisco', state='CA',
+        phone='123-123-1234', genres='Jazz', version=1, original='{"name": "The Musical Hop"}'))
+    with app.app_context():
+        wait_for(lambda: db.session.query(ShowsByVenue.name).scalar() == 'The Musical Hop Club')
+        db.session.remove()
+
+    client.delete(f'/venues/{venue_id}')
+    with app.app_context():
+        wait_for(lambda: ShowsByVenue.query.count() == 0)
+        # Still counted by area
+        assert ShowsByArea.query.one().shows == 1
+
+
+def test_dashboard(app, client):
+    with app.app_context():
+        add_shows(add_venue(), add_artist(), datetime.utcnow())
+        analytics.refresh()
+        analytics.refresh()
+    response = client.get('/analytics?months=3')
+    assert response.status_code == 200
+    assert b'The Musical Hop' in response.data
+
+
+def test_sync_runs_off_the_request_thread(app, client, monkeypatch):
+    threads = []
+    monkeypatch.setattr(analytics, 'sync_entity', lambda kind, entity_id: threads.append(threading.current_thread()))
+    with app.app_context():
+        venue_id = add_venue()
+    client.delete(f'/venues/{venue_id}')
+    wait_for(lambda: threads)
+    assert threads[0] is not threading.current_thread()
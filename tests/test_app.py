@@ -0,0 +1,41 @@
+import os
+
+from app import create_app, format_datetime, warm_up
+
+
+def test_each_app_is_configured_on_its_own(config):
+    first = create_app(dict(config, PAST_SHOWS_PER_PAGE=5))
+    second = create_app(config)
+    assert (first.config['PAST_SHOWS_PER_PAGE'], second.config['PAST_SHOWS_PER_PAGE']) == (5, 12)
+    assert set(first.blueprints) == {'main', 'venues', 'artists', 'shows'}
+    assert first.url_map.bind('localhost').match('/venues/3') == ('venues.show_venue', {'venue_id': 3})
+
+
+def test_pages_and_errors_render(client):
+    assert client.get('/').status_code == 200
+    for path in ('/venues', '/artists', '/shows'):
+        assert client.get(path).status_code == 200
+    response = client.get('/venues/12345')
+    assert response.status_code == 404
+    assert b"There's nothing here!" in response.data
+
+
+def test_format_datetime():
+    assert format_datetime('2035-04-01T20:00:00', 'full') == 'Sunday April, 1, 2035 at 8:00PM'
+    assert format_datetime('2035-04-01T20:00:00') == 'Sun 04, 01, 2035 8:00PM'
+
+
+def test_warm_up_compiles_to_the_shared_cache(tmp_path, config):
+    cache_dir = str(tmp_path / 'jinja-cache')
+    app = create_app(dict(config, JINJA_CACHE_DIR=cache_dir))
+    templates, connections = warm_up(app)
+    assert templates == len(app.jinja_env.list_templates(extensions=['html']))
+    assert connections >= 1
+    assert len(os.listdir(cache_dir)) == templates
+
+    # A new worker loads the compiled templates instead of compiling them again
+    compiled = create_app(dict(config, JINJA_CACHE_DIR=cache_dir)).jinja_env
+    compile_calls = []
+    compiled.compile = lambda *args, **kwargs: compile_calls.append(args)
+    compiled.get_template('pages/home.html')
+    assert compile_calls == []
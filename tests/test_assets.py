@@ -0,0 +1,68 @@
+import gzip
+import hashlib
+import json
+import os
+
+import pytest
+
+import assets
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'css' / 'main.css').write_text('/* layout */\nbody {\n  color: red;\n}\n')
+    (tmp_path / 'js' / 'lib.min.js').write_text('var a=1;// kept')
+    (tmp_path / 'js' / 'site.js').write_text('// comment\n    var b = 2;\n\n')
+    monkeypatch.setattr(assets, 'BUNDLES', {'main.css': ['css/main.css'], 'site.js': ['js/lib.min.js', 'js/site.js']})
+    return tmp_path
+
+
+def test_minify():
+    assert assets.minify_css('/* x */ a , b { color: red ; }\n') == 'a,b{color:red}'
+    assert assets.minify_js('// x\n  if (a) {\n    b();  // c\n  }\n') == 'if (a) {\nb();  // c\n}'
+
+
+def test_bundles_are_named_after_their_content(static):
+    built = assets.build(str(static))
+    dist = static / assets.DIST_FOLDER
+    content = (dist / built['main.css']).read_bytes()
+    assert content == b'body{color:red}'
+    assert built['main.css'] == f'main.{hashlib.sha256(content).hexdigest()[:12]}.css'
+    assert gzip.decompress((dist / (built['main.css'] + '.gz')).read_bytes()) == content
+    assert (dist / built['site.js']).read_text() == 'var a=1;// kept\n;\nvar b = 2;'
+    assert json.loads((dist / assets.MANIFEST).read_text()) == built
+
+    (static / 'css' / 'main.css').write_text('body { color: blue }')
+    rebuilt = assets.build(str(static))
+    assert rebuilt['main.css'] != built['main.css']
+    assert rebuilt['site.js'] == built['site.js']
+    # Pages cached with the old name can still load it
+    assert (dist / built['main.css']).exists()
+
+
+def test_sources_changed(static, monkeypatch):
+    monkeypatch.setattr(assets, 'manifest', {})
+    assert assets.sources_changed(str(static))
+    assets.manifest.update(assets.build(str(static)))
+    assert not assets.sources_changed(str(static))
+    source = static / 'js' / 'site.js'
+    built_at = os.path.getmtime(static / assets.DIST_FOLDER / assets.manifest['site.js'])
+    os.utime(source, (built_at + 10, built_at + 10))
+    assert assets.sources_changed(str(static))
+
+
+def test_bundles_are_served_precompressed_and_immutable(app, client):
+    with app.test_request_context():
+        url = assets.asset_url('main.css')
+    assert url in client.get('/').get_data(as_text=True)
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Content-Type'].startswith('text/css')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert gzip.decompress(response.data) == plain.data
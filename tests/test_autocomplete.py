@@ -0,0 +1,104 @@
+import queue
+import random
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import autocomplete
+from conftest import add_venue, add_artist, wait_for
+from models import db, Show
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, AUTOCOMPLETE_CACHE_MIN_KEYS=5)
+
+
+def names(client, query, kind='venue', limit=10):
+    response = client.get('/api/autocomplete', query_string={'kind': kind, 'q': query, 'limit': limit})
+    return [match['name'] for match in response.get_json()['data']]
+
+
+def test_ranks_every_match_by_shows(app, client):
+    with app.app_context():
+        for i in range(20):
+            add_venue(name=f'Hall {i:02}')
+        popular = add_venue(name='Hz Club')
+        artist_id = add_artist()
+        db.session.add_all(Show(venue_id=popular, artist_id=artist_id, start_time=datetime(2030, 1, day))
+                           for day in range(1, 4))
+        db.session.commit()
+    # Last of the matching keys in alphabetical order, first by shows
+    assert names(client, 'h', limit=3) == ['Hz Club', 'Hall 00', 'Hall 01']
+    assert names(client, 'H')[0] == 'Hz Club'
+
+
+def test_names_starting_with_the_query_come_first(app, client):
+    with app.app_context():
+        add_venue(name='The Blue Note')
+        add_venue(name='Blues Alley')
+    assert names(client, 'blue') == ['Blues Alley', 'The Blue Note']
+    assert names(client, 'note') == ['The Blue Note']
+    assert names(client, ' ') == []
+
+
+def test_index_follows_edits_after_the_response(app, client, monkeypatch):
+    # The updater thread is started once per process, for the app of the first change: start one for this app
+    monkeypatch.setattr(autocomplete, 'pending', queue.Queue())
+    monkeypatch.setattr(autocomplete, 'updater_pid', None)
+    with app.app_context():
+        venue_id = add_venue(name='Hall')
+    assert names(client, 'ha') == ['Hall']
+
+    client.post('/venues/create', data=dict(name='Harbor Room', address='1 Pier', city='Oakland', state='CA',
+                                            phone='510-555-0100', genres='Jazz', image_link='', facebook_link='',
+                                            website='', seeking_description=''))
+    wait_for(lambda: names(client, 'ha') == ['Hall', 'Harbor Room'])
+    client.delete(f'/venues/{venue_id}')
+    wait_for(lambda: names(client, 'ha') == ['Harbor Room'])
+
+
+def test_bad_requests(client):
+    assert client.get('/api/autocomplete?kind=show&q=a').status_code == 400
+
+
+def test_cached_rankings_stay_exact_through_edits():
+    rng = random.Random(7)
+    words = ['ash', 'ashes', 'bar', 'barn', 'blue', 'blues', 'note', 'the']
+
+    def entity(entity_id):
+        name = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        return dict(id=entity_id, name=name, city='', state='', shows=rng.randint(0, 5))
+    index = autocomplete.PrefixIndex(cache_min_keys=5)
+    index.load({entity_id: entity(entity_id) for entity_id in range(300)})
+    assert index.top
+    for _ in range(500):
+        if rng.random() < 0.2:
+            index.remove(rng.randrange(300))
+        else:
+            index.upsert(entity(rng.randrange(320)))
+        for prefix in ('a', 'b', 'bl', 'blue', 'n', 't'):
+            found = [match['id'] for match in index.search(prefix, autocomplete.MAX_LIMIT)]
+            start, end = autocomplete.key_range(index.keys, prefix)
+            expected = autocomplete.ranking(index.keys, index.entities, prefix, start, end, autocomplete.MAX_LIMIT)
+            assert found == [entity_id for rank, entity_id in expected]
+
+
+class Stop(Exception):
+    pass
+
+
+def test_listener_closes_its_connection_before_reconnecting(app, monkeypatch):
+    connection = SimpleNamespace(closed=False, detach=lambda: None)
+    connection.connection = connection
+    connection.cursor = lambda: SimpleNamespace(execute=lambda statement: (_ for _ in ()).throw(OSError('gone')))
+    connection.close = lambda: setattr(connection, 'closed', True)
+    monkeypatch.setattr(autocomplete, 'db', SimpleNamespace(engine=SimpleNamespace(raw_connection=lambda: connection)))
+
+    def sleep(seconds):
+        raise Stop()
+    monkeypatch.setattr(autocomplete.time, 'sleep', sleep)
+    with pytest.raises(Stop):
+        autocomplete.listen(app)
+    assert connection.closed
@@ -0,0 +1,79 @@
+import gzip
+import io
+import json
+
+import pytest
+from flask import Response, jsonify
+
+import compress
+
+PAGE = 'x' * 4000
+
+
+@pytest.fixture
+def app(app):
+    @app.route('/test/page')
+    def page():
+        response = Response(PAGE, mimetype='text/html')
+        response.set_etag('page')
+        return response
+
+    @app.route('/test/small')
+    def small():
+        return jsonify(data='x')
+
+    @app.route('/test/stream')
+    def stream():
+        return Response((f'line {i}\n' for i in range(3)), mimetype='text/plain')
+
+    @app.route('/test/events')
+    def event_stream():
+        return Response(iter(['data: x\n\n']), mimetype='text/event-stream')
+    return app
+
+
+def test_best_accepted_encoding_is_used(app, client):
+    response = client.get('/test/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode() == PAGE
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == 'W/"page"'
+
+    expected = app.extensions['compress_encodings'][0]
+    response = client.get('/test/page', headers={'Accept-Encoding': 'gzip, br, zstd'})
+    assert response.headers['Content-Encoding'] == expected
+
+
+def test_uncompressed_responses(client):
+    response = client.get('/test/page')
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert 'Content-Encoding' not in client.get('/test/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/test/events', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_streams_are_compressed_chunk_by_chunk(client):
+    response = client.get('/test/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data) == b'line 0\nline 1\nline 2\n'
+
+    chunks = compress.compress_stream(iter([b'a' * 100, b'b' * 100]), None, 'gzip', 6)
+    first = next(chunks)
+    # Each chunk is flushed: what was sent so far decompresses without the end of the stream
+    assert gzip.GzipFile(fileobj=io.BytesIO(first)).read1() == b'a' * 100
+
+
+@pytest.mark.parametrize('encoding', ['zstd', 'br', 'gzip'])
+def test_every_encoding_round_trips(encoding):
+    if encoding not in compress.available_encodings([encoding]):
+        pytest.skip(f'{encoding} is not installed')
+    data = json.dumps({'data': list(range(1000))}).encode()
+    compressed = compress.compress(data, encoding, 3)
+    assert len(compressed) < len(data)
+    if encoding == 'gzip':
+        assert gzip.decompress(compressed) == data
+    elif encoding == 'br':
+        assert compress.brotli.decompress(compressed) == data
+    else:
+        assert compress.zstandard.ZstdDecompressor().decompressobj().decompress(compressed) == data
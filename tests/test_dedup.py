@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import dedup
+from conftest import add_venue, add_artist
+from models import db, Venue, Show, DuplicateCandidate
+
+
+def venue_form(**fields):
+    return dict(dict(name='The Musical Hop', address='1015 Folsom Street', city='San Francisco', state='CA',
+                     phone='123-123-1234', genres='Jazz', image_link='', facebook_link='', website='',
+                     seeking_description=''), **fields)
+
+
+def record(name, city='San Francisco', phone='', address=''):
+    return dedup.prepare(Venue(id=0, name=name, city=city, state='CA', phone=phone, address=address))
+
+
+def test_score_ignores_case_accents_stopwords_and_abbreviations():
+    left = record('The Musical Hop', phone='+1 (123) 123-1234', address='1015 Folsom Street')
+    right = record('musical  HÓP', phone='123.123.1234', address='1015 folsom st')
+    assert dedup.score('venue', left, right) == 1.0
+
+
+def test_score_of_different_entities():
+    left = record('The Musical Hop', phone='123-123-1234')
+    assert dedup.score('venue', left, record('Park Square Live Music', phone='914-003-1132')) < 0.5
+    # Same name in another city, with no other field to compare
+    assert dedup.score('venue', left, record('The Musical Hop', city='Oakland')) < 0.85
+
+
+def test_finds_phone_numbers_written_differently(app):
+    with app.app_context():
+        existing = add_venue(name='Blue Note', city='New York', phone='(555) 123-4567')
+        new = Venue(name='The Blue Note', city='Brooklyn', state='CA', address='', phone='555-123-4567')
+        duplicates = dedup.find_duplicates('venue', new)
+    assert [duplicate_id for duplicate_id, score in duplicates] == [existing]
+
+
+def test_new_duplicates_are_created_and_flagged(app, client):
+    with app.app_context():
+        existing = add_venue()
+    response = client.post('/venues/create', data=venue_form(name='Musical Hop', phone='(123) 123-1234'),
+                           follow_redirects=True)
+    assert b'flagged for review' in response.data
+    with app.app_context():
+        assert Venue.query.count() == 2
+        pair = DuplicateCandidate.query.one()
+        assert (pair.kind, pair.entity_id, pair.dismissed) == ('venue', existing, False)
+        assert pair.duplicate_id == Venue.query.filter(Venue.id != existing).one().id
+
+
+def test_unrelated_entities_are_not_flagged(app, client):
+    with app.app_context():
+        add_venue()
+    client.post('/venues/create', data=venue_form(name='Park Square Live Music', phone='914-003-1132'))
+    with app.app_context():
+        assert Venue.query.count() == 2
+        assert DuplicateCandidate.query.count() == 0
+
+
+def test_edited_phone_is_matched_by_its_digits(app, client):
+    with app.app_context():
+        venue_id = add_venue(phone='914-003-1132')
+    client.post(f'/venues/{venue_id}/edit', data=venue_form(phone='+1 (415) 555-0199', version=1, original='{}'))
+    with app.app_context():
+        assert Venue.query.get(venue_id).phone_digits == '4155550199'
+
+
+def test_scan_records_each_pair_once(app):
+    with app.app_context():
+        first = add_venue()
+        second = add_venue(name='Musical Hop')
+        add_venue(name='Park Square Live Music', phone='914-003-1132')
+        assert dedup.scan('venue') == 1
+        assert dedup.scan('venue') == 0
+        dedup.dismiss('venue', second, first)
+        # A dismissed pair isn't flagged again
+        assert dedup.scan('venue') == 0
+        pair = DuplicateCandidate.query.one()
+        assert (pair.entity_id, pair.duplicate_id, pair.dismissed) == (first, second, True)
+
+
+def test_merge_moves_the_shows(app):
+    with app.app_context():
+        keep = add_venue()
+        duplicate = add_venue(name='Musical Hop')
+        artist_id = add_artist()
+        db.session.add(Show(venue_id=duplicate, artist_id=artist_id, start_time=datetime(2030, 1, 1)))
+        db.session.commit()
+        dedup.scan('venue')
+
+        assert dedup.merge('venue', keep, duplicate) == 1
+        assert Show.query.one().venue_id == keep
+        assert Venue.query.get(duplicate).deleted_at is not None
+        assert DuplicateCandidate.query.count() == 0
@@ -0,0 +1,77 @@
+import json
+
+from conftest import add_venue, add_artist
+from models import db, Venue, Artist, OutboxEvent
+from views.helpers import VENUE_FIELDS, ARTIST_FIELDS
+
+
+def edit_form(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    with client.application.app_context():
+        entity = (Venue if 'venues' in path else Artist).query.get(int(path.split('/')[2]))
+        fields = VENUE_FIELDS if 'venues' in path else ARTIST_FIELDS
+        original = {field: getattr(entity, field) for field in fields}
+        data = dict(original, version=entity.version, original=json.dumps(original), genres=entity.genres.split(','))
+    # As a browser submits it: checked boxes as 'y', unchecked ones and empty fields left out
+    return {field: 'y' if value is True else value for field, value in data.items() if value not in (None, False)}
+
+
+def test_updates_only_the_changed_fields(app, client):
+    with app.app_context():
+        venue_id = add_venue()
+    form = edit_form(client, f'/venues/{venue_id}/edit')
+    # Somebody else changes the phone in between, without bumping the version: only the name is written
+    with app.app_context():
+        Venue.query.filter_by(id=venue_id).update({'phone': '415-000-0000'})
+        db.session.commit()
+    response = client.post(f'/venues/{venue_id}/edit', data=dict(form, name='The Musical Hop II'))
+    assert response.status_code == 302
+    with app.app_context():
+        venue = Venue.query.get(venue_id)
+        assert (venue.name, venue.phone, venue.version) == ('The Musical Hop II', '415-000-0000', 2)
+        event = OutboxEvent.query.one()
+        assert (event.topic, event.venue_id) == ('venue.updated', venue_id)
+        assert json.loads(event.payload)['fields'] == {'name': 'The Musical Hop II'}
+
+
+def test_stale_version_is_a_conflict(app, client):
+    with app.app_context():
+        artist_id = add_artist()
+    form = edit_form(client, f'/artists/{artist_id}/edit')
+    assert client.post(f'/artists/{artist_id}/edit', data=dict(form, city='Oakland')).status_code == 302
+
+    response = client.post(f'/artists/{artist_id}/edit', data=dict(form, name='Guns N Roses'))
+    assert response.status_code == 409
+    assert b'Somebody else updated this artist' in response.data
+    with app.app_context():
+        artist = Artist.query.get(artist_id)
+        assert (artist.name, artist.city, artist.version) == ('Guns N Petals', 'Oakland', 2)
+        assert OutboxEvent.query.count() == 1
+
+
+def test_phone_change_updates_its_digits(app, client):
+    with app.app_context():
+        artist_id = add_artist()
+    form = edit_form(client, f'/artists/{artist_id}/edit')
+    client.post(f'/artists/{artist_id}/edit', data=dict(form, phone='(510) 555-0100'))
+    with app.app_context():
+        assert Artist.query.get(artist_id).phone_digits == '5105550100'
+
+
+def test_unchanged_submission_writes_nothing(app, client):
+    with app.app_context():
+        venue_id = add_venue()
+    form = edit_form(client, f'/venues/{venue_id}/edit')
+    assert client.post(f'/venues/{venue_id}/edit', data=form).status_code == 302
+    with app.app_context():
+        assert Venue.query.get(venue_id).version == 1
+        assert OutboxEvent.query.count() == 0
+
+
+def test_conflict_on_a_deleted_entity_is_not_found(app, client):
+    with app.app_context():
+        venue_id = add_venue()
+    form = edit_form(client, f'/venues/{venue_id}/edit')
+    client.delete(f'/venues/{venue_id}')
+    assert client.post(f'/venues/{venue_id}/edit', data=dict(form, name='Gone')).status_code == 404
@@ -0,0 +1,130 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+import images
+from conftest import add_venue
+from models import db, Venue
+
+
+# Stand-in for the third party hosts of image_link, serving one 800x600 PNG and counting the requests
+@pytest.fixture
+def image_server():
+    output = io.BytesIO()
+    Image.new('RGB', (800, 600), 'red').save(output, 'PNG')
+    png = output.getvalue()
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(png)))
+            self.end_headers()
+            self.wfile.write(png)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}', requests
+    server.shutdown()
+    server.server_close()
+
+
+# The stand-in server listens on the loopback, which the proxy refuses to fetch from
+@pytest.fixture
+def allow_loopback(monkeypatch):
+    monkeypatch.setattr(images, 'check_address', lambda address: None)
+
+
+def venue_with_image(app, link):
+    with app.app_context():
+        return add_venue(image_link=link)
+
+
+def test_resizes_and_caches_variants(app, client, image_server, allow_loopback):
+    base, requests = image_server
+    venue_id = venue_with_image(app, f'{base}/hall.png')
+
+    response = client.get(f'/img/venue/{venue_id}/thumb', headers={'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert Image.open(io.BytesIO(response.data)).size == (320, 240)
+    assert 'Accept' in response.headers['Vary']
+
+    response = client.get(f'/img/venue/{venue_id}/card', headers={'Accept': 'image/*'})
+    assert response.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(response.data)).size == (640, 480)
+    # The original was fetched once, for both variants
+    assert requests == ['/hall.png']
+
+
+def test_page_links_change_with_image_link(app, client, image_server, allow_loopback):
+    base, requests = image_server
+    venue_id = venue_with_image(app, f'{base}/old.png')
+    with app.test_request_context():
+        old_url = images.image_url('venue', venue_id, 'card', f'{base}/old.png')
+    assert old_url.encode() in client.get(f'/venues/{venue_id}').data
+
+    response = client.get(old_url)
+    assert response.cache_control.max_age == app.config['IMAGE_MAX_AGE']
+    assert response.cache_control.public
+
+    with app.app_context():
+        Venue.query.get(venue_id).image_link = f'{base}/new.png'
+        db.session.commit()
+    page = client.get(f'/venues/{venue_id}').data
+    assert old_url.encode() not in page
+    with app.test_request_context():
+        assert images.image_url('venue', venue_id, 'card', f'{base}/new.png').encode() in page
+
+    # The old URL now serves the new image, and doesn't let it be cached
+    response = client.get(old_url)
+    assert response.status_code == 200
+    assert response.cache_control.max_age == 0
+    assert requests == ['/old.png', '/new.png']
+
+
+def test_unversioned_urls_are_revalidated(app, client, image_server, allow_loopback):
+    base, requests = image_server
+    venue_id = venue_with_image(app, f'{base}/hall.png')
+
+    response = client.get(f'/img/venue/{venue_id}/thumb')
+    assert response.cache_control.max_age == 0
+    etag = response.headers['ETag']
+    # The ETag doesn't change when the cached file is read again
+    response = client.get(f'/img/venue/{venue_id}/thumb', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_decompression_bomb_is_a_bad_gateway(app, client, image_server, allow_loopback, monkeypatch):
+    base, requests = image_server
+    venue_id = venue_with_image(app, f'{base}/bomb.png')
+    # 800x600 is more than twice this, Pillow refuses to open it
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+
+    assert client.get(f'/img/venue/{venue_id}/thumb').status_code == 502
+
+
+def test_private_addresses_are_not_fetched(app, client, image_server):
+    base, requests = image_server
+    venue_id = venue_with_image(app, f'{base}/hall.png')
+
+    assert client.get(f'/img/venue/{venue_id}/thumb').status_code == 502
+    assert requests == []
+    # The failure is remembered for IMAGE_FAILURE_TTL
+    assert client.get(f'/img/venue/{venue_id}/thumb').status_code == 502
+
+
+def test_unknown_images(app, client):
+    venue_id = venue_with_image(app, None)
+
+    assert client.get(f'/img/venue/{venue_id}/thumb').status_code == 404
+    assert client.get(f'/img/venue/{venue_id}/huge').status_code == 404
+    assert client.get(f'/img/show/{venue_id}/thumb').status_code == 404
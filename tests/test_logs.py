@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+from logging.handlers import WatchedFileHandler
+
+import pytest
+
+import logs
+
+
+# Every access record is kept
+@pytest.fixture
+def config(config):
+    return dict(config, LOG_SAMPLE_RATES={})
+
+
+def read_records(app):
+    handler = app.extensions['log_handler']
+    handler.stop()
+    with open(handler.handler.baseFilename) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_json_with_the_request_context(app, client):
+    @app.route('/boom')
+    def boom():
+        try:
+            raise ValueError('bad value')
+        except ValueError:
+            app.logger.exception('Could not do it')
+        return 'ok'
+
+    client.get('/boom', headers={'X-Request-ID': 'abc123'})
+    records = read_records(app)
+    error = next(record for record in records if record['level'] == 'ERROR')
+    assert error['message'] == 'Could not do it'
+    assert (error['request_id'], error['route'], error['method']) == ('abc123', 'boom', 'GET')
+    assert 'ValueError: bad value' in error['exception']
+    access = next(record for record in records if record['logger'] == 'app.access')
+    assert access['status'] == 200
+    assert access['latency_ms'] >= 0 and access['db_ms'] >= 0
+
+
+def test_each_process_rotates_a_file_of_its_own(app, config):
+    root, extension = os.path.splitext(config['LOG_FILE'])
+    assert logs.log_path(app.config) == f'{root}.{os.getpid()}{extension}'
+    app.logger.warning('written')
+    assert read_records(app)[0]['message'] == 'written'
+
+
+def test_external_rotation_shares_one_file(config):
+    external = dict(config, LOG_ROTATION='external')
+    assert logs.log_path(external) == config['LOG_FILE']
+    handler = logs.file_handler(external)
+    assert isinstance(handler, WatchedFileHandler)
+    handler.close()
+
+
+def test_sampling_keeps_warnings():
+    sampling = logs.SamplingFilter({'app.access': 0.0})
+
+    def record(name, level):
+        return logging.makeLogRecord({'name': name, 'levelno': level})
+    assert not sampling.filter(record('app.access', logging.INFO))
+    assert sampling.filter(record('app.access', logging.WARNING))
+    assert sampling.filter(record('app', logging.INFO))
+
+
+def test_full_queue_drops_records(config):
+    handler = logs.AsyncHandler(config, max_size=1)
+    # Started, but its listener doesn't run: the queue stays full
+    handler.pid = os.getpid()
+    for i in range(3):
+        handler.emit(logging.makeLogRecord({'msg': f'record {i}'}))
+    assert handler.dropped == 2
@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import outbox
+from conftest import add_venue, add_artist
+from models import db, OutboxEvent, OutboxCursor
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, OUTBOX_SETTLE_SECONDS=0, OUTBOX_RETENTION_DAYS=7)
+
+
+def add_events(app, count, age_days=0):
+    with app.test_request_context():
+        for i in range(count):
+            outbox.add('venue.updated', venue_id=1, fields={'name': f'Hall {i}'})
+        db.session.commit()
+        OutboxEvent.query.update({'created_at': datetime.utcnow() - timedelta(days=age_days, seconds=1)})
+        db.session.commit()
+
+
+def test_events_are_added_with_the_change(app, client):
+    with app.app_context():
+        venue_id, artist_id = add_venue(), add_artist()
+    client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+                                       'start_time': '2035-04-01 20:00:00'})
+    with app.app_context():
+        event = OutboxEvent.query.one()
+        payload = json.loads(event.payload)
+    assert (event.topic, event.venue_id) == ('show.created', venue_id)
+    # Read by static/js/events.js as a UTC timestamp
+    assert payload['start_time'] == '2035-04-01 20:00:00'
+    assert payload['venue_name'] == 'The Musical Hop'
+
+
+def test_export_delivers_in_order_and_moves_the_cursor(app, monkeypatch):
+    batches = []
+    monkeypatch.setitem(outbox.exporters, 'test', batches.append)
+    add_events(app, 5)
+    with app.app_context():
+        assert outbox.export('test', batch_size=2) == 5
+        assert [[event['fields']['name'] for event in batch] for batch in batches] == \
+            [['Hall 0', 'Hall 1'], ['Hall 2', 'Hall 3'], ['Hall 4']]
+        assert outbox.export('test') == 0
+        assert OutboxCursor.query.get('test').last_event_id == OutboxEvent.query.order_by(OutboxEvent.id.desc())\
+            .first().id
+
+
+def test_failed_batches_are_delivered_again(app, monkeypatch):
+    def failing(events):
+        raise OSError('down')
+    monkeypatch.setitem(outbox.exporters, 'test', failing)
+    add_events(app, 2)
+    with app.app_context():
+        with pytest.raises(OSError):
+            outbox.export('test')
+        batches = []
+        monkeypatch.setitem(outbox.exporters, 'test', batches.append)
+        assert outbox.export('test') == 2
+
+
+def test_prune_without_exporters(app):
+    add_events(app, 3, age_days=8)
+    with app.app_context():
+        assert outbox.prune() == 3
+
+
+def test_prune_keeps_what_an_exporter_elsewhere_has_not_delivered(app):
+    add_events(app, 4, age_days=8)
+    with app.app_context():
+        ids = [event.id for event in OutboxEvent.query.order_by(OutboxEvent.id)]
+        # Cursor of `flask outbox-export` run by another process, with no exporter registered in this one
+        db.session.add(OutboxCursor(name='webhook', last_event_id=ids[1]))
+        db.session.commit()
+        assert outbox.prune() == 2
+        assert [event.id for event in OutboxEvent.query.order_by(OutboxEvent.id)] == ids[2:]
+
+
+def test_prune_keeps_recent_events(app):
+    add_events(app, 2, age_days=1)
+    with app.app_context():
+        assert outbox.prune() == 0
+
+
+def test_subscriber_overflow_resets_the_stream():
+    subscriber = outbox.Subscriber(venue_id=1, max_events=2)
+    assert subscriber.wants({'venue_id': 1}) and not subscriber.wants({'venue_id': 2})
+    subscriber.put({'id': 1})
+    assert subscriber.get(0) == [{'id': 1}]
+    for event_id in range(2, 5):
+        subscriber.put({'id': event_id})
+    assert subscriber.get(0) == outbox.RESET
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import add_venue, add_artist
+from jobs import archive_shows
+from models import db, Venue, Artist, Show, ShowArchive
+from views.helpers import past_shows_page, past_shows_count
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, PAST_SHOWS_PER_PAGE=3, PAST_SHOWS_COUNT_MAX=5, SHOW_ARCHIVE_AFTER_DAYS=30)
+
+
+# Seven past shows, two of them on the same day, the three oldest archived
+@pytest.fixture
+def venue_id(app):
+    with app.app_context():
+        venue_id, artist_id = add_venue(), add_artist()
+        now = datetime.utcnow()
+        days = [1, 2, 3, 3, 40, 50, 60]
+        db.session.add_all(Show(venue_id=venue_id, artist_id=artist_id, start_time=now - timedelta(days=day))
+                           for day in days)
+        db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=now + timedelta(days=1)))
+        db.session.commit()
+        assert archive_shows() == 3
+        assert ShowArchive.query.count() == 3
+    return venue_id
+
+
+def page(app, venue_id, **args):
+    with app.test_request_context(query_string=args):
+        shows, newer, older = past_shows_page('venue_id', venue_id, datetime.utcnow(), Artist, 'artist_id')
+        return [show.show_id for show in shows], newer, older
+
+
+def test_pages_walk_the_whole_history_both_ways(app, venue_id):
+    with app.app_context():
+        newest_first = [show.id for show in Show.query.filter(Show.start_time < datetime.utcnow())
+                        .order_by(Show.start_time.desc(), Show.id.desc())]
+        newest_first += [show.id for show in ShowArchive.query.order_by(ShowArchive.start_time.desc())]
+
+    first, newer, older = page(app, venue_id)
+    assert (first, newer) == (newest_first[:3], None)
+    second, newer, older = page(app, venue_id, past_before=older)
+    assert second == newest_first[3:6]
+    last, _, end = page(app, venue_id, past_before=older)
+    assert (last, end) == (newest_first[6:], None)
+
+    back, newer, older = page(app, venue_id, past_after=newer)
+    assert (back, newer) == (newest_first[:3], None)
+
+
+def test_count_is_capped(app, client, venue_id):
+    with app.app_context():
+        assert past_shows_count('venue_id', venue_id, datetime.utcnow(), Artist, 'artist_id') == 6
+    assert b'5+ Past Shows' in client.get(f'/venues/{venue_id}').data
+
+
+def test_shows_of_deleted_artists_are_left_out(app, client, venue_id):
+    with app.app_context():
+        artist_id = add_artist(name='Matt Quevedo')
+        db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=datetime.utcnow() - timedelta(hours=1)))
+        Artist.query.get(artist_id).deleted_at = datetime.utcnow()
+        db.session.commit()
+        assert past_shows_count('venue_id', venue_id, datetime.utcnow(), Artist, 'artist_id') == 6
+    assert b'Matt Quevedo' not in client.get(f'/venues/{venue_id}').data
+
+
+def test_bad_key_is_a_bad_request(client, venue_id):
+    assert client.get(f'/venues/{venue_id}?past_before=yesterday_1').status_code == 400
+    assert client.get(f'/venues/{venue_id}?past_after=2020-01-01T00:00:00_x').status_code == 400
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+import profiler
+from conftest import wait_for
+
+AUTH = {'Authorization': 'Bearer secret'}
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, ADMIN_TOKEN='secret', PROFILER_INTERVAL=0.001)
+
+
+@pytest.fixture
+def app(app, monkeypatch):
+    for name, value in (('active', None), ('seen', None), ('checked_at', 0)):
+        monkeypatch.setattr(profiler, name, value)
+
+    @app.route('/test/slow')
+    def slow():
+        time.sleep(0.05)
+        return 'done'
+    return app
+
+
+def test_admin_token_is_required(app, client):
+    assert client.get('/admin/profiler', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/admin/profiler').status_code == 403
+    assert client.get('/admin/profiler', headers=AUTH).status_code == 200
+    app.config['ADMIN_TOKEN'] = None
+    assert client.get('/admin/profiler', headers=AUTH).status_code == 404
+
+
+def test_bad_starts(client):
+    for data in ({}, {'seconds': 0}, {'seconds': 301}, {'seconds': 1, 'percent': 0},
+                 {'seconds': 1, 'endpoint': 'nowhere'}):
+        assert client.post('/admin/profiler', data=data, headers=AUTH).status_code == 400
+    assert client.delete('/admin/profiler', headers=AUTH).status_code == 404
+
+
+def test_profile_samples_the_requests_and_is_saved(app, client):
+    response = client.post('/admin/profiler', data={'seconds': 5, 'endpoint': 'slow'}, headers=AUTH)
+    assert response.status_code == 202
+    profile_id = response.get_json()['id']
+    assert client.post('/admin/profiler', data={'seconds': 5}, headers=AUTH).status_code == 409
+    for _ in range(3):
+        client.get('/test/slow')
+    client.get('/')
+    running = client.get('/admin/profiler', headers=AUTH).get_json()
+    assert running['running']['id'] == profile_id
+    assert running['worker']['routes']['slow']['requests'] == 3
+
+    assert client.delete('/admin/profiler', headers=AUTH).status_code == 200
+    wait_for(lambda: client.get('/admin/profiler', headers=AUTH).get_json()['profiles'])
+    status = client.get('/admin/profiler', headers=AUTH).get_json()
+    assert status['running'] is None
+    summary = status['profiles'][0]
+    assert list(summary['routes']) == ['slow']
+    assert summary['routes']['slow']['samples'] > 0
+    assert summary['routes']['slow']['python'] == 1
+
+    response = client.get(f"/admin/profiler/{summary['id']}/slow.collapsed", headers=AUTH)
+    assert response.status_code == 200
+    assert b'slow (tests/test_profiler.py' in response.data
+    assert client.get(f"/admin/profiler/{summary['id']}/summary.json", headers=AUTH).status_code == 404
+
+
+# Another worker started the profile: this one follows the control file at its next request
+def test_workers_follow_the_control_file(app, client):
+    control = {'id': 'other', 'started': '', 'seconds': 5, 'ends_at': time.time() + 5, 'endpoint': None, 'rate': 1}
+    profiler.write_control(app.config['PROFILER_DIR'], control)
+    client.get('/')
+    assert profiler.active is not None and profiler.active.control_id == 'other'
+
+    profiler.write_control(app.config['PROFILER_DIR'], dict(control, ends_at=time.time()))
+    profiler.checked_at = 0
+    client.get('/')
+    wait_for(lambda: profiler.active is None)
+    client.get('/')
+    assert profiler.active is None
@@ -0,0 +1,95 @@
+import pytest
+
+import ratelimit
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, RATELIMIT_ENABLED=True, RATELIMIT_CLIENT_RATE=0.01, RATELIMIT_CLIENT_BURST=3,
+                RATELIMIT_GLOBAL_RATE=0.01, RATELIMIT_GLOBAL_BURST=100, RATELIMIT_COSTS={'shows.shows': 2},
+                ADMIN_TOKEN='secret')
+
+
+def get(client, path, address='10.0.0.1', **headers):
+    return client.get(path, headers=headers, environ_base={'REMOTE_ADDR': address})
+
+
+def test_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    backend = ratelimit.LocalBackend(max_keys=10)
+    assert [backend.take('a', 1.0, 2, 1) for _ in range(3)] == [0, 0, 1.0]
+    now[0] += 0.5
+    assert backend.take('a', 1.0, 2, 1) == 0.5
+    now[0] += 10
+    # Refilled up to the burst only
+    assert [backend.take('a', 1.0, 2, 1) for _ in range(3)] == [0, 0, 1.0]
+
+
+def test_least_recent_clients_are_forgotten():
+    backend = ratelimit.LocalBackend(max_keys=2)
+    for key in ('a', 'b', 'c'):
+        backend.take(key, 1.0, 5, 1)
+    assert list(backend.buckets) == ['b', 'c']
+
+
+def test_client_over_its_burst_gets_429(client):
+    assert [get(client, '/').status_code for _ in range(4)] == [200, 200, 200, 429]
+    response = get(client, '/')
+    assert int(response.headers['Retry-After']) >= 1
+    # Another client has a bucket of its own
+    assert get(client, '/', address='10.0.0.2').status_code == 200
+
+
+def test_expensive_endpoints_cost_more(client):
+    assert [get(client, '/shows').status_code for _ in range(2)] == [200, 429]
+    # The rejected request took nothing
+    assert get(client, '/').status_code == 200
+
+
+def test_images_are_not_limited(client):
+    assert {get(client, '/img/venue/1/thumb').status_code for _ in range(5)} == {404}
+
+
+def test_site_wide_bucket_refunds_the_client(app, client):
+    app.config['RATELIMIT_GLOBAL_BURST'] = 1
+    assert get(client, '/').status_code == 200
+    assert get(client, '/').status_code == 429
+    backend = app.extensions['ratelimit']['backend']
+    tokens, updated = backend.buckets['client:10.0.0.1']
+    assert round(tokens) == 2
+
+
+def test_client_address_from_trusted_proxies(app, client):
+    app.config['RATELIMIT_TRUST_PROXY'] = 1
+    for _ in range(3):
+        get(client, '/', address='192.0.2.1', **{'X-Forwarded-For': '1.2.3.4, 10.0.0.9'})
+    # The entry the client wrote itself is ignored, the proxy's is used
+    assert get(client, '/', address='192.0.2.1', **{'X-Forwarded-For': '5.6.7.8, 10.0.0.9'}).status_code == 429
+    assert get(client, '/', address='192.0.2.1', **{'X-Forwarded-For': '10.0.0.8'}).status_code == 200
+
+
+def test_concurrency_limiter_sheds_past_the_queue():
+    limiter = ratelimit.ConcurrencyLimiter(limit=1, max_queue=0)
+    assert limiter.acquire(0) is None
+    assert limiter.acquire(0) == 'queue_full'
+    limiter.max_queue = 1
+    assert limiter.acquire(0.01) == 'timeout'
+    limiter.release()
+    assert limiter.acquire(0) is None
+
+
+def test_metrics_are_for_admins_only(client):
+    assert get(client, '/admin/ratelimit').status_code == 403
+    response = get(client, '/admin/ratelimit', Authorization='Bearer secret')
+    assert response.status_code == 200
+    assert response.get_json()['totals']['allowed.ok'] == 2
+    # Counted against the client like any other request
+    assert get(client, '/admin/ratelimit', Authorization='Bearer secret').status_code == 200
+    assert get(client, '/admin/ratelimit', Authorization='Bearer secret').status_code == 429
+
+
+def test_metrics_dont_exist_without_an_admin_token(app, client):
+    app.config['ADMIN_TOKEN'] = None
+    assert get(client, '/admin/ratelimit').status_code == 404
+    assert get(client, '/api/ratelimit').status_code == 404
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+import recommendations
+from conftest import add_venue, add_artist
+from models import db, Venue, Artist, Recommendation
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, RECOMMENDATIONS_PER_ENTITY=2)
+
+
+# Venues and artists in a few cities and states with overlapping genres
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        venues = [add_venue(name=f'Venue {i}', city=city, state=state, genres=genres) for i, (city, state, genres) in
+                  enumerate([('San Francisco', 'CA', 'Jazz,Folk'), ('Oakland', 'CA', 'Rock n Roll'),
+                             ('New York', 'NY', 'Jazz'), ('San Francisco', 'CA', 'Classical')])]
+        artists = [add_artist(name=f'Artist {i}', city=city, state=state, genres=genres) for i, (city, state, genres)
+                   in enumerate([('San Francisco', 'CA', 'Jazz'), ('Oakland', 'CA', 'Rock n Roll,Folk'),
+                                 ('New York', 'NY', 'Jazz,Folk'), ('Austin', 'TX', 'Country')])]
+        recommendations.refresh_all()
+    return venues, artists
+
+
+def stored():
+    return sorted((row.source, row.source_id, row.rank, row.target_id, round(row.score, 6))
+                  for row in Recommendation.query)
+
+
+def test_best_matches_first(app, catalog):
+    venues, artists = catalog
+    with app.app_context():
+        names = [row.name for row in recommendations.suggestions('venue', venues[0])]
+    # Same city and genre, then a shared genre in another state
+    assert names == ['Artist 0', 'Artist 2']
+
+
+def test_deleted_targets_are_left_out(app, catalog):
+    venues, artists = catalog
+    with app.app_context():
+        # Deleted without the refresh entity_changed would start
+        Artist.query.get(artists[0]).deleted_at = datetime.utcnow()
+        db.session.commit()
+        assert [row.name for row in recommendations.suggestions('venue', venues[0])] == ['Artist 2']
+
+
+def test_incremental_refresh_matches_a_full_one(app, catalog):
+    venues, artists = catalog
+    with app.app_context():
+        venue = Venue.query.get(venues[1])
+        venue.genres, venue.city = 'Jazz,Folk', 'New York'
+        venue.state = 'NY'
+        Artist.query.get(artists[3]).seeking_venue = False
+        db.session.commit()
+        recommendations.refresh('venue', venues[1])
+        recommendations.refresh('artist', artists[3])
+        incremental = stored()
+        recommendations.refresh_all()
+        assert incremental == stored()
+
+
+def test_pages_list_the_suggestions(app, client, catalog):
+    venues, artists = catalog
+    page = client.get(f'/venues/{venues[0]}').data
+    assert b'Artist 0' in page and b'Artist 3' not in page
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import session
+
+import sessions
+from app import create_app
+from models import db, ServerSession
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, SESSION_BACKEND='database', SESSION_SWEEP_PROBABILITY=0)
+
+
+def add_session_routes(app):
+    @app.route('/test/session', methods=['POST'])
+    def set_session():
+        session['visits'] = session.get('visits', 0) + 1
+        return str(session['visits'])
+
+    @app.route('/test/session', methods=['DELETE'])
+    def clear_session():
+        session.clear()
+        return ''
+
+
+def test_workers_share_the_generated_key(tmp_path, config):
+    path = str(tmp_path / 'instance' / 'secret_key')
+    key = sessions.load_or_create_key(path)
+    assert len(key) == 32
+    assert sessions.load_or_create_key(path) == key
+    assert [name for name in (tmp_path / 'instance').iterdir()] == [tmp_path / 'instance' / 'secret_key']
+    app = create_app(dict(config, SECRET_KEY=None, SECRET_KEY_FILE=path, SESSION_BACKEND='cookie'))
+    assert app.secret_key == key
+
+
+def test_cookie_signed_with_a_fallback_key_is_still_accepted(config):
+    old = create_app(dict(config, SECRET_KEY='old', SESSION_BACKEND='cookie'))
+    add_session_routes(old)
+    old_client = old.test_client()
+    old_client.post('/test/session')
+    cookie = next(cookie for cookie in old_client.cookie_jar if cookie.name == 'session').value
+
+    for fallbacks, visits in ((['old'], b'2'), ([], b'1')):
+        app = create_app(dict(config, SECRET_KEY='new', SECRET_KEY_FALLBACKS=fallbacks, SESSION_BACKEND='cookie'))
+        add_session_routes(app)
+        client = app.test_client()
+        client.set_cookie('localhost', 'session', cookie)
+        assert client.post('/test/session').data == visits
+
+
+def test_database_sessions_keep_only_an_id_in_the_cookie(app, client):
+    add_session_routes(app)
+    assert client.post('/test/session').data == b'1'
+    assert client.post('/test/session').data == b'2'
+    cookie = next(cookie for cookie in client.cookie_jar if cookie.name == 'session').value
+    with app.app_context():
+        stored = ServerSession.query.one()
+        assert stored.id in cookie
+        assert b'visits' in stored.data
+
+    client.delete('/test/session')
+    with app.app_context():
+        assert ServerSession.query.count() == 0
+    assert client.post('/test/session').data == b'1'
+
+
+def test_database_sessions_expire(app, client):
+    add_session_routes(app)
+    client.post('/test/session')
+    with app.app_context():
+        ServerSession.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+    assert client.post('/test/session').data == b'1'
+    with app.app_context():
+        assert app.session_interface.store.sweep() == 1
+        assert ServerSession.query.count() == 1
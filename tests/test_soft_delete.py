@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from conftest import add_venue, add_artist, wait_for
+from models import db, Venue, Artist, Show, ShowArchive
+
+
+@pytest.fixture
+def booked(app):
+    with app.app_context():
+        venue_id, artist_id = add_venue(), add_artist()
+        db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=datetime.utcnow() + timedelta(days=3)))
+        db.session.add(ShowArchive(id=1000, venue_id=venue_id, artist_id=artist_id, start_time=datetime(2020, 1, 1)))
+        db.session.commit()
+    return venue_id, artist_id
+
+
+def test_deleted_venue_disappears_and_is_purged(app, client, booked):
+    venue_id, artist_id = booked
+    response = client.delete(f'/venues/{venue_id}')
+    assert response.get_json() == {'success': True}
+
+    assert client.get(f'/venues/{venue_id}').status_code == 404
+    assert b'The Musical Hop' not in client.get('/venues').data
+    # The show is hidden from the artist page before the purge removes it
+    assert b'The Musical Hop' not in client.get(f'/artists/{artist_id}').data
+    with app.app_context():
+        wait_for(lambda: Venue.query.get(venue_id) is None)
+        assert Show.query.count() == ShowArchive.query.count() == 0
+        assert Artist.query.get(artist_id).deleted_at is None
+
+
+def test_purge_in_batches(app, booked):
+    venue_id, artist_id = booked
+    with app.app_context():
+        db.session.add_all(Show(venue_id=venue_id, artist_id=artist_id, start_time=datetime(2031, 1, day))
+                           for day in range(1, 6))
+        Artist.query.get(artist_id).deleted_at = datetime.utcnow()
+        db.session.commit()
+        assert jobs.purge_deleted(batch_size=2) == 7
+        assert Artist.query.get(artist_id) is None
+        assert Venue.query.get(venue_id) is not None
+
+
+@pytest.mark.parametrize('kind', ['venue', 'artist'])
+def test_delete_of_a_missing_entity_is_a_404(app, client, booked, kind):
+    venue_id, artist_id = booked
+    entity_id = venue_id if kind == 'venue' else artist_id
+    assert client.delete(f'/{kind}s/{entity_id + 100}').status_code == 404
+    assert client.delete(f'/{kind}s/abc').status_code == 404
+    assert client.delete(f'/{kind}s/{entity_id}').status_code == 200
+    response = client.delete(f'/{kind}s/{entity_id}')
+    assert response.status_code == 404
+    assert response.get_json() == {'success': False}
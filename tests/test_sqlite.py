@@ -0,0 +1,81 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from conftest import add_venue, add_artist, wait_for
+from models import db, Show
+from sqlite import WriteQueue
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, SQLITE_WRITE_TIMEOUT=0.1)
+
+
+def test_writers_get_their_turn_in_arrival_order():
+    queue = WriteQueue()
+    assert queue.acquire(1)
+    order = []
+
+    def write(name):
+        assert queue.acquire(5)
+        order.append(name)
+        queue.release()
+    threads = []
+    for name in range(3):
+        threads.append(threading.Thread(target=write, args=(name,)))
+        threads[-1].start()
+        wait_for(lambda: len(queue.waiters) == name + 1)
+    queue.release()
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2]
+    assert not queue.busy
+
+
+def test_writer_gives_up_after_the_timeout():
+    queue = WriteQueue()
+    assert queue.acquire(1)
+    assert not queue.acquire(0.01)
+    assert not queue.waiters
+    queue.release()
+    assert queue.acquire(0)
+
+
+def test_write_waiting_too_long_is_a_503(app, client):
+    queue = app.extensions['sqlite_write_queue']
+    assert queue.acquire(1)
+    try:
+        assert client.post('/shows/create', data={'venue_id': 1, 'artist_id': 1}).status_code == 503
+    finally:
+        queue.release()
+
+
+def test_connections_are_set_up(app):
+    with app.app_context():
+        assert db.session.execute('PRAGMA journal_mode').scalar() == 'wal'
+        assert db.session.execute('PRAGMA foreign_keys').scalar() == 1
+        assert db.session.execute("SELECT lower('ÉCLAIR')").scalar() == 'éclair'
+
+
+def test_search_folds_accented_letters(app, client):
+    with app.app_context():
+        add_venue(name='Café Éclair')
+    response = client.post('/venues/search', data={'search_term': 'éclair'})
+    assert 'Café Éclair' in response.get_data(as_text=True)
+
+
+def test_show_ids_are_never_reused(app):
+    with app.app_context():
+        venue_id, artist_id = add_venue(), add_artist()
+        show = Show(venue_id=venue_id, artist_id=artist_id, start_time=datetime(2035, 4, 1))
+        db.session.add(show)
+        db.session.commit()
+        first_id = show.id
+        db.session.delete(show)
+        db.session.commit()
+        show = Show(venue_id=venue_id, artist_id=artist_id, start_time=datetime(2035, 4, 1))
+        db.session.add(show)
+        db.session.commit()
+        assert show.id > first_id
@@ -0,0 +1,13 @@
+# ----------------------------------------------------------------------------#
+# Controllers, one blueprint per section of the site.
+# ----------------------------------------------------------------------------#
+
+from views.main import bp as main_bp
+from views.venues import bp as venues_bp
+from views.artists import bp as artists_bp
+from views.shows import bp as shows_bp
+
+
+def register_blueprints(app):
+    for blueprint in (main_bp, venues_bp, artists_bp, shows_bp):
+        app.register_blueprint(blueprint)
@@ -0,0 +1,212 @@
+import json
+from datetime import datetime
+
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, url_for
+
+import dedup
+import outbox
+import recommendations
+from forms import ArtistForm
+from jobs import start_purge
+from models import db, Venue, Artist, Show
+from signals import entity_changed
+from sqlite import serialized_write
+from views.helpers import ARTIST_FIELDS, past_shows_page, past_shows_count, changed_values, \
+    compare_and_swap, render_conflict
+
+bp = Blueprint('artists', __name__)
+
+
+# Listing all artists
+@bp.route('/artists')
+def artists():
+    return render_template('pages/artists.html', artists=Artist.query.with_entities(Artist.id, Artist.name)
+                           .filter(Artist.deleted_at.is_(None)).order_by('id').all())
+
+
+# Searching artist by his name
+@bp.route('/artists/search', methods=['POST'])
+def search_artists():
+    search_term = request.form.get('search_term', '')
+    artist_search_results = Artist.query.with_entities(Artist.id, Artist.name).filter(Artist.deleted_at.is_(None))\
+        .filter(Artist.name.ilike("%" + search_term + "%")).all()
+    data = []
+    now = datetime.utcnow()
+    for artist in artist_search_results:
+        data.append({
+            'id': artist.id,
+            'name': artist.name,
+            'num_upcoming_shows': db.session.query(Show).join(Venue, Venue.id == Show.venue_id)
+            .filter(Venue.deleted_at.is_(None)).filter(Show.artist_id == artist.id)
+            .filter(Show.start_time > now).count()
+        })
+    response = {
+        'data': data,
+        'count': len(artist_search_results)
+    }
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+
+# Listing information about a specific artist
+@bp.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+    past_shows = []
+    upcoming_shows = []
+    now = datetime.utcnow()
+    artist = Artist.query.filter_by(id=artist_id, deleted_at=None).first_or_404()
+    # Shows with a deleted venue are neither listed nor counted
+    past_shows_query, newer_past_shows, older_past_shows = \
+        past_shows_page('artist_id', artist_id, now, Venue, 'venue_id')
+    past_shows_total = past_shows_count('artist_id', artist_id, now, Venue, 'venue_id')
+    upcoming_shows_query = db.session.query(Venue.id, Venue.name, Venue.image_link, Show.start_time) \
+        .join(Show, Venue.id == Show.venue_id) \
+        .filter(Show.artist_id == artist_id).filter(Show.start_time >= now).filter(Venue.deleted_at.is_(None)).all()
+
+    for past_show in past_shows_query:
+        past_shows.append({
+            'venue_id': past_show.id,
+            'venue_name': past_show.name,
+            'venue_image_link': past_show.image_link,
+            'start_time': past_show.start_time.strftime("%A %B %d %Y %I:%M %p")
+        })
+    for future_show in upcoming_shows_query:
+        upcoming_shows.append({
+            'venue_id': future_show.id,
+            'venue_name': future_show.name,
+            'venue_image_link': future_show.image_link,
+            'start_time': future_show.start_time.strftime("%A %B %d %Y %I:%M %p")
+        })
+
+    data = {
+        "id": artist_id,
+        "name": artist.name,
+        "genres": artist.genres.split(','),
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "image_link": artist.image_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "upcoming_shows": upcoming_shows,
+        "past_shows": past_shows,
+        "upcoming_shows_count": len(upcoming_shows),
+        "past_shows_count": min(past_shows_total, current_app.config['PAST_SHOWS_COUNT_MAX']),
+        "past_shows_count_capped": past_shows_total > current_app.config['PAST_SHOWS_COUNT_MAX'],
+        "newer_past_shows": newer_past_shows,
+        "older_past_shows": older_past_shows,
+        "suggested_venues": recommendations.suggestions('artist', artist_id) if artist.seeking_venue else []
+    }
+
+    return render_template('pages/show_artist.html', artist=data)
+
+
+# Deleting a specific artist. Same as for venues, the shows of the artist are purged in the background
+@bp.route('/artists/<int:artist_id>', methods=['DELETE'])
+@serialized_write
+def delete_artist(artist_id):
+    artist = Artist.query.filter_by(id=artist_id, deleted_at=None).first()
+    if artist is None:
+        return jsonify({'success': False}), 404
+    error = False
+    name = artist.name
+    try:
+        artist.deleted_at = datetime.utcnow()
+        outbox.add('artist.deleted', artist_id=artist.id)
+        db.session.commit()
+        flash(f'Artist {name} was successfully deleted.')
+    except Exception:
+        current_app.logger.exception('Could not delete artist %s', artist_id)
+        db.session.rollback()
+        flash(f'An error occurred. Artist {name} could not be deleted.')
+        error = True
+    finally:
+        db.session.close()
+    if not error:
+        start_purge()
+        entity_changed.send(current_app._get_current_object(), kind='artist', entity_id=artist_id, fields=None)
+    return jsonify({'success': not error})
+
+
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    form = ArtistForm()
+    artist = Artist.query.filter_by(id=artist_id, deleted_at=None).first_or_404()
+    form.name.data = artist.name
+    form.city.data = artist.city
+    form.state.data = artist.state
+    form.phone.data = artist.phone
+    form.image_link.data = artist.image_link
+    form.facebook_link.data = artist.facebook_link
+    form.website.data = artist.website
+    form.genres.data = artist.genres
+    form.seeking_venue.data = artist.seeking_venue
+    form.seeking_description.data = artist.seeking_description
+    form.version.data = artist.version
+    form.original.data = json.dumps({field: getattr(artist, field) for field in ARTIST_FIELDS})
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+
+# Updating information about a specific artist
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@serialized_write
+def edit_artist_submission(artist_id):
+    changed = set()
+    try:
+        changed = compare_and_swap(Artist, artist_id, changed_values(ARTIST_FIELDS, 'seeking_venue'))
+        if changed:
+            entity_changed.send(current_app._get_current_object(), kind='artist', entity_id=artist_id, fields=changed)
+        if changed is not None:
+            flash('Artist ' + request.form['name'] + ' was successfully updated!')
+    except Exception:
+        current_app.logger.exception('Could not update artist %s', artist_id)
+        db.session.rollback()
+        flash('Artist ' + request.form['name'] + ' cannot be updated!')
+    finally:
+        db.session.close()
+    if changed is None:
+        return render_conflict('artist', artist_id)
+    return redirect(url_for('artists.show_artist', artist_id=artist_id))
+
+
+@bp.route('/artists/create', methods=['GET'])
+def create_artist_form():
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+
+# Creating a new artist
+@bp.route('/artists/create', methods=['POST'])
+@serialized_write
+def create_artist_submission():
+    name = request.form['name']
+    city = request.form['city']
+    state = request.form['state']
+    phone = request.form['phone']
+    image_link = request.form['image_link']
+    facebook_link = request.form['facebook_link']
+    website = request.form['website']
+    genres = ",".join(request.form.getlist('genres'))
+    seeking_venue = True if request.form.get('seeking_venue') == 'y' else False
+    seeking_description = request.form['seeking_description'] if seeking_venue == True else None
+    try:
+        new_artist = Artist(name=name, city=city, state=state, phone=phone, image_link=image_link,
+                            facebook_link=facebook_link, website=website, genres=genres, seeking_venue=seeking_venue,
+                            seeking_description=seeking_description
+                            )
+        duplicates = dedup.find_duplicates('artist', new_artist)
+        db.session.add(new_artist)
+        db.session.commit()
+        dedup.record_new('artist', new_artist.id, duplicates)
+        entity_changed.send(current_app._get_current_object(), kind='artist', entity_id=new_artist.id, fields=None)
+        flash('Artist ' + name + ' was successfully listed!')
+        if duplicates:
+            flash('It may have been listed before, it was flagged for review.')
+    except Exception:
+        current_app.logger.exception('Could not create artist %r', name)
+        db.session.rollback()
+        flash('Artist ' + name + ' cannot be added!')
+    finally:
+        db.session.close()
+    return redirect(url_for('artists.artists'))
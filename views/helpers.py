@@ -0,0 +1,132 @@
+# ----------------------------------------------------------------------------#
+# Queries and form handling shared by the venue and artist pages.
+# ----------------------------------------------------------------------------#
+
+import json
+from datetime import datetime
+
+from flask import abort, current_app, render_template, request
+
+import outbox
+from models import db, Venue, Artist, Show, ShowArchive, phone_digits
+
+
+def past_shows_of(model, fk_name, entity_id, before, after):
+    query = db.session.query(model.id.label('id'), model.venue_id.label('venue_id'),
+                             model.artist_id.label('artist_id'), model.start_time.label('start_time'))\
+        .filter(getattr(model, fk_name) == entity_id)
+    if before is not None:
+        query = query.filter(db.tuple_(model.start_time, model.id) < before)
+    if after is not None:
+        query = query.filter(db.tuple_(model.start_time, model.id) > after)
+    return query
+
+
+# Past shows of a venue or an artist: the ones not archived yet from Show and everything from ShowArchive. `before` and
+# `after` are (start_time, id) keys, applied to both tables so that each one is read from its index
+def past_shows_subquery(fk_name, entity_id, now, before=None, after=None):
+    recent = past_shows_of(Show, fk_name, entity_id, before, after).filter(Show.start_time < now)
+    archived = past_shows_of(ShowArchive, fk_name, entity_id, before, after)
+    return recent.union_all(archived).subquery()
+
+
+def show_key(show):
+    return f'{show.start_time.isoformat()}_{show.show_id}'
+
+
+# The past_before or past_after key of the request, set by the pager links
+def past_shows_key():
+    for direction in ('before', 'after'):
+        value = request.args.get(f'past_{direction}')
+        if value:
+            start_time, _, show_id = value.rpartition('_')
+            try:
+                return direction, (datetime.fromisoformat(start_time), int(show_id))
+            except ValueError:
+                abort(400)
+    return None, None
+
+
+# A page of past shows, newest first, listing `other` (the artist on a venue page, the venue on an artist page), and
+# the keys of the newer and older pages, None at either end. Pages are found from the key of their neighbour instead
+# of an offset, so that a page deep in a long history costs the same as the first one
+def past_shows_page(fk_name, entity_id, now, other, other_fk_name):
+    per_page = current_app.config['PAST_SHOWS_PER_PAGE']
+    direction, key = past_shows_key()
+    past = past_shows_subquery(fk_name, entity_id, now, **({direction: key} if key else {}))
+    query = db.session.query(other.id, other.name, other.image_link, past.c.start_time, past.c.id.label('show_id'))\
+        .join(past, other.id == past.c[other_fk_name]).filter(other.deleted_at.is_(None))
+    if direction == 'after':
+        shows = query.order_by(past.c.start_time, past.c.id).limit(per_page + 1).all()
+        newer = len(shows) > per_page
+        shows = shows[:per_page][::-1]
+        older = bool(shows)
+    else:
+        shows = query.order_by(past.c.start_time.desc(), past.c.id.desc()).limit(per_page + 1).all()
+        older = len(shows) > per_page
+        shows = shows[:per_page]
+        newer = key is not None and bool(shows)
+    return shows, show_key(shows[0]) if newer else None, show_key(shows[-1]) if older else None
+
+
+# Number of past shows, only counted up to PAST_SHOWS_COUNT_MAX: pages show "1000+" rather than read a long history
+def past_shows_count(fk_name, entity_id, now, other, other_fk_name):
+    past = past_shows_subquery(fk_name, entity_id, now)
+    counted = db.session.query(past.c.id).join(other, other.id == past.c[other_fk_name])\
+        .filter(other.deleted_at.is_(None)).limit(current_app.config['PAST_SHOWS_COUNT_MAX'] + 1).subquery()
+    return db.session.query(db.func.count()).select_from(counted).scalar()
+
+
+VENUE_FIELDS = ('name', 'address', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website', 'genres',
+                'seeking_talent', 'seeking_description')
+ARTIST_FIELDS = ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website', 'genres',
+                 'seeking_venue', 'seeking_description')
+
+
+# Values of an edit form submission, in the same shape as the columns they are written to
+def submitted_values(fields, seeking_field):
+    values = {field: request.form.get(field, '') for field in fields}
+    values['genres'] = ",".join(request.form.getlist('genres'))
+    values[seeking_field] = request.form.get(seeking_field) == 'y'
+    values['seeking_description'] = values['seeking_description'] if values[seeking_field] else None
+    return values
+
+
+# The edit forms carry the values they were rendered with and the version of the row, so that a submission can be
+# turned into a single compare-and-swap UPDATE of the fields that were actually changed. Empty strings and NULLs
+# are considered equal
+def changed_values(fields, seeking_field):
+    values = submitted_values(fields, seeking_field)
+    try:
+        original = json.loads(request.form.get('original', ''))
+    except ValueError:
+        original = {}
+    return {field: value for field, value in values.items() if (original.get(field) or None) != (value or None)}
+
+
+# Updates the changed fields of a venue or an artist, and phone_digits with the phone, if nobody else updated it since
+# the form was rendered. The change is published to the outbox in the same transaction. Returns the set of changed
+# fields, or None on a version conflict
+def compare_and_swap(model, entity_id, changes):
+    version = request.form.get('version', type=int)
+    if not changes:
+        return set()
+    values = dict(changes, version=model.version + 1)
+    if 'phone' in changes:
+        values['phone_digits'] = phone_digits(changes['phone'])
+    updated = model.query.filter_by(id=entity_id, version=version, deleted_at=None)\
+        .update(values, synchronize_session=False)
+    if updated:
+        entity = {'venue_id': entity_id} if model is Venue else {'artist_id': entity_id}
+        outbox.add(f'{model.__tablename__.lower()}.updated', fields=changes, **entity)
+    db.session.commit()
+    if not updated:
+        return None
+    return set(changes)
+
+
+def render_conflict(kind, entity_id):
+    model = Venue if kind == 'venue' else Artist
+    if not model.query.filter_by(id=entity_id, deleted_at=None).count():
+        abort(404)
+    return render_template('errors/409.html', kind=kind, entity_id=entity_id), 409
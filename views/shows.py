@@ -0,0 +1,69 @@
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
+
+import outbox
+from forms import ShowForm
+from models import db, Venue, Artist, Show
+from signals import entity_changed
+from sqlite import serialized_write
+
+bp = Blueprint('shows', __name__)
+
+
+# Listing all shows
+@bp.route('/shows')
+def shows():
+    data = []
+    shows = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Venue.name.label("venue_name"), Artist.name.label("artist_name"), Artist.image_link.label("artist_image_link"))\
+        .join(Artist, Artist.id == Show.artist_id).join(Venue, Venue.id == Show.venue_id)\
+        .filter(Artist.deleted_at.is_(None)).filter(Venue.deleted_at.is_(None)).all()
+    for show in shows:
+        data.append({
+            "venue_id": show.venue_id,
+            "venue_name": show.venue_name,
+            "artist_id": show.artist_id,
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link,
+            "start_time": show.start_time.strftime("%A %B %d %Y %I:%M %p")
+        })
+    return render_template('pages/shows.html', shows=data)
+
+
+# Renders create show form
+@bp.route('/shows/create')
+def create_shows():
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+
+# Creating a new show
+@bp.route('/shows/create', methods=['POST'])
+@serialized_write
+def create_show_submission():
+    venue_id = request.form['venue_id']
+    artist_id = request.form['artist_id']
+    # Parsed by the form rather than left to the database, SQLite doesn't convert strings to timestamps
+    start_time = ShowForm().start_time.data
+    venue = Venue.query.filter_by(id=venue_id, deleted_at=None).first()
+    artist = Artist.query.filter_by(id=artist_id, deleted_at=None).first()
+    if venue and artist:
+        try:
+            new_show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time)
+            db.session.add(new_show)
+            db.session.flush()
+            outbox.add('show.created', venue_id=venue.id, show_id=new_show.id, artist_id=artist.id,
+                       venue_name=venue.name, artist_name=artist.name, artist_image_link=artist.image_link,
+                       start_time=start_time)
+            db.session.commit()
+            app = current_app._get_current_object()
+            entity_changed.send(app, kind='venue', entity_id=int(venue_id), fields={'shows'})
+            entity_changed.send(app, kind='artist', entity_id=int(artist_id), fields={'shows'})
+            flash('Your show was successfully listed!')
+        except Exception:
+            current_app.logger.exception('Could not create show of artist %s at venue %s', artist_id, venue_id)
+            db.session.rollback()
+            flash('Your show cannot be added. Please try again')
+        finally:
+            db.session.close()
+    else:
+        flash("The Artist or Venue with a given ID doesn't exist. Please check the ID and create a show again")
+    return redirect(url_for('shows.shows'))
@@ -0,0 +1,224 @@
+import json
+from datetime import datetime
+
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, url_for
+
+import dedup
+import outbox
+import recommendations
+from forms import VenueForm
+from jobs import start_purge
+from models import db, Venue, Artist, Show
+from signals import entity_changed
+from sqlite import serialized_write
+from views.helpers import VENUE_FIELDS, past_shows_page, past_shows_count, changed_values, \
+    compare_and_swap, render_conflict
+
+bp = Blueprint('venues', __name__)
+
+
+# Listing all venues
+@bp.route('/venues')
+def venues():
+    all_areas = Venue.query.with_entities(Venue.city, Venue.state).filter(Venue.deleted_at.is_(None))\
+        .group_by(Venue.city, Venue.state).all()
+    data = []
+    today = datetime.utcnow()
+    for area in all_areas:
+        area_venues = Venue.query.filter_by(state=area.state).filter_by(city=area.city).filter_by(deleted_at=None).all()
+        venue_data = []
+        for venue in area_venues:
+            venue_data.append({
+                "id": venue.id,
+                "name": venue.name,
+                "num_upcoming_shows": db.session.query(Show).join(Artist, Artist.id == Show.artist_id)
+                .filter(Artist.deleted_at.is_(None)).filter(Show.venue_id == venue.id)
+                .filter(Show.start_time > today).count()
+            })
+        data.append({
+            "city": area.city,
+            "state": area.state,
+            "venues": venue_data
+        })
+    return render_template('pages/venues.html', areas=data)
+
+
+# Search for a venue by its name with partial string search (case-insensitive)
+@bp.route('/venues/search', methods=['POST'])
+def search_venues():
+    search_term = request.form.get('search_term', '')
+    venue_search_results = Venue.query.with_entities(Venue.id, Venue.name).filter(Venue.deleted_at.is_(None))\
+        .filter(Venue.name.ilike("%" + search_term + "%")).all()
+    response = {'data': venue_search_results, 'count': len(venue_search_results)}
+    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+
+# Listing a specific venue information
+@bp.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+    past_shows = []
+    upcoming_shows = []
+    now = datetime.utcnow()
+    venue = Venue.query.filter_by(id=venue_id, deleted_at=None).first_or_404()
+    # Shows with a deleted artist are neither listed nor counted
+    past_shows_query, newer_past_shows, older_past_shows = \
+        past_shows_page('venue_id', venue_id, now, Artist, 'artist_id')
+    past_shows_total = past_shows_count('venue_id', venue_id, now, Artist, 'artist_id')
+    upcoming_shows_query = db.session.query(Artist.id, Artist.name, Artist.image_link, Show.start_time) \
+        .join(Show, Artist.id == Show.artist_id) \
+        .filter(Show.venue_id == venue_id).filter(Show.start_time >= now).filter(Artist.deleted_at.is_(None)).all()
+
+    for past_show in past_shows_query:
+        past_shows.append({
+            'artist_id': past_show.id,
+            'artist_name': past_show.name,
+            'artist_image_link': past_show.image_link,
+            'start_time': past_show.start_time.strftime("%A %B %d %Y %I:%M %p")
+        })
+    for future_show in upcoming_shows_query:
+        upcoming_shows.append({
+            'artist_id': future_show.id,
+            'artist_name': future_show.name,
+            'artist_image_link': future_show.image_link,
+            'start_time': future_show.start_time.strftime("%A %B %d %Y %I:%M %p")
+        })
+
+    data = {
+        "id": venue_id,
+        "name": venue.name,
+        "genres": venue.genres.split(','),
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "image_link": venue.image_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "upcoming_shows": upcoming_shows,
+        "past_shows": past_shows,
+        "upcoming_shows_count": len(upcoming_shows),
+        "past_shows_count": min(past_shows_total, current_app.config['PAST_SHOWS_COUNT_MAX']),
+        "past_shows_count_capped": past_shows_total > current_app.config['PAST_SHOWS_COUNT_MAX'],
+        "newer_past_shows": newer_past_shows,
+        "older_past_shows": older_past_shows,
+        "suggested_artists": recommendations.suggestions('venue', venue_id) if venue.seeking_talent else []
+    }
+
+    return render_template('pages/show_venue.html', venue=data)
+
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/create', methods=['GET'])
+def create_venue_form():
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+
+# Creating a new venue
+@bp.route('/venues/create', methods=['POST'])
+@serialized_write
+def create_venue_submission():
+    name = request.form['name']
+    address = request.form['address']
+    city = request.form['city']
+    state = request.form['state']
+    phone = request.form['phone']
+    image_link = request.form['image_link']
+    facebook_link = request.form['facebook_link']
+    website = request.form['website']
+    genres = ",".join(request.form.getlist('genres'))
+    seeking_talent = True if request.form.get('seeking_talent') == 'y' else False
+    seeking_description = request.form['seeking_description'] if seeking_talent == True else None
+    try:
+        new_venue = Venue(name=name, address=address, city=city, state=state, phone=phone, image_link=image_link,
+                          facebook_link=facebook_link, website=website, genres=genres, seeking_talent=seeking_talent,
+                          seeking_description=seeking_description
+                          )
+        duplicates = dedup.find_duplicates('venue', new_venue)
+        db.session.add(new_venue)
+        db.session.commit()
+        dedup.record_new('venue', new_venue.id, duplicates)
+        entity_changed.send(current_app._get_current_object(), kind='venue', entity_id=new_venue.id, fields=None)
+        flash('Venue ' + request.form['name'] + ' was successfully listed!')
+        if duplicates:
+            flash('It may have been listed before, it was flagged for review.')
+    except Exception:
+        current_app.logger.exception('Could not create venue %r', request.form['name'])
+        db.session.rollback()
+        flash('Venue ' + request.form['name'] + ' cannot be added!')
+    finally:
+        db.session.close()
+    return redirect(url_for('venues.venues'))
+
+
+# Deleting a specific venue. The venue is only marked as deleted here, its shows are purged in the background
+@bp.route('/venues/<int:venue_id>', methods=['DELETE'])
+@serialized_write
+def delete_venue(venue_id):
+    venue = Venue.query.filter_by(id=venue_id, deleted_at=None).first()
+    if venue is None:
+        return jsonify({'success': False}), 404
+    error = False
+    name = venue.name
+    try:
+        venue.deleted_at = datetime.utcnow()
+        outbox.add('venue.deleted', venue_id=venue.id)
+        db.session.commit()
+        flash(f'Venue {name} was successfully deleted.')
+    except Exception:
+        current_app.logger.exception('Could not delete venue %s', venue_id)
+        db.session.rollback()
+        flash(f'An error occurred. Venue {name} could not be deleted.')
+        error = True
+    finally:
+        db.session.close()
+    if not error:
+        start_purge()
+        entity_changed.send(current_app._get_current_object(), kind='venue', entity_id=venue_id, fields=None)
+    return jsonify({'success': not error})
+
+
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+    form = VenueForm()
+    venue = Venue.query.filter_by(id=venue_id, deleted_at=None).first_or_404()
+    form.name.data = venue.name
+    form.address.data = venue.address
+    form.city.data = venue.city
+    form.state.data = venue.state
+    form.phone.data = venue.phone
+    form.genres.data = venue.genres
+    form.image_link.data = venue.image_link
+    form.facebook_link.data = venue.facebook_link
+    form.website.data = venue.website
+    form.seeking_talent.data = venue.seeking_talent
+    form.seeking_description.data = venue.seeking_description
+    form.version.data = venue.version
+    form.original.data = json.dumps({field: getattr(venue, field) for field in VENUE_FIELDS})
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+
+# Updating information about a specific venue
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@serialized_write
+def edit_venue_submission(venue_id):
+    changed = set()
+    try:
+        changed = compare_and_swap(Venue, venue_id, changed_values(VENUE_FIELDS, 'seeking_talent'))
+        if changed:
+            entity_changed.send(current_app._get_current_object(), kind='venue', entity_id=venue_id, fields=changed)
+        if changed is not None:
+            flash('Venue ' + request.form['name'] + ' was successfully updated!')
+    except Exception:
+        current_app.logger.exception('Could not update venue %s', venue_id)
+        db.session.rollback()
+        flash('Venue ' + request.form['name'] + ' cannot be updated!')
+    finally:
+        db.session.close()
+    if changed is None:
+        return render_conflict('venue', venue_id)
+    return redirect(url_for('venues.show_venue', venue_id=venue_id))